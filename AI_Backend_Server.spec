@@ -2,11 +2,11 @@
 
 
 a = Analysis(
-    ['wps_addin\\backend_server.py'],
+    ['wps_addin\\run_backend.py'],
     pathex=[],
     binaries=[],
     datas=[('.\\.env', '.'), ('.\\app', 'app')],
-    hiddenimports=['uvicorn.logging', 'uvicorn.loops', 'uvicorn.protocols', 'uvicorn.lifespan'],
+    hiddenimports=['uvicorn.logging', 'uvicorn.loops', 'uvicorn.protocols', 'uvicorn.lifespan', 'wps_addin.backend_server'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
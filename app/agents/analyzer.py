@@ -7,20 +7,25 @@ import json
 import re
 import argparse
 import os
-from typing import Any, Dict, Optional, List
+import shutil
+import tempfile
+from concurrent.futures import Executor
+from typing import Any, Callable, Dict, Optional, List
 import pandas as pd
 import numpy as np
 import scipy.stats as stats # For p-values, etc.
 import matplotlib.pyplot as plt
 import seaborn as sns
 from pydantic import BaseModel, Field
-from docx import Document
 from docx.shared import Inches, Pt
 from docx.enum.text import WD_ALIGN_PARAGRAPH
-from docx.enum.section import WD_ORIENT
 from docx.oxml.ns import qn # For font setting
 
 from app.agents.llm_client import LLMClient 
+from app.agents.docx_factory import new_document
+from app.agents.markdown_docx import render_markdown, add_code_block
+from app.agents.json_stream import StreamingModelParser
+from app.agents.tracing import set_attributes, span, traced
 
 # Pydantic Schemas for Structured Output 
 class CorrelationResult(BaseModel):
@@ -376,18 +381,6 @@ def _generate_plots(df: pd.DataFrame, output_dir: str) -> List[str]:
 
     return plot_paths
 
-def _clean_json_response(text: str) -> str:
-    """Helper to strip markdown backticks or other text from a JSON string."""
-    match = re.search(r'```(?:json)?\s*({.*})\s*```', text, re.DOTALL)
-    if match:
-        return match.group(1).strip()
-    
-    match = re.search(r'({.*})', text.strip(), re.DOTALL)
-    if match:
-        return match.group(1).strip()
-
-    return text.strip() 
-
 def _create_analysis_report_docx(
     df: pd.DataFrame, # Original DataFrame for context
     analysis_output: AnalysisOutput, 
@@ -398,19 +391,8 @@ def _create_analysis_report_docx(
     Creates a Word document (.docx) containing the analysis report.
     Embeds LLM insights, statistical findings, and generated plots.
     """
-    document = Document()
-
-    # Set default font and size
-    style = document.styles['Normal']
-    font = style.font
-    font.name = 'Calibri'
-    font.size = Pt(12)
-    # Set page orientation to landscape for wider plots if preferred
-    section = document.sections[0]
-    new_width, new_height = section.page_height, section.page_width
-    section.page_width = new_width
-    section.page_height = new_height
-    section.orientation = WD_ORIENT.LANDSCAPE
+    # Calibri 12pt, landscape for wider plots
+    document = new_document(font_size=12, landscape=True)
 
     # Title Page 
     document.add_heading('Data Analysis Report', level=0)
@@ -420,13 +402,12 @@ def _create_analysis_report_docx(
 
     # Executive Summary 
     document.add_heading('1. Executive Summary', level=1)
-    document.add_paragraph(analysis_output.summary)
+    render_markdown(document, analysis_output.summary)
     document.add_page_break()
 
     # Key Insights 
     document.add_heading('2. Key Insights', level=1)
-    for i, insight in enumerate(analysis_output.insights, 1):
-        document.add_paragraph(f'• {insight}')
+    render_markdown(document, "\n".join(f"- {insight}" for insight in analysis_output.insights))
     document.add_page_break()
 
     # Statistical Findings 
@@ -552,8 +533,7 @@ def _create_analysis_report_docx(
     # Risk Flags
     document.add_heading('6. Risk Flags', level=1)
     if analysis_output.risk_flags:
-        for i, flag in enumerate(analysis_output.risk_flags, 1):
-            document.add_paragraph(f'• {flag}')
+        render_markdown(document, "\n".join(f"- {flag}" for flag in analysis_output.risk_flags))
     else:
         document.add_paragraph("No specific risk flags identified by the AI.")
     document.add_page_break()
@@ -562,16 +542,16 @@ def _create_analysis_report_docx(
     document.add_heading('7. Pandas Code Snippet', level=1)
     if analysis_output.pandas_code_snippet:
         document.add_paragraph("Here's a relevant Python Pandas code snippet:")
-        code_paragraph = document.add_paragraph()
-        code_paragraph.add_run(analysis_output.pandas_code_snippet)
-        # You might want to apply a specific style for code if defined in your docx template
-        code_paragraph.style = 'Intense Quote' # A built-in style that can look like code
+        # Strip any Markdown fence the AI wrapped around the snippet
+        snippet = re.sub(r'^\s*```\w*\s*\n|\n?\s*```\s*$', '', analysis_output.pandas_code_snippet)
+        add_code_block(document, snippet)
     else:
         document.add_paragraph("No specific Pandas code snippet provided.")
     document.add_page_break()
 
     try:
-        document.save(output_filepath)
+        with span("docx.save"):
+            document.save(output_filepath)
         print(f"Analysis report saved to: {output_filepath}")
         return output_filepath
     except Exception as e:
@@ -580,65 +560,123 @@ def _create_analysis_report_docx(
 
 
 # Main Agent Class 
+class PreparedAnalysis(BaseModel):
+    """Output of the local (CPU-bound) analysis stage, passed on to the LLM and report stages."""
+    rows: int
+    columns: int
+    data_summary: Dict[str, Any]
+    statistical_results: StatisticalSummary
+    plot_image_paths: List[str]
+
+
+def prepare_analysis(raw_input: str, plot_dir: str) -> PreparedAnalysis:
+    """
+    CPU stage 1: parses the table, runs the statistics, draws the plots into `plot_dir` and
+    summarizes the data for the prompt. A top-level function, so it can run in a worker process.
+    """
+    with span("analyze.parse", input_chars=len(raw_input)):
+        df = try_parse_csv_or_table(raw_input)
+        if df is None:
+            raise ValueError("Input could not be parsed as a valid CSV or table.")
+
+    # Perform Statistical Analysis
+    with span("analyze.stats"):
+        statistical_results = _perform_statistical_analysis(df)
+
+    # Generate Plots
+    with span("analyze.plots"):
+        plot_image_paths = _generate_plots(df, plot_dir)
+
+    with span("analyze.summary"):
+        data_summary = get_local_data_summary(df)
+
+    return PreparedAnalysis(
+        rows=int(df.shape[0]),
+        columns=int(df.shape[1]),
+        data_summary=data_summary,
+        statistical_results=statistical_results,
+        plot_image_paths=plot_image_paths,
+    )
+
+
+def render_analysis_report(analysis_output: AnalysisOutput, output_filepath: str, plot_dir: str) -> str:
+    """CPU stage 2: writes the Word report and removes the plot images. Can run in a worker process."""
+    with span("analyze.docx"):
+        generated_report_path = _create_analysis_report_docx(None, analysis_output, output_filepath, plot_dir)
+
+    # Clean up temporary plot images
+    with span("analyze.cleanup"):
+        shutil.rmtree(plot_dir, ignore_errors=True)
+    return generated_report_path
+
+
 class StructuredDataAgent:
-    def __init__(self, llm_client: LLMClient):
+    def __init__(self, llm_client: LLMClient, cpu_executor: Optional[Executor] = None):
         """
         Initializes the agent with a pre-configured LLMClient.
 
         Args:
             llm_client (LLMClient): An instance of the LLMClient.
+            cpu_executor (Optional[Executor]): Runs the pandas/scipy/plotting and docx stages,
+                e.g. a process pool, so they do not hold this process's GIL. None runs them inline.
         """
         self.llm_client = llm_client
+        self.cpu_executor = cpu_executor
         # Directory to save plots temporarily
         self.temp_plot_dir = "temp_plots"
         os.makedirs(self.temp_plot_dir, exist_ok=True)
         print(f"Initialized StructuredDataAgent using provider: {self.llm_client.provider}, model: {self.llm_client.model}")
 
 
+    def _run_cpu_stage(self, name: str, func: Callable, *args):
+        """Runs a CPU-bound stage inline or on the cpu_executor (in a span covering the hand-off)."""
+        if self.cpu_executor is None:
+            return func(*args)
+        with span(f"analyze.{name}", executor=type(self.cpu_executor).__name__):
+            return self.cpu_executor.submit(func, *args).result()
+
+    @traced("analyze.input")
     def analyze_input(self, raw_input: str, user_question: str = "") -> str: # Now returns path to docx
         """Main entry point for analyzing tabular data, generating visualizations, and creating a report."""
-        df = try_parse_csv_or_table(raw_input)
-        if df is None:
-            raise ValueError("Input could not be parsed as a valid CSV or table.")
-        
-        # Perform Statistical Analysis
-        statistical_results = _perform_statistical_analysis(df)
-        
-        # Generate Plots
-        plot_image_paths = _generate_plots(df, self.temp_plot_dir)
+        # Each run draws into its own folder, so concurrent analyses cannot overwrite each other's plots
+        os.makedirs(self.temp_plot_dir, exist_ok=True)
+        plot_dir = tempfile.mkdtemp(prefix="analysis_", dir=os.path.abspath(self.temp_plot_dir))
+        try:
+            prepared = self._run_cpu_stage("prepare", prepare_analysis, raw_input, plot_dir)
+        except Exception:
+            shutil.rmtree(plot_dir, ignore_errors=True)
+            raise
+        set_attributes(rows=prepared.rows, columns=prepared.columns, plots=len(prepared.plot_image_paths))
+        statistical_results = prepared.statistical_results
 
         # Build Prompt for LLM with all available information
-        data_summary = get_local_data_summary(df)
-        prompt = self._build_llm_analysis_prompt(data_summary, statistical_results, user_question)
+        with span("analyze.prompt"):
+            prompt = self._build_llm_analysis_prompt(prepared.data_summary, statistical_results, user_question)
 
         # Get LLM's structured analysis (summary, insights, etc.)
-        llm_raw_response_for_analysis = self.llm_client.generate_response(prompt=prompt, json_mode=True) 
-        cleaned_response_for_analysis = _clean_json_response(llm_raw_response_for_analysis)
-        
+        # The response is parsed while it streams, so a malformed field fails fast
+        parser = StreamingModelParser(AnalysisOutput)
         try:
-            parsed_analysis_json = json.loads(cleaned_response_for_analysis)
-            # Ensure the statistical_results part is included for Pydantic validation
-            parsed_analysis_json['statistical_results'] = statistical_results.dict()
-            parsed_analysis_json['plot_image_paths'] = plot_image_paths # Also explicitly ensure paths are there
-
-            llm_analysis_output = AnalysisOutput.model_validate(parsed_analysis_json)
-        except (json.JSONDecodeError, TypeError) as e:
+            with span("analyze.llm"):
+                llm_analysis_output = parser.consume(self.llm_client.stream_response(prompt=prompt, json_mode=True))
+            # Attach the locally computed statistics and plot paths for the report
+            llm_analysis_output = llm_analysis_output.model_copy(update={
+                'statistical_results': statistical_results,
+                'plot_image_paths': prepared.plot_image_paths,
+            })
+        except ValueError as e:
+            shutil.rmtree(plot_dir, ignore_errors=True)
             print(f"Error parsing LLM analysis response: {e}")
-            print(f"Raw LLM response: {cleaned_response_for_analysis}")
+            print(f"Raw LLM response: {parser.raw_text}")
             raise RuntimeError(f"Failed to get structured analysis from LLM: {e}")
+        except Exception:
+            shutil.rmtree(plot_dir, ignore_errors=True)
+            raise
 
-        # 5. Create Word Document Report
-        output_filepath = os.path.join(os.getcwd(), f"Analysis_Report_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}.docx")
-        generated_report_path = _create_analysis_report_docx(df, llm_analysis_output, output_filepath, self.temp_plot_dir)
-
-        # Clean up temporary plot images
-        for p in plot_image_paths:
-            if os.path.exists(p):
-                os.remove(p)
-        if os.path.exists(self.temp_plot_dir) and not os.listdir(self.temp_plot_dir):
-            os.rmdir(self.temp_plot_dir)
-
-        return generated_report_path
+        # 5. Create Word Document Report (the plot folder is removed afterwards)
+        # The folder name keeps concurrent reports created in the same second apart
+        output_filepath = os.path.join(os.getcwd(), f"Analysis_Report_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}_{os.path.basename(plot_dir)[-8:]}.docx")
+        return self._run_cpu_stage("render", render_analysis_report, llm_analysis_output, output_filepath, plot_dir)
 
     def _build_llm_analysis_prompt(self, data_summary: Dict[str, Any], statistical_results: StatisticalSummary, user_question: str = "") -> str:
         """
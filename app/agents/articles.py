@@ -1,14 +1,15 @@
 import os
 import re
-import json
 from typing import Optional
 from datetime import datetime
 from pydantic import BaseModel, Field
 # Imports for creating .docx files
-from docx import Document
-from docx.shared import Pt
 
 from app.agents.llm_client import LLMClient
+from app.agents.docx_factory import new_document
+from app.agents.markdown_docx import render_markdown
+from app.agents.json_stream import OrderedFieldDispatcher, StreamingModelParser
+from app.agents.tracing import span, traced
 
 # Pydantic Model 
 class ArticleOutput(BaseModel):
@@ -17,13 +18,6 @@ class ArticleOutput(BaseModel):
     content: str = Field(..., description="The full, well-structured content of the article, formatted with paragraphs.")
 
 # Helper Functions 
-def _clean_json_response(text: str) -> str:
-    """Helper to strip markdown backticks or other text from a JSON string."""
-    match = re.search(r'```(?:json)?\s*({.*})\s*```', text, re.DOTALL)
-    if match:
-        return match.group(1).strip()
-    return text.strip()
-
 def build_article_prompt(topic: str, length: str = "medium", style: str = "blog post", audience: str = "the general public") -> str:
     """Builds a detailed prompt that instructs the LLM to return a JSON object."""
     return f"""
@@ -47,13 +41,24 @@ Now, generate the final JSON response based on the instructions above.
 """
 
 # --- NEW: Function to Save Article to .docx ---
-def save_article_to_docx(article: ArticleOutput, output_dir: str = "generated_articles") -> str:
+def _article_sections(document) -> list:
+    """Returns the (field, handler) pairs that write each article field into the document, in order."""
+    return [
+        # Add the title as a main heading
+        ("title", lambda title: document.add_heading(title, level=1)),
+        # Render the AI's Markdown (paragraphs, headings, lists, tables, code)
+        ("content", lambda content: render_markdown(document, content.strip())),
+    ]
+
+def save_article_to_docx(article: ArticleOutput, output_dir: str = "generated_articles", document=None) -> str:
     """
     Saves the generated article to a .docx file with basic formatting.
 
     Args:
         article (ArticleOutput): The structured article data.
         output_dir (str): The directory to save the file in.
+        document: A document already assembled from the streamed article fields.
+            If None, the document is built from `article`.
 
     Returns:
         str: The full path to the saved .docx file.
@@ -68,24 +73,15 @@ def save_article_to_docx(article: ArticleOutput, output_dir: str = "generated_ar
         filename = f"{sanitized_title}_{timestamp}.docx"
         filepath = os.path.join(output_dir, filename)
 
-        # Create a new Word document
-        document = Document()
-
-        # Set default font
-        style = document.styles['Normal'].font
-        style.name = 'Calibri'
-        style.size = Pt(12)
-
-        # Add the title as a main heading
-        document.add_heading(article.title, level=1)
-
-        # Split the content by double newlines and add as paragraphs
-        # This preserves the paragraph structure from the AI's output
-        for paragraph_text in article.content.strip().split('\n\n'):
-            document.add_paragraph(paragraph_text.strip())
+        if document is None:
+            # Create a new Word document (Calibri 12pt default font)
+            document = new_document(font_size=12)
+            for field, add_section in _article_sections(document):
+                add_section(getattr(article, field))
 
         # Save the document
-        document.save(filepath)
+        with span("docx.save"):
+            document.save(filepath)
         print(f"-> Article successfully saved to: {filepath}")
         return filepath
 
@@ -100,6 +96,7 @@ class ArticleAgent:
         self.llm_client = llm_client
         print("-> Article Agent activated.")
 
+    @traced("article.create")
     def create_article(self, topic: str, length: Optional[str] = "medium", style: Optional[str] = "blog post", audience: Optional[str] = "the general public") -> str:
         """
         Generates an article, saves it to a .docx file, and returns the filepath.
@@ -109,13 +106,14 @@ class ArticleAgent:
 
         prompt = build_article_prompt(topic, length, style, audience)
         print(f"-> Generating article on '{topic}'...")
-        raw_response = self.llm_client.generate_response(prompt, json_mode=True)
-        cleaned_response = _clean_json_response(raw_response)
-        
+        # Fields are validated and written to the document as soon as they stream in
+        document = new_document(font_size=12)
+        dispatcher = OrderedFieldDispatcher(_article_sections(document))
+        parser = StreamingModelParser(ArticleOutput, on_field=dispatcher)
+
         try:
-            parsed_json = json.loads(cleaned_response)
-            article_output = ArticleOutput.model_validate(parsed_json)
-        except (json.JSONDecodeError, TypeError) as e:
+            article_output = parser.consume(self.llm_client.stream_response(prompt, json_mode=True))
+        except ValueError as e:
             print(f"Error: Failed to parse the LLM's response. Saving an error report.")
             # Create a structured error message to be saved in the docx
             article_output = ArticleOutput(
@@ -123,10 +121,10 @@ class ArticleAgent:
                 content=(
                     f"The AI's response could not be parsed correctly and an article could not be generated.\n\n"
                     f"Error Details: {e}\n\n"
-                    f"Raw AI Response:\n{raw_response}"
+                    f"Raw AI Response:\n{parser.raw_text}"
                 )
             )
         
         # Save the resulting content (either the article or the error report) to a .docx file
-        filepath = save_article_to_docx(article_output)
+        filepath = save_article_to_docx(article_output, document=document if dispatcher.complete else None)
         return filepath
\ No newline at end of file
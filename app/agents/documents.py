@@ -223,9 +223,11 @@
 import os
 from typing import List, Optional
 from docx import Document
-from docx.shared import Pt
 from pydantic import BaseModel, Field
 from app.agents.llm_client import LLMClient
+from app.agents.docx_factory import new_document
+from app.agents.markdown_docx import render_markdown
+from app.agents.tracing import set_attributes, traced
 
 # Pydantic Model for Input Structure
 class DocumentRequest(BaseModel):
@@ -268,7 +270,7 @@ class DocumentGenerationAgent:
 
         #  Use the llm_client
         content = self.llm_client.generate_response(prompt)
-        document.add_paragraph(content)
+        render_markdown(document, content)
         print("Cover letter content generated and added.")
 
     def _create_minutes(self, document: Document, request: DocumentRequest):
@@ -292,7 +294,7 @@ class DocumentGenerationAgent:
         
         # CORRECTED: Use the llm_client
         minutes_body = self.llm_client.generate_response(prompt)
-        document.add_paragraph(minutes_body)
+        render_markdown(document, minutes_body)
         print("Meeting minutes content generated and added.")
 
     def _create_memo(self, document: Document, request: DocumentRequest):
@@ -321,15 +323,14 @@ class DocumentGenerationAgent:
         )
         # CORRECTED: Use the llm_client
         memo_body = self.llm_client.generate_response(prompt)
-        document.add_paragraph(memo_body)
+        render_markdown(document, memo_body)
         print("Memo content generated and added.")
 
+    @traced("document.generate")
     def generate_document(self, request: DocumentRequest) -> Document:
         """Main method to generate a Word document based on the request."""
-        document = Document()
-        style = document.styles['Normal']
-        style.font.name = 'Calibri'
-        style.font.size = Pt(11)
+        set_attributes(doc_type=request.doc_type)
+        document = new_document(template=request.template, font_size=11)
         
         doc_type_map = {
             'cover_letter': self._create_cover_letter,
@@ -351,7 +352,7 @@ class DocumentGenerationAgent:
                         f"for {request.audience}. Output only the main body content.")
             # CORRECTED: Use the llm_client
             generic_body = self.llm_client.generate_response(prompt)
-            document.add_paragraph(generic_body)
+            render_markdown(document, generic_body)
 
             print(f"Warning: Document type '{request.doc_type}' not specifically handled. Creating a generic document.")
 
@@ -0,0 +1,124 @@
+"""
+Document factory shared by the agents.
+Each .docx template is parsed and styled once; callers get a deep copy of the prepared
+document tree instead of unzipping and parsing the template on every request.
+"""
+import copy
+import os
+import sys
+import threading
+from typing import Dict, Optional, Tuple
+
+from docx import Document
+from docx.enum.section import WD_ORIENT
+from docx.shared import Pt
+
+
+def _default_template_dir() -> str:
+    """Returns the templates folder, honouring DOCX_TEMPLATE_DIR and PyInstaller bundles."""
+    if os.getenv("DOCX_TEMPLATE_DIR"):
+        return os.getenv("DOCX_TEMPLATE_DIR")
+    if getattr(sys, 'frozen', False):
+        base_path = sys._MEIPASS
+    else:
+        # Project root is two directories up from this file (app/agents/docx_factory.py)
+        base_path = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    return os.path.join(base_path, "templates")
+
+
+class DocumentFactory:
+    """Caches one styled prototype per (template, style) and hands out copies of it."""
+
+    def __init__(self, template_dir: Optional[str] = None):
+        self.template_dir = template_dir or _default_template_dir()
+        self._prototypes: Dict[Tuple, Document] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def resolve_template(self, template: Optional[str]) -> Optional[str]:
+        """
+        Maps a template identifier (e.g. DocumentRequest.template) to a .docx file in the
+        templates folder. Returns None for the built-in python-docx template.
+        """
+        if not template:
+            return None
+        filename = os.path.basename(template)  # Never allow paths outside the templates folder
+        if not filename.lower().endswith(".docx"):
+            filename += ".docx"
+        path = os.path.join(self.template_dir, filename)
+        if os.path.isfile(path):
+            return path
+        print(f"Warning: Template '{template}' not found in {self.template_dir}. Using the default template.")
+        return None
+
+    def new_document(
+        self,
+        template: Optional[str] = None,
+        font_name: Optional[str] = "Calibri",
+        font_size: Optional[int] = 11,
+        landscape: bool = False,
+    ) -> Document:
+        """
+        Returns a fresh document based on the template with the 'Normal' font and page
+        orientation already applied.
+
+        Args:
+            template (Optional[str]): Template identifier, or None for the default template.
+            font_name (Optional[str]): Font for the 'Normal' style. None leaves the template's font.
+            font_size (Optional[int]): Font size in points for the 'Normal' style.
+            landscape (bool): Switch the first section to landscape orientation.
+        """
+        path = self.resolve_template(template)
+        # The modification time is part of the key so edited templates are picked up
+        key = (path, os.path.getmtime(path) if path else None, font_name, font_size, landscape)
+
+        prototype = self._prototypes.get(key)
+        if prototype is None:
+            with self._lock:
+                prototype = self._prototypes.get(key)
+                if prototype is None:
+                    prototype = self._build_prototype(path, font_name, font_size, landscape)
+                    # Drop prototypes of older versions of the same template
+                    for stale_key in [k for k in self._prototypes if k[0] == path and k[1] != key[1]]:
+                        del self._prototypes[stale_key]
+                    self._prototypes[key] = prototype
+                    self.misses += 1
+                else:
+                    self.hits += 1  # Built by another thread while this one waited
+        else:
+            with self._lock:  # The counters are read by /metrics from other threads
+                self.hits += 1
+
+        return copy.deepcopy(prototype)
+
+    def _build_prototype(self, path: Optional[str], font_name: Optional[str], font_size: Optional[int], landscape: bool) -> Document:
+        """Parses the template and applies the style tweaks once."""
+        document = Document(path) if path else Document()
+
+        font = document.styles['Normal'].font
+        if font_name:
+            font.name = font_name
+        if font_size:
+            font.size = Pt(font_size)
+
+        if landscape:
+            section = document.sections[0]
+            if section.orientation != WD_ORIENT.LANDSCAPE:
+                section.page_width, section.page_height = section.page_height, section.page_width
+                section.orientation = WD_ORIENT.LANDSCAPE
+        return document
+
+    def clear(self):
+        """Forgets all cached prototypes."""
+        with self._lock:
+            self._prototypes.clear()
+
+
+# Shared factory used by all agents
+default_factory = DocumentFactory()
+
+
+def new_document(template: Optional[str] = None, font_name: Optional[str] = "Calibri", font_size: Optional[int] = 11, landscape: bool = False) -> Document:
+    """Returns a new document from the shared factory. See DocumentFactory.new_document."""
+    return default_factory.new_document(template=template, font_name=font_name, font_size=font_size, landscape=landscape)
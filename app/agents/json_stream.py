@@ -0,0 +1,317 @@
+"""
+Incremental parsing of structured (JSON) LLM output.
+The parser consumes a response chunk by chunk as it streams in, reports each top-level
+field as soon as its value is complete, validates it against the Pydantic model early,
+and repairs common truncation errors locally instead of re-requesting the completion.
+"""
+import json
+import re
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Type
+
+from pydantic import BaseModel, TypeAdapter, ValidationError
+
+# Characters that change the scanner state outside / inside strings
+_STRUCTURAL = re.compile(r'[{}\[\]",:]')
+_STRING_SPECIAL = re.compile(r'["\\]')
+_TRAILING_COMMA = re.compile(r',\s*([}\]])')
+_CLOSERS = {"{": "}", "[": "]"}
+_FENCE = "```"
+
+
+class JSONStreamError(ValueError):
+    """Raised when no usable JSON object could be recovered from the response."""
+
+
+class FieldValidationError(ValueError):
+    """Raised as soon as a completed field fails validation against the model."""
+
+    def __init__(self, field: str, error: ValidationError):
+        super().__init__(f"Field '{field}' is invalid: {error.errors()[0].get('msg', error)}")
+        self.field = field
+        self.error = error
+
+
+def _loads(text: str) -> Any:
+    """json.loads that tolerates raw control characters and trailing commas."""
+    try:
+        return json.loads(text, strict=False)
+    except json.JSONDecodeError:
+        return json.loads(_TRAILING_COMMA.sub(r'\1', text), strict=False)
+
+
+def _repair_fragment(fragment: str) -> Any:
+    """
+    Parses a truncated JSON value by terminating an open string and closing open
+    brackets. Falls back to cutting the value at its last complete element.
+    """
+    stack: List[str] = []
+    in_string = False
+    last_comma = -1
+    index = 0
+    while index < len(fragment):
+        char = fragment[index]
+        if in_string:
+            if char == "\\":
+                index += 1
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append(char)
+        elif char in "}]" and stack:
+            stack.pop()
+        elif char == ",":
+            last_comma = index
+        index += 1
+
+    text = fragment
+    if in_string:
+        text = (text[:-1] if index > len(fragment) else text) + '"'
+    text = text.rstrip().rstrip(",:").rstrip()
+    try:
+        return _loads(text + "".join(_CLOSERS[bracket] for bracket in reversed(stack)))
+    except json.JSONDecodeError:
+        if last_comma <= 0:
+            raise
+        return _repair_fragment(fragment[:last_comma])
+
+
+class IncrementalJSONParser:
+    """
+    Scans a streamed response for its first top-level JSON object.
+
+    Leading prose or Markdown fences are skipped: if a ``` fence opens, the object is looked
+    for after it, and a brace whose first character is not a key or "}" (e.g. "{braces}" in
+    prose) is not taken as the start. feed() returns the (key, value) pairs
+    of top-level members completed by that chunk; close() returns the whole object,
+    repairing a truncated tail (unterminated string, missing closing brackets, dangling
+    key or comma) where possible.
+    """
+
+    def __init__(self):
+        self.fields: Dict[str, Any] = {}
+        self._buf = ""
+        self._prefix = ""  # Text seen before the object starts
+        self._pos = 0
+        self._started = False
+        self._done = False
+        self._stack: List[str] = []
+        self._in_string = False
+        self._expect = "key"  # key -> colon -> value, only tracked at depth 1
+        self._key_start: Optional[int] = None
+        self._key: Optional[str] = None
+        self._value_start: Optional[int] = None
+
+    @property
+    def done(self) -> bool:
+        """True once the closing brace of the object has been seen."""
+        return self._done
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        if self._done or not chunk:
+            return []
+        if not self._started:
+            self._prefix += chunk
+            start = self._find_start()
+            if start is None:
+                return []
+            chunk, self._prefix = self._prefix[start:], ""
+            self._started = True
+        self._buf += chunk
+        completed: List[Tuple[str, Any]] = []
+        self._scan(completed)
+        return completed
+
+    def _find_start(self) -> Optional[int]:
+        """Offset of the object's opening brace in the prefix, or None until it is known."""
+        text = self._prefix
+        fence = text.find(_FENCE)
+        search = fence + len(_FENCE) if fence >= 0 else 0
+        while True:
+            brace = text.find("{", search)
+            if brace < 0:
+                return None
+            rest = text[brace + 1:].lstrip()
+            if not rest:
+                return None  # Wait for the first member
+            if rest[0] in '"}':
+                return brace
+            search = brace + 1
+
+    def _scan(self, completed: List[Tuple[str, Any]]):
+        buf = self._buf
+        pos = self._pos
+        length = len(buf)
+        while pos < length and not self._done:
+            if self._in_string:
+                match = _STRING_SPECIAL.search(buf, pos)
+                if match is None:
+                    pos = length
+                    break
+                pos = match.start()
+                if buf[pos] == "\\":
+                    if pos + 1 >= length:
+                        break  # Wait for the escaped character
+                    pos += 2
+                    continue
+                self._in_string = False
+                if len(self._stack) == 1 and self._expect == "key" and self._key_start is not None:
+                    self._key = _loads(buf[self._key_start:pos + 1])
+                    self._key_start = None
+                    self._expect = "colon"
+                pos += 1
+                continue
+
+            match = _STRUCTURAL.search(buf, pos)
+            if match is None:
+                pos = length
+                break
+            pos = match.start()
+            char = buf[pos]
+            depth = len(self._stack)
+            if char == '"':
+                self._in_string = True
+                if depth == 1 and self._expect == "key":
+                    self._key_start = pos
+            elif char in "{[":
+                self._stack.append(char)
+            elif char in "}]":
+                if depth == 1 and char == "}":
+                    self._complete_member(pos, completed)
+                    self._done = True
+                if self._stack:
+                    self._stack.pop()
+            elif char == ":" and depth == 1 and self._expect == "colon":
+                self._expect = "value"
+                self._value_start = pos + 1
+            elif char == "," and depth == 1:
+                self._complete_member(pos, completed)
+            pos += 1
+        self._pos = pos
+
+    def _complete_member(self, end: int, completed: List[Tuple[str, Any]]):
+        if self._expect == "value" and self._key is not None:
+            raw_value = self._buf[self._value_start:end].strip()
+            if raw_value:
+                value = _loads(raw_value)
+                self.fields[self._key] = value
+                completed.append((self._key, value))
+        self._expect = "key"
+        self._key = None
+        self._key_start = None
+        self._value_start = None
+
+    def close(self) -> Dict[str, Any]:
+        """Finishes parsing, repairing a truncated object. Raises JSONStreamError if nothing is usable."""
+        if not self._started:
+            raise JSONStreamError("No JSON object found in the response.")
+        if self._done:
+            return self.fields
+
+        # Repair the pending (truncated) member, if there is one
+        if self._expect == "value" and self._key is not None and self._value_start is not None:
+            tail = self._buf[self._value_start:].strip()
+            try:
+                if tail:
+                    self.fields[self._key] = _repair_fragment(tail)
+            except json.JSONDecodeError:
+                pass  # Drop the member that cannot be repaired
+        if not self.fields:
+            raise JSONStreamError("The response was truncated before any field was complete.")
+        self._done = True
+        return self.fields
+
+
+class StreamingModelParser:
+    """
+    Incrementally parses a streamed response into a Pydantic model.
+
+    Every top-level field is validated against its annotation as soon as it completes,
+    so a malformed field fails the stream early. `on_field` is called with each validated
+    value, which lets callers start building output before the response has finished.
+    """
+
+    def __init__(self, model: Type[BaseModel], on_field: Optional[Callable[[str, Any], None]] = None):
+        self.model = model
+        self.on_field = on_field
+        self._parser = IncrementalJSONParser()
+        self._adapters = {name: TypeAdapter(field.annotation) for name, field in model.model_fields.items()}
+        self._reported = set()
+        self.raw_text = ""
+
+    def feed(self, chunk: str):
+        self.raw_text += chunk
+        for name, value in self._parser.feed(chunk):
+            adapter = self._adapters.get(name)
+            if adapter is None:
+                continue
+            try:
+                validated = adapter.validate_python(value)
+            except ValidationError as e:
+                raise FieldValidationError(name, e)
+            self._reported.add(name)
+            if self.on_field:
+                self.on_field(name, validated)
+
+    def finish(self) -> BaseModel:
+        """Closes the stream (repairing truncation) and validates the full model."""
+        result = self.model.model_validate(self._parser.close())
+        # A field recovered by the repair step has not been reported yet
+        if self.on_field:
+            for name in self.model.model_fields:
+                if name in self._parser.fields and name not in self._reported:
+                    self._reported.add(name)
+                    self.on_field(name, getattr(result, name))
+        return result
+
+    def consume(self, chunks: Iterable[str]) -> BaseModel:
+        """Feeds an iterable of chunks (e.g. LLMClient.stream_response) and returns the model."""
+        try:
+            for chunk in chunks:
+                self.feed(chunk)
+                if self._parser.done:
+                    break
+        finally:
+            # Stop the provider stream as soon as the object is complete or a field failed
+            if hasattr(chunks, "close"):
+                chunks.close()
+        return self.finish()
+
+
+class OrderedFieldDispatcher:
+    """
+    Calls one handler per field in output order, as soon as that field and every field
+    before it have arrived. Used as `on_field` to assemble a document while the later
+    fields are still streaming in.
+    """
+
+    def __init__(self, handlers: List[Tuple[str, Callable[[Any], None]]]):
+        self._handlers = list(handlers)
+        self._names = {name for name, _ in self._handlers}
+        self._pending: Dict[str, Any] = {}
+        self._next = 0
+
+    @property
+    def complete(self) -> bool:
+        """True once every handler has run."""
+        return self._next == len(self._handlers)
+
+    def __call__(self, name: str, value: Any):
+        if name not in self._names:
+            return
+        self._pending[name] = value
+        while self._next < len(self._handlers) and self._handlers[self._next][0] in self._pending:
+            field, handler = self._handlers[self._next]
+            handler(self._pending.pop(field))
+            self._next += 1
+
+
+def parse_json_response(text: str) -> Dict[str, Any]:
+    """
+    Extracts the first JSON object from a complete LLM response, skipping fences or prose
+    around it and repairing truncation. Raises JSONStreamError if nothing is usable.
+    """
+    parser = IncrementalJSONParser()
+    parser.feed(text or "")
+    return parser.close()
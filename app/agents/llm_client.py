@@ -2,14 +2,22 @@ import os
 import re
 import json
 import sys
-from typing import Dict, Any, Optional
+import time
+from typing import Dict, Any, Iterator, Optional
 import requests
 import google.generativeai as genai
 from openai import OpenAI
 from dotenv import load_dotenv
 
+from app.agents.json_stream import parse_json_response
+from app.agents.stub_llm import StubLLM
+from app.agents.tracing import notify_chunk, set_attributes, span, start_span
+
 load_dotenv()
 
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+
 # Load API Keys from environment
 # OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 # GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
@@ -123,15 +131,15 @@ class LLMClient:
     # def __init__(self, provider: str = "openai", model: str = None):
     def __init__(self, provider: str = "deepseek", model: str = None):
         """
-        provider: 'ollama', 'gemini', 'openai', 'deepseek'
+        provider: 'ollama', 'gemini', 'openai', 'deepseek', or 'stub' (local fake for load tests, no key needed)
         model: Model name which will depend on the provider.
         """
         self.provider = provider.lower()
         self._validate_provider()
         # self.model = model or self._default_model()
         # self.client = self._setup_client()
-        self.api_key = get_api_key(self.provider)
-        if not self.api_key:
+        self.api_key = get_api_key(self.provider) if self.provider != "stub" else None
+        if not self.api_key and self.provider != "stub":
             raise ValueError(f"API Key for provider '{self.provider}' is missing.")
         self.model = model or self._default_model()
         self.client = self._setup_client()
@@ -143,7 +151,8 @@ class LLMClient:
             "gemini": "gemini-1.5-flash",
             "ollama": "mistral",
             # "deepseek": "deepseek-chat"  # DeepSeek default model
-            "deepseek": "deepseek/deepseek-r1-0528-qwen3-8b:free"
+            "deepseek": "deepseek/deepseek-r1-0528-qwen3-8b:free",
+            "stub": "stub"
         }
 
         # return {"openai": "gpt-4o-mini", "gemini": "gemini-1.5-flash", "ollama": "mistral"}.get(self.provider)
@@ -151,7 +160,7 @@ class LLMClient:
 
 
     def _validate_provider(self):
-        supported = ["ollama", "openai", "gemini", "deepseek"]
+        supported = ["ollama", "openai", "gemini", "deepseek", "stub"]
         if self.provider not in supported:
             raise ValueError(f"Provider '{self.provider}' is not supported. Choose from {supported}.")
 
@@ -171,6 +180,8 @@ class LLMClient:
         elif self.provider == "gemini":
             genai.configure(api_key=self.api_key)
             return genai.GenerativeModel(self.model)
+        elif self.provider == "stub":
+            return StubLLM()
         # Ollama and DeepSeek use direct requests, so no client object is returned here.
         return None
 
@@ -179,10 +190,21 @@ class LLMClient:
             "openai": self._call_openai, 
             "gemini": self._call_gemini, 
             "ollama": self._call_ollama,
-            "deepseek": self._call_deepseek # DeepSeek dispatch
-            
+            "deepseek": self._call_deepseek, # DeepSeek dispatch
+            "stub": self._call_stub
             }
-        return dispatch[self.provider](prompt, system_prompt, json_mode)
+        with span("llm.generate", kind="client", **self._span_attributes(prompt, system_prompt, json_mode)) as llm_span:
+            response = dispatch[self.provider](prompt, system_prompt, json_mode)
+            llm_span.set_attribute("llm.response_chars", len(response))
+            return response
+
+    def _span_attributes(self, prompt: str, system_prompt: Optional[str], json_mode: bool) -> Dict[str, Any]:
+        return {
+            "llm.provider": self.provider,
+            "llm.model": self.model,
+            "llm.json_mode": json_mode,
+            "llm.prompt_chars": len(prompt) + len(system_prompt or ""),
+        }
 
     def _call_openai(self, prompt: str, system_prompt: Optional[str], json_mode: bool) -> str:
         messages = [{"role": "system", "content": system_prompt}] if system_prompt else []
@@ -195,6 +217,8 @@ class LLMClient:
                 temperature=0.1,
                 response_format=response_format
             )
+            if resp.usage:
+                set_attributes(**{"llm.input_tokens": resp.usage.prompt_tokens, "llm.output_tokens": resp.usage.completion_tokens})
             return resp.choices[0].message.content.strip()
         except Exception as e:
             raise RuntimeError(f"OpenAI API request failed: {e}")
@@ -206,6 +230,9 @@ class LLMClient:
             resp = self.client.generate_content(
                 full_prompt, 
                 generation_config=genai.types.GenerationConfig(**config))
+            usage = getattr(resp, "usage_metadata", None)
+            if usage:
+                set_attributes(**{"llm.input_tokens": usage.prompt_token_count, "llm.output_tokens": usage.candidates_token_count})
             return resp.text.strip()
         except Exception as e:
             raise RuntimeError(f"Gemini API request failed: {e}")
@@ -222,7 +249,9 @@ class LLMClient:
         try:
             resp = requests.post(f"{OLLAMA_HOST}/api/chat", json=payload, timeout=60.0)
             resp.raise_for_status()
-            return resp.json()["message"]["content"].strip()
+            data = resp.json()
+            set_attributes(**{"llm.input_tokens": data.get("prompt_eval_count"), "llm.output_tokens": data.get("eval_count")})
+            return data["message"]["content"].strip()
         except requests.exceptions.RequestException as e:
             raise RuntimeError(f"Ollama API request failed: {e}")
 
@@ -258,7 +287,7 @@ class LLMClient:
         try:
             response = requests.post(
                 # "https://api.deepseek.com/chat/completions",
-                "https://openrouter.ai/api/v1/chat/completions",
+                OPENROUTER_URL,
                 headers=headers,
                 json=payload,
                 timeout=60
@@ -267,24 +296,171 @@ class LLMClient:
             data = response.json()
 
             if data and "choices" in data and len(data["choices"]) > 0:
+                usage = data.get("usage") or {}
+                set_attributes(**{"llm.input_tokens": usage.get("prompt_tokens"), "llm.output_tokens": usage.get("completion_tokens")})
                 return data["choices"][0]["message"]["content"].strip()
             else:
                 raise RuntimeError(f"DeepSeek API returned unexpected response format: {data}")
         except requests.exceptions.RequestException as e:
             raise RuntimeError(f"DeepSeek API request failed: {e}")
 
+    def _call_stub(self, prompt: str, system_prompt: Optional[str], json_mode: bool) -> str:
+        """Calls the local stub model (configured through the STUB_LLM_* environment variables)."""
+        response = self.client.complete(prompt, system_prompt, json_mode)
+        # Rough token estimate (about 4 characters per token)
+        set_attributes(**{"llm.input_tokens": (len(prompt) + len(system_prompt or "")) // 4, "llm.output_tokens": len(response) // 4})
+        return response
+
+    #  Streaming
+    def stream_response(self, prompt: str, system_prompt: Optional[str] = None, json_mode: bool = False) -> Iterator[str]:
+        """
+        Yields the response text in chunks as the provider produces them.
+        Closing the generator early (e.g. after a field failed validation) closes the
+        underlying connection, so the rest of the completion is not waited for.
+        """
+        dispatch = {
+            "openai": self._stream_openai,
+            "gemini": self._stream_gemini,
+            "ollama": self._stream_ollama,
+            "deepseek": self._stream_deepseek,
+            "stub": self._stream_stub,
+        }
+        stream = dispatch[self.provider](prompt, system_prompt, json_mode)
+        return self._traced_stream(stream, self._span_attributes(prompt, system_prompt, json_mode))
+
+    def _traced_stream(self, stream: Iterator[str], attributes: Dict[str, Any]) -> Iterator[str]:
+        """Times a response stream: first chunk latency, total duration and size."""
+        llm_span = start_span("llm.stream", kind="client", **attributes)
+        started = time.perf_counter()
+        chunks = chars = 0
+        try:
+            for chunk in stream:
+                if chunks == 0:
+                    llm_span.set_attribute("llm.first_chunk_ms", round((time.perf_counter() - started) * 1000.0, 3))
+                chunks += 1
+                chars += len(chunk)
+                notify_chunk(llm_span, chunk)
+                yield chunk
+        except GeneratorExit:
+            # The consumer stopped reading (JSON object complete, or a field failed validation)
+            llm_span.set_attribute("llm.closed_by_consumer", True)
+            raise
+        except Exception as e:
+            llm_span.set_error(e)
+            raise
+        finally:
+            stream.close()
+            llm_span.set_attribute("llm.chunks", chunks)
+            llm_span.set_attribute("llm.response_chars", chars)
+            llm_span.end()
+
+    def _stream_openai(self, prompt: str, system_prompt: Optional[str], json_mode: bool) -> Iterator[str]:
+        messages = [{"role": "system", "content": system_prompt}] if system_prompt else []
+        messages.append({"role": "user", "content": prompt})
+        response_format = {"type": "json_object"} if json_mode else {"type": "text"}
+        try:
+            stream = self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=0.1,
+                response_format=response_format,
+                stream=True
+            )
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except Exception as e:
+            raise RuntimeError(f"OpenAI API request failed: {e}")
+
+    def _stream_gemini(self, prompt: str, system_prompt: Optional[str], json_mode: bool) -> Iterator[str]:
+        full_prompt = f"{system_prompt}\n\n{prompt}" if system_prompt else prompt
+        config = {"response_mime_type": "application/json"} if json_mode else {}
+        try:
+            stream = self.client.generate_content(
+                full_prompt,
+                generation_config=genai.types.GenerationConfig(**config),
+                stream=True)
+            for chunk in stream:
+                if chunk.text:
+                    yield chunk.text
+        except Exception as e:
+            raise RuntimeError(f"Gemini API request failed: {e}")
+
+    def _stream_ollama(self, prompt: str, system_prompt: Optional[str], json_mode: bool) -> Iterator[str]:
+        messages = [{"role": "system", "content": system_prompt}] if system_prompt else []
+        messages.append({"role": "user", "content": prompt})
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "stream": True,
+            "format": "json" if json_mode else ""
+        }
+        try:
+            with requests.post(f"{OLLAMA_HOST}/api/chat", json=payload, stream=True, timeout=60.0) as resp:
+                resp.raise_for_status()
+                # Ollama streams one JSON object per line
+                for line in resp.iter_lines():
+                    if not line:
+                        continue
+                    data = json.loads(line)
+                    content = data.get("message", {}).get("content")
+                    if content:
+                        yield content
+                    if data.get("done"):
+                        break
+        except requests.exceptions.RequestException as e:
+            raise RuntimeError(f"Ollama API request failed: {e}")
+
+    def _stream_deepseek(self, prompt: str, system_prompt: Optional[str], json_mode: bool) -> Iterator[str]:
+        """Streams from the DeepSeek (OpenRouter) API using server-sent events."""
+        if not self.api_key:
+            raise ValueError("DeepSeek API Key is not set.")
+
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key}"
+        }
+        messages = []
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+        messages.append({"role": "user", "content": prompt})
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "stream": True
+        }
+
+        try:
+            with requests.post(OPENROUTER_URL, headers=headers, json=payload, stream=True, timeout=60) as response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    # SSE comments (": OPENROUTER PROCESSING") and blank keep-alive lines are skipped
+                    if not line or not line.startswith(b"data:"):
+                        continue
+                    data = line[len(b"data:"):].strip()
+                    if data == b"[DONE]":
+                        break
+                    event = json.loads(data)
+                    if "error" in event:
+                        raise RuntimeError(f"DeepSeek API returned an error: {event['error']}")
+                    choices = event.get("choices") or []
+                    content = choices[0].get("delta", {}).get("content") if choices else None
+                    if content:
+                        yield content
+        except requests.exceptions.RequestException as e:
+            raise RuntimeError(f"DeepSeek API request failed: {e}")
 
+    def _stream_stub(self, prompt: str, system_prompt: Optional[str], json_mode: bool) -> Iterator[str]:
+        return self.client.stream(prompt, system_prompt, json_mode)
 
     def parse_instruction(self, instruction: str) -> Dict[str, Any]:
         """Parses a natural language instruction into a structured JSON action."""
         try:
             response_text = self.generate_response(prompt=instruction, system_prompt=SYSTEM_PROMPT_PARSER, json_mode=True)
-            match = re.search(r'```(json)?\s*({.*})\s*```', response_text, re.DOTALL)
-            if match: response_text = match.group(2)
-            parsed_json = json.loads(response_text)
+            parsed_json = parse_json_response(response_text)
             if "action" not in parsed_json: raise ValueError("Response missing 'action' key")
             return parsed_json
-        except (json.JSONDecodeError, ValueError, RuntimeError) as e:
+        except (ValueError, RuntimeError) as e:
             print(f"Warning: LLM JSON parsing failed ({e}). Falling back to basic keywords.")
             lower_instruction = instruction.lower()
             if "analyze" in lower_instruction or "analysis" in lower_instruction: return {"action": "analyse_data", "params": {}}
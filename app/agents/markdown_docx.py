@@ -0,0 +1,287 @@
+"""
+Streaming Markdown to .docx renderer shared by the agents.
+LLM output is converted to WordprocessingML in a single pass over its lines: headings,
+bullet/numbered lists, block quotes, pipe tables, fenced code blocks and inline
+bold/italic/code. The generated XML is parsed in batches and appended straight to the
+document body, instead of building every paragraph and run through python-docx calls.
+"""
+import re
+from typing import Dict, Iterable, List, Optional
+from xml.sax.saxutils import escape
+
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls, qn
+
+# Block-level patterns
+_HEADING_RE = re.compile(r'^(#{1,6})\s+(.*?)(?:\s+#+)?\s*$')  # Closing #s need a space before them
+_BULLET_RE = re.compile(r'^(\s*)[-*+]\s+(.*)$')
+_NUMBERED_RE = re.compile(r'^(\s*)\d+[.)]\s+(.*)$')
+_QUOTE_RE = re.compile(r'^\s*>\s?(.*)$')
+_FENCE_RE = re.compile(r'^\s*(```|~~~)')
+_RULE_RE = re.compile(r'^\s*([-*_])(\s*\1){2,}\s*$')
+_TABLE_SEPARATOR_RE = re.compile(r'^\s*\|?\s*:?-{2,}:?\s*(\|\s*:?-{2,}:?\s*)*\|?\s*$')
+
+# Inline emphasis: ***both***, **bold**, __bold__, *italic*, _italic_, `code`
+_INLINE_RE = re.compile(
+    r'\*\*\*(?P<both>.+?)\*\*\*'
+    r'|\*\*(?P<bold>.+?)\*\*'
+    r'|__(?P<bold2>.+?)__'
+    r'|\*(?!\s)(?P<italic>.+?)(?<!\s)\*'
+    r'|(?<!\w)_(?!\s)(?P<italic2>.+?)(?<!\s)_(?!\w)'
+    r'|`(?P<code>[^`]+)`'
+)
+
+# Characters that are not allowed in XML 1.0 documents
+_INVALID_XML_RE = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+_CODE_FONT = "Consolas"
+_TABLE_WIDTH_TWIPS = 9000
+_FLUSH_EVERY = 200  # Blocks buffered before they are parsed into the document
+
+
+def _text(value: str) -> str:
+    return escape(_INVALID_XML_RE.sub("", value))
+
+
+class MarkdownDocxRenderer:
+    """
+    Renders Markdown into a python-docx Document.
+
+    Text can be fed incrementally with feed() (e.g. while an LLM response streams in);
+    close() must be called at the end to flush the last block.
+    """
+
+    def __init__(self, document, heading_offset: int = 0):
+        """
+        Args:
+            document: The python-docx Document to append to.
+            heading_offset (int): Added to Markdown heading levels, so '## ' becomes
+                'Heading 3' with an offset of 1. Levels are capped at 9.
+        """
+        self.document = document
+        self.heading_offset = heading_offset
+        self._body = document.element.body
+        self._styles = self._resolve_styles(document)
+        self._pending_line = ""
+        self._paragraph: List[str] = []
+        self._table: List[List[str]] = []
+        self._code: Optional[List[str]] = None
+        self._xml: List[str] = []
+
+    @staticmethod
+    def _resolve_styles(document) -> Dict[str, Optional[str]]:
+        """Maps style names to style ids, or None if the template lacks the style."""
+        names = [f"Heading {level}" for level in range(1, 10)]
+        names += ["List Bullet", "List Bullet 2", "List Bullet 3",
+                  "List Number", "List Number 2", "List Number 3", "Quote", "Table Grid"]
+        styles = {}
+        for name in names:
+            try:
+                styles[name] = document.styles[name].style_id
+            except KeyError:
+                styles[name] = None
+        return styles
+
+    #  Public API
+    def feed(self, text: str):
+        """Consumes a chunk of Markdown. Only complete lines are rendered."""
+        data = self._pending_line + text
+        lines = data.split("\n")
+        self._pending_line = lines.pop()
+        for line in lines:
+            self._handle_line(line.rstrip("\r"))
+        if len(self._xml) >= _FLUSH_EVERY:
+            self._flush_xml()
+
+    def close(self):
+        """Renders any remaining text and appends all buffered blocks to the document."""
+        if self._pending_line:
+            self._handle_line(self._pending_line.rstrip("\r"))
+            self._pending_line = ""
+        if self._code is not None:
+            self._emit_code(self._code)
+            self._code = None
+        self._flush_paragraph()
+        self._flush_table()
+        self._flush_xml()
+
+    def add_code_block(self, code: str):
+        """Appends a preformatted code block without Markdown parsing."""
+        self._flush_paragraph()
+        self._flush_table()
+        self._emit_code(code.splitlines() or [""])
+
+    #  Line handling
+    def _handle_line(self, line: str):
+        if self._code is not None:
+            if _FENCE_RE.match(line):
+                self._emit_code(self._code)
+                self._code = None
+            else:
+                self._code.append(line)
+            return
+
+        if _FENCE_RE.match(line):
+            self._flush_paragraph()
+            self._flush_table()
+            self._code = []
+            return
+
+        stripped = line.strip()
+        if stripped.startswith("|") or (self._table and "|" in stripped):
+            self._flush_paragraph()
+            if not _TABLE_SEPARATOR_RE.match(stripped):
+                self._table.append(self._split_row(stripped))
+            return
+        self._flush_table()
+
+        if not stripped:
+            self._flush_paragraph()
+            return
+
+        match = _HEADING_RE.match(line)
+        if match:
+            self._flush_paragraph()
+            level = min(len(match.group(1)) + self.heading_offset, 9)
+            self._emit_paragraph(match.group(2), self._styles.get(f"Heading {level}"))
+            return
+
+        if _RULE_RE.match(line):
+            self._flush_paragraph()
+            return
+
+        for pattern, style in ((_BULLET_RE, "List Bullet"), (_NUMBERED_RE, "List Number")):
+            match = pattern.match(line)
+            if match:
+                self._flush_paragraph()
+                depth = min(len(match.group(1).expandtabs(4)) // 2, 2)
+                style_id = self._styles.get(f"{style} {depth + 1}" if depth else style) or self._styles.get(style)
+                self._emit_paragraph(match.group(2), style_id)
+                return
+
+        match = _QUOTE_RE.match(line)
+        if match:
+            self._flush_paragraph()
+            self._emit_paragraph(match.group(1), self._styles.get("Quote"))
+            return
+
+        # Plain text: consecutive lines form one paragraph, separated by line breaks
+        self._paragraph.append(stripped)
+
+    @staticmethod
+    def _split_row(row: str) -> List[str]:
+        row = row.strip()
+        if row.startswith("|"):
+            row = row[1:]
+        if row.endswith("|") and not row.endswith("\\|"):
+            row = row[:-1]
+        cells = re.split(r'(?<!\\)\|', row)
+        return [cell.strip().replace("\\|", "|") for cell in cells]
+
+    #  Block emitters (produce WordprocessingML strings)
+    def _flush_paragraph(self):
+        if self._paragraph:
+            self._emit_paragraph("\n".join(self._paragraph), None)
+            self._paragraph = []
+
+    def _flush_table(self):
+        if self._table:
+            self._emit_table(self._table)
+            self._table = []
+
+    def _emit_paragraph(self, text: str, style_id: Optional[str]):
+        ppr = f'<w:pPr><w:pStyle w:val="{style_id}"/></w:pPr>' if style_id else ""
+        self._xml.append(f"<w:p>{ppr}{self._runs(text)}</w:p>")
+
+    def _emit_code(self, lines: Iterable[str]):
+        rpr = f'<w:rPr><w:rFonts w:ascii="{_CODE_FONT}" w:hAnsi="{_CODE_FONT}" w:cs="{_CODE_FONT}"/><w:sz w:val="20"/></w:rPr>'
+        for line in lines:
+            self._xml.append(
+                '<w:p><w:pPr><w:spacing w:before="0" w:after="0"/></w:pPr>'
+                f'<w:r>{rpr}<w:t xml:space="preserve">{_text(line)}</w:t></w:r></w:p>'
+            )
+
+    def _emit_table(self, rows: List[List[str]]):
+        columns = max(len(row) for row in rows)
+        width = _TABLE_WIDTH_TWIPS // columns
+        style_id = self._styles.get("Table Grid")
+        style = f'<w:tblStyle w:val="{style_id}"/>' if style_id else ""
+        parts = [
+            f'<w:tbl><w:tblPr>{style}<w:tblW w:w="0" w:type="auto"/></w:tblPr><w:tblGrid>',
+            f'<w:gridCol w:w="{width}"/>' * columns,
+            "</w:tblGrid>",
+        ]
+        for row_index, row in enumerate(rows):
+            header = row_index == 0 and len(rows) > 1
+            parts.append("<w:tr><w:trPr><w:tblHeader/></w:trPr>" if header else "<w:tr>")
+            for cell in row + [""] * (columns - len(row)):
+                parts.append(
+                    f'<w:tc><w:tcPr><w:tcW w:w="{width}" w:type="dxa"/></w:tcPr>'
+                    f"<w:p>{self._runs(cell, bold=header)}</w:p></w:tc>"
+                )
+            parts.append("</w:tr>")
+        parts.append("</w:tbl>")
+        self._xml.append("".join(parts))
+
+    @staticmethod
+    def _run(text: str, bold: bool = False, italic: bool = False, code: bool = False) -> str:
+        props = ""
+        if code:
+            props += f'<w:rFonts w:ascii="{_CODE_FONT}" w:hAnsi="{_CODE_FONT}" w:cs="{_CODE_FONT}"/>'
+        if bold:
+            props += "<w:b/>"
+        if italic:
+            props += "<w:i/>"
+        rpr = f"<w:rPr>{props}</w:rPr>" if props else ""
+        # Soft line breaks inside a paragraph become <w:br/>
+        content = "<w:br/>".join(
+            f'<w:t xml:space="preserve">{_text(piece)}</w:t>' for piece in text.split("\n")
+        )
+        return f"<w:r>{rpr}{content}</w:r>"
+
+    def _runs(self, text: str, bold: bool = False) -> str:
+        runs = []
+        position = 0
+        for match in _INLINE_RE.finditer(text):
+            if match.start() > position:
+                runs.append(self._run(text[position:match.start()], bold=bold))
+            kind = match.lastgroup
+            value = match.group(kind)
+            runs.append(self._run(
+                value,
+                bold=bold or kind in ("both", "bold", "bold2"),
+                italic=kind in ("both", "italic", "italic2"),
+                code=kind == "code",
+            ))
+            position = match.end()
+        if position < len(text) or not runs:
+            runs.append(self._run(text[position:], bold=bold))
+        return "".join(runs)
+
+    #  Output
+    def _flush_xml(self):
+        """Parses the buffered blocks in one go and moves them into the document body."""
+        if not self._xml:
+            return
+        container = parse_xml(f"<w:body {nsdecls('w')}>{''.join(self._xml)}</w:body>")
+        self._xml = []
+        sect_pr = self._body.find(qn("w:sectPr"))
+        for element in list(container):
+            if sect_pr is not None:
+                sect_pr.addprevious(element)
+            else:
+                self._body.append(element)
+
+
+def render_markdown(document, text: str, heading_offset: int = 0):
+    """Renders a Markdown string into the document. See MarkdownDocxRenderer."""
+    renderer = MarkdownDocxRenderer(document, heading_offset=heading_offset)
+    renderer.feed(text or "")
+    renderer.close()
+
+
+def add_code_block(document, code: str):
+    """Appends a preformatted code block to the document."""
+    renderer = MarkdownDocxRenderer(document)
+    renderer.add_code_block(code)
+    renderer.close()
@@ -1,7 +1,7 @@
 import os
 import re
-import json
-from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
 from datetime import datetime
 from pydantic import BaseModel, Field
 # Imports for creating .docx files
@@ -9,6 +9,10 @@ from docx import Document
 from docx.shared import Pt, Inches
 
 from app.agents.llm_client import LLMClient
+from app.agents.docx_factory import new_document
+from app.agents.markdown_docx import render_markdown
+from app.agents.json_stream import OrderedFieldDispatcher, StreamingModelParser, parse_json_response
+from app.agents.tracing import bind_context, span, traced
 
 # Pydantic Model for a Structured Report 
 class ReportOutput(BaseModel):
@@ -18,13 +22,20 @@ class ReportOutput(BaseModel):
     main_content: str = Field(..., description="The main body of the report, formatted with paragraphs and potentially including its own subheadings.")
     conclusion: str = Field(..., description="A concluding summary that wraps up the report.")
 
-#  Helper Functions 
-def _clean_json_response(text: str) -> str:
-    """Helper to strip markdown backticks or other text from a JSON string."""
-    match = re.search(r'```(?:json)?\s*({.*})\s*```', text, re.DOTALL)
-    if match:
-        return match.group(1).strip()
-    return text.strip()
+class OutlineSection(BaseModel):
+    """A single section planned by the outline call."""
+    heading: str = Field(..., description="The heading of the section.")
+    brief: str = Field("", description="One or two sentences describing what the section must cover.")
+
+class ReportOutline(BaseModel):
+    """Defines the outline used for sectioned (fan-out) report generation."""
+    title: str = Field(..., description="The clear and professional title of the report.")
+    sections: List[OutlineSection] = Field(..., description="The ordered main-body sections of the report.")
+
+class ReportSummary(BaseModel):
+    """Executive summary and conclusion written from the finished sections."""
+    executive_summary: str = Field(..., description="A concise summary of the report's key findings and conclusions.")
+    conclusion: str = Field(..., description="A concluding summary that wraps up the report.")
 
 #  Prompt to Request JSON 
 def build_report_prompt(topic: str, tone: str = "professional", length: str = "standard") -> str:
@@ -51,14 +62,114 @@ DESIRED LENGTH: "{length}" (e.g., 'short' for a brief memo, 'standard' for 1-2 p
 Now, generate the final JSON response based on the instructions above.
 """
 
+#  Prompts for Sectioned Generation 
+def build_outline_prompt(topic: str, tone: str = "professional", length: str = "comprehensive", max_sections: int = 6) -> str:
+    """Builds a short prompt that asks the LLM for a report outline only (no section bodies)."""
+    return f"""
+You are an expert business analyst and report writer.
+Plan the structure of a report on the topic provided. Do NOT write the report itself.
+You must return your response as a single, valid JSON object, with no other text or markdown before or after it.
+
+The JSON object must have the following exact structure:
+{{
+    "title": "A clear and professional title for the report",
+    "sections": [
+        {{"heading": "Section heading", "brief": "One or two sentences on what this section must cover."}}
+    ]
+}}
+
+Use between 3 and {max_sections} sections. Do not include an executive summary or a conclusion section.
+
+---
+TOPIC: "{topic}"
+TONE: "{tone}"
+DESIRED LENGTH: "{length}"
+---
+
+Now, generate the final JSON response based on the instructions above.
+"""
+
+def build_section_prompt(topic: str, title: str, section: OutlineSection, outline: List[str], tone: str = "professional", length: str = "comprehensive") -> str:
+    """Builds the prompt for writing the body of a single outline section."""
+    outline_text = "\n".join(f"- {heading}" for heading in outline)
+    return f"""
+You are an expert business analyst and report writer, known for clarity, structure, and actionable insights.
+You are writing ONE section of a report titled "{title}" on the topic "{topic}".
+
+The full report outline is:
+{outline_text}
+
+Write only the body of the section "{section.heading}". {section.brief}
+Do not repeat the section heading and do not cover material that belongs to the other sections.
+Separate paragraphs with a blank line. You may use '### ' sub-headings, bullet lists and Markdown tables inside the section.
+Output only the section text, with no JSON and no preamble.
+
+TONE: "{tone}"
+DESIRED LENGTH OF THE WHOLE REPORT: "{length}"
+"""
+
+def build_summary_prompt(title: str, main_content: str, tone: str = "professional") -> str:
+    """Builds the prompt that writes the executive summary and conclusion from the finished sections."""
+    return f"""
+You are an expert business analyst and report writer.
+Below is the full main body of a report titled "{title}".
+Write its executive summary and conclusion based ONLY on this content.
+You must return your response as a single, valid JSON object, with no other text or markdown before or after it.
+
+The JSON object must have the following exact structure:
+{{
+    "executive_summary": "A concise summary of the report's key findings and conclusions.",
+    "conclusion": "A concluding summary that wraps up the report and may suggest next steps."
+}}
+
+TONE: "{tone}"
+---
+{main_content}
+---
+
+Now, generate the final JSON response based on the instructions above.
+"""
+
 # Function to Save the Report to a .docx file 
-def save_report_to_docx(report: ReportOutput, output_dir: str = "generated_reports") -> str:
+def _report_sections(document) -> list:
+    """
+    Returns the (field, handler) pairs that write each report field into the document,
+    in document order. Used with OrderedFieldDispatcher to build the document while
+    the LLM response is still streaming.
+    """
+    def add_title(title: str):
+        document.add_heading(title, level=1)
+        document.add_paragraph(f"Report generated on: {datetime.now().strftime('%Y-%m-%d')}")
+
+    def add_executive_summary(text: str):
+        document.add_heading("Executive Summary", level=2)
+        render_markdown(document, text)
+
+    def add_main_content(text: str):
+        document.add_heading("Main Report", level=2)
+        # Markdown headings sit below "Main Report", so '## Analysis' becomes a level 3 heading
+        render_markdown(document, text.strip(), heading_offset=1)
+
+    def add_conclusion(text: str):
+        document.add_heading("Conclusion", level=2)
+        render_markdown(document, text)
+
+    return [
+        ("title", add_title),
+        ("executive_summary", add_executive_summary),
+        ("main_content", add_main_content),
+        ("conclusion", add_conclusion),
+    ]
+
+def save_report_to_docx(report: ReportOutput, output_dir: str = "generated_reports", document=None) -> str:
     """
     Saves the generated report to a .docx file with professional formatting.
 
     Args:
         report (ReportOutput): The structured report data.
         output_dir (str): The directory to save the file in.
+        document: A document already assembled from the streamed report fields.
+            If None, the document is built from `report`.
 
     Returns:
         str: The full path to the saved .docx file.
@@ -70,35 +181,13 @@ def save_report_to_docx(report: ReportOutput, output_dir: str = "generated_repor
         filename = f"Report_{sanitized_title}_{timestamp}.docx"
         filepath = os.path.join(output_dir, filename)
 
-        document = Document()
-        style = document.styles['Normal'].font
-        style.name = 'Calibri'
-        style.size = Pt(11)
+        if document is None:
+            document = new_document(font_size=11)
+            for field, add_section in _report_sections(document):
+                add_section(getattr(report, field))
 
-        # Add Title
-        document.add_heading(report.title, level=1)
-        document.add_paragraph(f"Report generated on: {datetime.now().strftime('%Y-%m-%d')}")
-
-        # Add Executive Summary
-        document.add_heading("Executive Summary", level=2)
-        document.add_paragraph(report.executive_summary)
-
-        # Add Main Content
-        document.add_heading("Main Report", level=2)
-        # Split content to preserve paragraphs and handle subheadings
-        for paragraph_text in report.main_content.strip().split('\n\n'):
-            stripped_para = paragraph_text.strip()
-            if stripped_para.startswith('## '):
-                # Add as a smaller heading if AI uses markdown-style headings
-                document.add_heading(stripped_para.replace('## ', ''), level=3)
-            elif stripped_para:
-                document.add_paragraph(stripped_para)
-
-        # Add Conclusion
-        document.add_heading("Conclusion", level=2)
-        document.add_paragraph(report.conclusion)
-
-        document.save(filepath)
+        with span("docx.save"):
+            document.save(filepath)
         print(f"-> Report successfully saved to: {filepath}")
         return filepath
 
@@ -108,35 +197,133 @@ def save_report_to_docx(report: ReportOutput, output_dir: str = "generated_repor
 
 # ReportAgent Class 
 class ReportAgent:
-    def __init__(self, llm_client: LLMClient):
+    # Lengths that use the outline-then-fan-out mode when the caller does not choose explicitly
+    SECTIONED_LENGTHS = ("comprehensive",)
+
+    def __init__(self, llm_client: LLMClient, max_section_workers: int = 6):
         """Initializes the agent with a pre-configured LLMClient."""
         self.llm_client = llm_client
+        self.max_section_workers = max_section_workers
         print("-> Report Agent activated.")
 
-    def create_report(self, topic: str, tone: Optional[str] = "professional", length: Optional[str] = "1-2 pages") -> str:
+    @traced("report.create")
+    def create_report(self, topic: str, tone: Optional[str] = "professional", length: Optional[str] = "1-2 pages", sectioned: Optional[bool] = None) -> str:
         """
         Generates a report, saves it to a .docx file, and returns the filepath.
+
+        Args:
+            sectioned (Optional[bool]): Use outline-then-fan-out generation. Defaults to
+                True for 'comprehensive' reports and False otherwise.
         """
         if not topic:
             raise ValueError("A topic must be provided to generate a report.")
-            
+
+        if sectioned is None:
+            sectioned = (length or "").lower() in self.SECTIONED_LENGTHS
+
+        report_output, document = None, None
+        if sectioned:
+            report_output = self._generate_sectioned_report(topic, tone, length)
+        if report_output is None:
+            report_output, document = self._generate_single_report(topic, tone, length)
+
+        # Save the result (either the report or an error report) to a .docx file
+        filepath = save_report_to_docx(report_output, document=document)
+        return filepath
+
+    @traced("report.generate")
+    def _generate_single_report(self, topic: str, tone: Optional[str], length: Optional[str]) -> Tuple[ReportOutput, Optional[Document]]:
+        """
+        Generates the whole report in a single streamed JSON completion.
+
+        Each field is validated as soon as it has streamed in and written to the document
+        in order, so the .docx is mostly assembled when the response ends. Returns the
+        report and the assembled document (None for an error report).
+        """
         prompt = build_report_prompt(topic, tone, length)
         print(f"-> Generating report on '{topic}'...")
-        raw_response = self.llm_client.generate_response(prompt, json_mode=True)
-        cleaned_response = _clean_json_response(raw_response)
-        
+        document = new_document(font_size=11)
+        dispatcher = OrderedFieldDispatcher(_report_sections(document))
+        parser = StreamingModelParser(ReportOutput, on_field=dispatcher)
+
         try:
-            parsed_json = json.loads(cleaned_response)
-            report_output = ReportOutput.model_validate(parsed_json)
-        except (json.JSONDecodeError, TypeError) as e:
+            report_output = parser.consume(self.llm_client.stream_response(prompt, json_mode=True))
+        except ValueError as e:
             print(f"Error: Failed to parse the LLM's response. Saving an error report.")
             report_output = ReportOutput(
                 title=f"Error Generating Report on '{topic}'",
                 executive_summary="The AI's response could not be parsed correctly. This document contains the error details.",
-                main_content=f"Error Details: {e}\n\nRaw AI Response:\n{raw_response}",
+                main_content=f"Error Details: {e}\n\nRaw AI Response:\n{parser.raw_text}",
+                conclusion="No conclusion could be generated due to the parsing error."
+            )
+            return report_output, None
+        return report_output, document if dispatcher.complete else None
+
+    @traced("report.generate_sectioned")
+    def _generate_sectioned_report(self, topic: str, tone: Optional[str], length: Optional[str]) -> Optional[ReportOutput]:
+        """
+        Generates a report as outline -> concurrent section bodies -> executive summary.
+
+        Returns None if no usable outline could be produced, so the caller can fall back
+        to single-call generation.
+        """
+        print(f"-> Generating sectioned report on '{topic}'...")
+        outline = self._generate_outline(topic, tone, length)
+        if outline is None:
+            print("Warning: Could not generate a report outline. Falling back to single-call generation.")
+            return None
+
+        headings = [section.heading for section in outline.sections]
+        workers = max(1, min(self.max_section_workers, len(outline.sections)))
+        # LLM calls are network-bound, so a thread pool is enough to overlap them
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="report-section") as executor:
+            # bind_context keeps the section spans under this request's trace
+            bodies = list(executor.map(
+                bind_context(lambda section: self._generate_section(topic, outline.title, section, headings, tone, length)),
+                outline.sections
+            ))
+
+        main_content = "\n\n".join(
+            f"## {section.heading}\n\n{body.strip()}" for section, body in zip(outline.sections, bodies)
+        )
+        summary = self._generate_summary(outline.title, main_content, tone)
+        return ReportOutput(
+            title=outline.title,
+            executive_summary=summary.executive_summary,
+            main_content=main_content,
+            conclusion=summary.conclusion
+        )
+
+    @traced("report.outline")
+    def _generate_outline(self, topic: str, tone: Optional[str], length: Optional[str]) -> Optional[ReportOutline]:
+        """Asks the LLM for the report outline."""
+        raw_response = self.llm_client.generate_response(build_outline_prompt(topic, tone, length), json_mode=True)
+        try:
+            outline = ReportOutline.model_validate(parse_json_response(raw_response))
+        except ValueError as e:
+            print(f"Error: Failed to parse the report outline: {e}")
+            return None
+        return outline if outline.sections else None
+
+    @traced("report.section")
+    def _generate_section(self, topic: str, title: str, section: OutlineSection, headings: List[str], tone: Optional[str], length: Optional[str]) -> str:
+        """Writes the body of one outline section. Failures are recorded in the section text."""
+        prompt = build_section_prompt(topic, title, section, headings, tone, length)
+        try:
+            return self.llm_client.generate_response(prompt)
+        except Exception as e:
+            print(f"Error: Failed to generate section '{section.heading}': {e}")
+            return f"This section could not be generated. Error Details: {e}"
+
+    @traced("report.summary")
+    def _generate_summary(self, title: str, main_content: str, tone: Optional[str]) -> ReportSummary:
+        """Writes the executive summary and conclusion from the finished sections."""
+        raw_response = self.llm_client.generate_response(build_summary_prompt(title, main_content, tone), json_mode=True)
+        try:
+            return ReportSummary.model_validate(parse_json_response(raw_response))
+        except ValueError as e:
+            print(f"Error: Failed to parse the report summary: {e}")
+            return ReportSummary(
+                executive_summary="The executive summary could not be generated. See the main report below.",
                 conclusion="No conclusion could be generated due to the parsing error."
             )
-        
-        # Save the result (either the report or an error report) to a .docx file
-        filepath = save_report_to_docx(report_output)
-        return filepath
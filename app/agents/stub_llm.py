@@ -0,0 +1,235 @@
+"""
+Deterministic local stand-in for a remote LLM, used for load testing and benchmarks.
+Selected with LLMClient(provider="stub") (or LLM_PROVIDER=stub for the backend); it needs no
+API key and no network. It recognises the prompts built by the agents and answers with
+schema-valid JSON (reports, outlines, summaries, articles, analyses, intents) or Markdown
+text, with configurable latency, token-rate streaming and error injection.
+
+Configuration (environment variables):
+    STUB_LLM_SEED             Seed for content and timing (default 0).
+    STUB_LLM_LATENCY_MS       Mean time to first token in milliseconds (default 200).
+    STUB_LLM_JITTER_MS        Spread of the latency distribution in milliseconds (default 50).
+    STUB_LLM_LATENCY_DIST     'fixed', 'uniform', 'normal' or 'lognormal' (default 'lognormal').
+    STUB_LLM_TOKENS_PER_SEC   Generation speed after the first token; 0 returns instantly (default 0).
+    STUB_LLM_ERROR_RATE       Probability (0-1) that a call fails like a provider error (default 0).
+    STUB_LLM_MALFORMED_RATE   Probability (0-1) that a JSON response is truncated (default 0).
+    STUB_LLM_PARAGRAPHS       Paragraphs per generated text body (default 4).
+"""
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+_WORDS = (
+    "revenue growth quarter market customer strategy operations team performance pipeline "
+    "forecast margin risk compliance delivery budget initiative stakeholder analysis trend "
+    "efficiency retention demand supply region product service investment outcome target "
+    "process quality review priority capacity roadmap partner channel baseline metric"
+).split()
+
+_LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "normal", "lognormal")
+_CHARS_PER_TOKEN = 4
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        print(f"Warning: Invalid value for {name}. Using {default}.")
+        return default
+
+
+class StubLLM:
+    """Generates deterministic, schema-valid responses for the agents' prompts."""
+
+    def __init__(
+        self,
+        seed: Optional[int] = None,
+        latency_ms: Optional[float] = None,
+        jitter_ms: Optional[float] = None,
+        latency_dist: Optional[str] = None,
+        tokens_per_sec: Optional[float] = None,
+        error_rate: Optional[float] = None,
+        malformed_rate: Optional[float] = None,
+        paragraphs: Optional[int] = None,
+    ):
+        """Arguments override the STUB_LLM_* environment variables (see module docstring)."""
+        self.seed = int(seed if seed is not None else _env_float("STUB_LLM_SEED", 0))
+        self.latency_ms = latency_ms if latency_ms is not None else _env_float("STUB_LLM_LATENCY_MS", 200)
+        self.jitter_ms = jitter_ms if jitter_ms is not None else _env_float("STUB_LLM_JITTER_MS", 50)
+        self.latency_dist = (latency_dist or os.getenv("STUB_LLM_LATENCY_DIST", "lognormal")).lower()
+        if self.latency_dist not in _LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Latency distribution '{self.latency_dist}' is not supported. Choose from {list(_LATENCY_DISTRIBUTIONS)}.")
+        self.tokens_per_sec = tokens_per_sec if tokens_per_sec is not None else _env_float("STUB_LLM_TOKENS_PER_SEC", 0)
+        self.error_rate = error_rate if error_rate is not None else _env_float("STUB_LLM_ERROR_RATE", 0)
+        self.malformed_rate = malformed_rate if malformed_rate is not None else _env_float("STUB_LLM_MALFORMED_RATE", 0)
+        self.paragraphs = int(paragraphs if paragraphs is not None else _env_float("STUB_LLM_PARAGRAPHS", 4))
+        # Timing and fault injection draw from one seeded sequence shared by all threads
+        self._rng = random.Random(self.seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    #  Public API (mirrors the provider calls of LLMClient)
+    def complete(self, prompt: str, system_prompt: Optional[str] = None, json_mode: bool = False) -> str:
+        """Returns the whole response after the simulated latency and generation time."""
+        delay, fail, malformed = self._draw()
+        text = self._respond(prompt, system_prompt, json_mode, malformed)
+        time.sleep(delay + self._generation_time(text))
+        if fail:
+            raise RuntimeError("Stub API request failed: injected error")
+        return text
+
+    def stream(self, prompt: str, system_prompt: Optional[str] = None, json_mode: bool = False) -> Iterator[str]:
+        """Yields the response in token-sized chunks at the configured token rate."""
+        delay, fail, malformed = self._draw()
+        text = self._respond(prompt, system_prompt, json_mode, malformed)
+        time.sleep(delay)
+        # Injected errors happen mid-stream, after part of the response was sent
+        fail_at = len(text) // 2 if fail else None
+        chunk_size = _CHARS_PER_TOKEN * 4
+        seconds_per_chunk = (chunk_size / _CHARS_PER_TOKEN) / self.tokens_per_sec if self.tokens_per_sec > 0 else 0
+        for start in range(0, len(text), chunk_size):
+            if fail_at is not None and start >= fail_at:
+                raise RuntimeError("Stub API request failed: injected error")
+            if seconds_per_chunk:
+                time.sleep(seconds_per_chunk)
+            yield text[start:start + chunk_size]
+
+    #  Timing and fault injection
+    def _draw(self):
+        with self._lock:
+            self.calls += 1
+            rng = self._rng
+            mean, spread = self.latency_ms, self.jitter_ms
+            if self.latency_dist == "fixed":
+                latency = mean
+            elif self.latency_dist == "uniform":
+                latency = rng.uniform(mean - spread, mean + spread)
+            elif self.latency_dist == "normal":
+                latency = rng.gauss(mean, spread)
+            else:
+                # Lognormal with the requested mean and standard deviation (long right tail)
+                if mean > 0:
+                    sigma2 = math.log(1 + (spread / mean) ** 2)
+                    latency = rng.lognormvariate(math.log(mean) - sigma2 / 2, math.sqrt(sigma2))
+                else:
+                    latency = 0
+            fail = rng.random() < self.error_rate
+            malformed = rng.random() < self.malformed_rate
+        return max(latency, 0) / 1000.0, fail, malformed
+
+    def _generation_time(self, text: str) -> float:
+        if self.tokens_per_sec <= 0:
+            return 0.0
+        return (len(text) / _CHARS_PER_TOKEN) / self.tokens_per_sec
+
+    #  Content generation
+    def _respond(self, prompt: str, system_prompt: Optional[str], json_mode: bool, malformed: bool) -> str:
+        # Content depends only on the seed and the prompt, so repeated prompts give identical output
+        digest = hashlib.sha256(f"{self.seed}\0{system_prompt or ''}\0{prompt}".encode("utf-8")).digest()
+        rng = random.Random(int.from_bytes(digest[:8], "big"))
+        payload = self._payload_for(prompt, system_prompt or "", rng)
+        if isinstance(payload, str):
+            return payload
+        text = json.dumps(payload, indent=2)
+        if malformed:
+            # Cut the response off like an interrupted completion
+            return text[:max(1, int(len(text) * rng.uniform(0.5, 0.95)))]
+        return text
+
+    def _payload_for(self, prompt: str, system_prompt: str, rng: random.Random) -> Any:
+        """Picks the response shape from markers in the agents' prompts."""
+        if "task-routing assistant" in system_prompt:
+            return self._intent(prompt)
+        if '"sections": [' in prompt:
+            return {
+                "title": self._title(prompt, rng),
+                "sections": [
+                    {"heading": self._sentence(rng, 3).rstrip(".").title(), "brief": self._sentence(rng, 14)}
+                    for _ in range(rng.randint(3, 6))
+                ],
+            }
+        if '"pandas_code_snippet"' in prompt or "'pandas_code_snippet'" in prompt:
+            return self._analysis(prompt, rng)
+        if '"main_content"' in prompt:
+            return {
+                "title": self._title(prompt, rng),
+                "executive_summary": self._paragraph(rng),
+                "main_content": "\n\n".join(
+                    f"## {self._sentence(rng, 3).rstrip('.').title()}\n\n{self._body(rng, 2)}"
+                    for _ in range(max(1, self.paragraphs // 2 + 1))
+                ),
+                "conclusion": self._paragraph(rng),
+            }
+        if '"executive_summary"' in prompt and '"conclusion"' in prompt:
+            return {"executive_summary": self._paragraph(rng), "conclusion": self._paragraph(rng)}
+        if '"content"' in prompt and '"title"' in prompt:
+            return {"title": self._title(prompt, rng), "content": self._body(rng, self.paragraphs)}
+        # Free text (document bodies, report sections)
+        return self._body(rng, self.paragraphs)
+
+    def _intent(self, instruction: str) -> Dict[str, Any]:
+        lower = instruction.lower()
+        if "analy" in lower:
+            file_match = re.search(r'(\S+\.(?:csv|xlsx|xls|json))', instruction)
+            return {"action": "analyse_data", "params": {"file": file_match.group(1)} if file_match else {}}
+        if "report" in lower:
+            return {"action": "create_report", "params": {"topic": instruction.strip()}}
+        if "article" in lower or "blog" in lower:
+            return {"action": "write_article", "params": {"topic": instruction.strip()}}
+        for doc_type, keywords in (("minutes", ("minutes",)), ("memo", ("memo",)), ("cover_letter", ("cover letter", "letter"))):
+            if any(keyword in lower for keyword in keywords):
+                return {"action": "create_document", "params": {"doc_type": doc_type, "topic": instruction.strip(), "audience": "Team"}}
+        return {"action": "unknown", "params": {}}
+
+    def _analysis(self, prompt: str, rng: random.Random) -> Dict[str, Any]:
+        columns = self._columns_from_prompt(prompt) or ["value"]
+        return {
+            "summary": self._paragraph(rng),
+            "insights": [self._sentence(rng, 12) for _ in range(rng.randint(3, 5))],
+            "recommended_visualizations": [
+                {
+                    "chart_type": rng.choice(["bar_chart", "boxplot", "scatter_plot", "histogram"]),
+                    "columns": rng.sample(columns, min(len(columns), 2)),
+                    "description": self._sentence(rng, 10),
+                }
+                for _ in range(2)
+            ],
+            "risk_flags": [self._sentence(rng, 8) for _ in range(rng.randint(1, 3))],
+            "pandas_code_snippet": f"df[{columns[0]!r}].describe()",
+        }
+
+    @staticmethod
+    def _columns_from_prompt(prompt: str) -> List[str]:
+        match = re.search(r'"column_names":\s*(\[[^\]]*\])', prompt)
+        if not match:
+            return []
+        try:
+            return [str(column) for column in json.loads(match.group(1))]
+        except json.JSONDecodeError:
+            return []
+
+    @staticmethod
+    def _title(prompt: str, rng: random.Random) -> str:
+        match = re.search(r'TOPIC:\s*"([^"]*)"', prompt)
+        topic = match.group(1).strip() if match and match.group(1).strip() else " ".join(rng.sample(_WORDS, 3))
+        return f"{topic[:80].title()}: {rng.choice(['Overview', 'Analysis', 'Review', 'Outlook'])}"
+
+    @staticmethod
+    def _sentence(rng: random.Random, words: int) -> str:
+        text = " ".join(rng.choice(_WORDS) for _ in range(words))
+        return text[0].upper() + text[1:] + "."
+
+    def _paragraph(self, rng: random.Random) -> str:
+        return " ".join(self._sentence(rng, rng.randint(8, 16)) for _ in range(rng.randint(3, 5)))
+
+    def _body(self, rng: random.Random, paragraphs: int) -> str:
+        blocks = [self._paragraph(rng) for _ in range(max(1, paragraphs))]
+        # Include a list so the Markdown renderer is exercised as with real output
+        blocks.insert(min(1, len(blocks)), "\n".join(f"- {self._sentence(rng, 6)}" for _ in range(3)))
+        return "\n\n".join(blocks)
@@ -0,0 +1,354 @@
+"""
+Lightweight request tracing.
+Stages are wrapped in spans (`with span("analyze.plots"):` or `@traced("report.create")`).
+Spans nest through contextvars, so every span of a request shares the request id and trace
+id. Finished spans go to listeners; the exporters here write them to a structured JSON log
+and to an OpenTelemetry (OTLP/JSON) file that collectors and trace viewers can import.
+"""
+import contextvars
+import functools
+import json
+import logging
+import logging.handlers
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+_current_request_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_request_id", default=None)
+
+# Listeners receive ("start" | "end", span)
+_listeners: List[Callable[[str, "Span"], None]] = []
+_listeners_lock = threading.Lock()
+# Chunk listeners receive (span, text) for each piece of a streamed LLM response
+_chunk_listeners: List[Callable[["Span", str], None]] = []
+
+
+class Span:
+    """A timed stage of a request."""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "request_id", "kind",
+                 "start_ns", "end_ns", "attributes", "status", "error", "_perf_start", "duration_ms")
+
+    def __init__(self, name: str, parent: Optional["Span"] = None, kind: str = "internal", attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.parent_id = parent.span_id if parent else None
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.request_id = _current_request_id.get() or (parent.request_id if parent else None)
+        self.kind = kind
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.status = "ok"
+        self.error: Optional[str] = None
+        self.start_ns = time.time_ns()
+        self._perf_start = time.perf_counter()
+        self.end_ns: Optional[int] = None
+        self.duration_ms: Optional[float] = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def set_error(self, error: BaseException):
+        self.status = "error"
+        self.error = f"{type(error).__name__}: {error}"
+
+    def end(self):
+        """Ends the span and notifies listeners. Ending twice has no effect."""
+        if self.end_ns is not None:
+            return
+        self.duration_ms = (time.perf_counter() - self._perf_start) * 1000.0
+        self.end_ns = self.start_ns + int(self.duration_ms * 1_000_000)
+        _notify("end", self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.start_ns / 1e9)),
+            "request_id": self.request_id,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "duration_ms": round(self.duration_ms, 3) if self.duration_ms is not None else None,
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+#  Listeners
+def add_span_listener(listener: Callable[[str, Span], None]):
+    """Registers a listener. Adding one that is already registered has no effect."""
+    with _listeners_lock:
+        if listener not in _listeners:
+            _listeners.append(listener)
+
+
+def remove_span_listener(listener: Callable[[str, Span], None]):
+    with _listeners_lock:
+        if listener in _listeners:
+            _listeners.remove(listener)
+
+
+def add_chunk_listener(listener: Callable[[Span, str], None]):
+    with _listeners_lock:
+        if listener not in _chunk_listeners:
+            _chunk_listeners.append(listener)
+
+
+def notify_chunk(span_obj: Span, text: str):
+    """Passes a streamed chunk of the response traced by `span_obj` to the chunk listeners."""
+    for listener in list(_chunk_listeners):
+        try:
+            listener(span_obj, text)
+        except Exception as e:
+            print(f"Warning: Chunk listener {listener!r} failed: {e}")
+
+
+def _notify(event: str, span_obj: Span):
+    for listener in list(_listeners):
+        try:
+            listener(event, span_obj)
+        except Exception as e:
+            # A broken exporter must never fail the request
+            print(f"Warning: Span listener {listener!r} failed: {e}")
+
+
+#  Span API
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def current_request_id() -> Optional[str]:
+    return _current_request_id.get()
+
+
+def set_attributes(**attributes):
+    """Adds attributes to the current span, if there is one. None values are skipped."""
+    span_obj = _current_span.get()
+    if span_obj is not None:
+        span_obj.attributes.update({key: value for key, value in attributes.items() if value is not None})
+
+
+def start_span(name: str, kind: str = "internal", **attributes) -> Span:
+    """
+    Starts a child of the current span without making it current. The caller must call
+    end(). Used where a context manager cannot be held, e.g. across a generator's yields.
+    """
+    span_obj = Span(name, parent=_current_span.get(), kind=kind, attributes=attributes)
+    _notify("start", span_obj)
+    return span_obj
+
+
+@contextmanager
+def span(name: str, kind: str = "internal", **attributes) -> Iterator[Span]:
+    """Runs the block as a span that is the parent of spans started inside it."""
+    span_obj = start_span(name, kind=kind, **attributes)
+    token = _current_span.set(span_obj)
+    try:
+        yield span_obj
+    except BaseException as e:
+        span_obj.set_error(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        span_obj.end()
+
+
+def traced(name: Optional[str] = None, **attributes):
+    """Decorator that runs the function in a span named `name` (default: its qualified name)."""
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name, **attributes):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def request_context(request_id: Optional[str] = None) -> Iterator[str]:
+    """Binds a request id (generated if not given) to everything traced inside the block."""
+    request_id = request_id or uuid.uuid4().hex
+    token = _current_request_id.set(request_id)
+    try:
+        yield request_id
+    finally:
+        _current_request_id.reset(token)
+
+
+def bind_context(func: Callable) -> Callable:
+    """
+    Wraps `func` so it runs with the caller's current span and request id, e.g. when it is
+    submitted to a ThreadPoolExecutor (worker threads do not inherit contextvars).
+    """
+    context = contextvars.copy_context()
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        # Each call gets its own copy, so the wrapper can run on several threads at once
+        return context.copy().run(func, *args, **kwargs)
+    return wrapper
+
+
+#  Spans of other processes
+def remote_context() -> Optional[Tuple[str, str, Optional[str]]]:
+    """The current span as (trace id, span id, request id), to continue the trace in another process."""
+    span_obj = _current_span.get()
+    if span_obj is None:
+        return None
+    return span_obj.trace_id, span_obj.span_id, span_obj.request_id
+
+
+@contextmanager
+def continue_trace(context: Optional[Tuple[str, str, Optional[str]]]) -> Iterator[None]:
+    """Runs the block as a child of the span described by remote_context() in another process."""
+    if context is None:
+        yield
+        return
+    parent = Span.__new__(Span)  # Stands in for the remote span; never ended or exported
+    parent.name, parent.attributes, parent.parent_id = "remote", {}, None
+    parent.trace_id, parent.span_id, parent.request_id = context
+    span_token = _current_span.set(parent)
+    request_token = _current_request_id.set(parent.request_id)
+    try:
+        yield
+    finally:
+        _current_request_id.reset(request_token)
+        _current_span.reset(span_token)
+
+
+def emit_span(event: str, span_obj: Span):
+    """Passes a span recorded in another process (e.g. an analysis worker) to this process's listeners."""
+    _notify(event, span_obj)
+
+
+#  Exporters
+def _file_logger(name: str, path: str, max_bytes: int, backups: int) -> logging.Logger:
+    """A logger that writes bare lines to a size-rotated file."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+    handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    return logger
+
+
+class JSONLogExporter:
+    """Writes one JSON object per finished span to a rotating log file."""
+
+    def __init__(self, path: str, max_bytes: int = 10 * 1024 * 1024, backups: int = 3):
+        self.path = path
+        self._logger = _file_logger(f"tracing.json.{path}", path, max_bytes, backups)
+
+    def __call__(self, event: str, span_obj: Span):
+        if event == "end":
+            self._logger.info(json.dumps(span_obj.to_dict(), default=str))
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class OTLPFileExporter:
+    """
+    Writes finished traces as OTLP/JSON ExportTraceServiceRequest lines (the format of the
+    OpenTelemetry Collector file exporter). Spans are buffered per trace and written
+    together when the root span ends.
+    """
+
+    _KINDS = {"internal": 1, "server": 2, "client": 3}
+    max_pending_traces = 1000
+
+    def __init__(self, path: str, service_name: str = "ai-office-backend", max_bytes: int = 20 * 1024 * 1024, backups: int = 3):
+        self.path = path
+        self.service_name = service_name
+        self._logger = _file_logger(f"tracing.otlp.{path}", path, max_bytes, backups)
+        self._pending: Dict[str, List[Span]] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, event: str, span_obj: Span):
+        if event != "end":
+            return
+        with self._lock:
+            spans = self._pending.setdefault(span_obj.trace_id, [])
+            spans.append(span_obj)
+            if span_obj.parent_id is not None:
+                # Drop the oldest traces whose root span never ended
+                while len(self._pending) > self.max_pending_traces:
+                    del self._pending[next(iter(self._pending))]
+                return
+            del self._pending[span_obj.trace_id]
+        self._logger.info(json.dumps(self._export_request(spans)))
+
+    def _otlp_span(self, span_obj: Span) -> Dict[str, Any]:
+        attributes = dict(span_obj.attributes)
+        if span_obj.request_id:
+            attributes["request.id"] = span_obj.request_id
+        data = {
+            "traceId": span_obj.trace_id,
+            "spanId": span_obj.span_id,
+            "name": span_obj.name,
+            "kind": self._KINDS.get(span_obj.kind, 1),
+            "startTimeUnixNano": str(span_obj.start_ns),
+            "endTimeUnixNano": str(span_obj.end_ns),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items()],
+            "status": {"code": 2, "message": span_obj.error or ""} if span_obj.status == "error" else {"code": 1},
+        }
+        if span_obj.parent_id:
+            data["parentSpanId"] = span_obj.parent_id
+        return data
+
+    def _export_request(self, spans: List[Span]) -> Dict[str, Any]:
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+                "scopeSpans": [{
+                    "scope": {"name": "app.agents.tracing"},
+                    "spans": [self._otlp_span(span_obj) for span_obj in spans],
+                }],
+            }]
+        }
+
+
+# Exporters registered by configure_from_env, by output file
+_configured_exporters: Dict[str, Callable[[str, Span], None]] = {}
+
+
+def configure_from_env():
+    """
+    Registers exporters from the environment:
+        TRACE_LOG_FILE   JSON span log (default logs/spans.jsonl; empty disables it)
+        TRACE_OTLP_FILE  OTLP/JSON trace file (default: disabled)
+    Calling it again (e.g. when the server module is imported a second time) adds no exporter
+    for a file that already has one, so spans are never written twice.
+    """
+    log_file = os.getenv("TRACE_LOG_FILE", os.path.join("logs", "spans.jsonl"))
+    otlp_file = os.getenv("TRACE_OTLP_FILE", "")
+    for path, exporter_class, description in ((log_file, JSONLogExporter, "span log"), (otlp_file, OTLPFileExporter, "OTLP traces")):
+        if not path:
+            continue
+        key = os.path.abspath(path)
+        with _listeners_lock:
+            if key in _configured_exporters:
+                continue
+            _configured_exporters[key] = exporter_class(path)
+        add_span_listener(_configured_exporters[key])
+        print(f"Tracing: writing {description} to {path}")
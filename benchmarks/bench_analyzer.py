@@ -0,0 +1,248 @@
+"""
+Micro-benchmarks for the analyzer stages (app/agents/analyzer.py) over synthetic tables.
+
+Builds a grid of tables with different row counts, numeric column counts, categorical column
+counts, categorical cardinality and NaN density. Each stage is timed on its own:
+    parse    try_parse_csv_or_table  (CSV text -> DataFrame)
+    summary  get_local_data_summary
+    stats    _perform_statistical_analysis
+    plots    _generate_plots
+    docx     _create_analysis_report_docx  (fixed LLM analysis text, generated plots)
+Peak traced memory for each stage is measured in a separate pass under tracemalloc, so the
+timings are not slowed by tracing. If a stage exceeds --stage-budget seconds, it is skipped
+for larger row counts of the same shape. The grid then shows which stage blows up first.
+
+Usage:
+    python -m benchmarks.bench_analyzer --preset quick
+    python -m benchmarks.bench_analyzer --rows 1000 100000 1000000 --numeric-cols 2 50 --cardinality 10 10000
+    python -m benchmarks.bench_analyzer --preset quick --compare benchmarks/results/bench_analyzer_<commit>_<time>.json
+"""
+import argparse
+import gc
+import itertools
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Tuple
+
+import matplotlib
+matplotlib.use("Agg")  # Headless plotting
+import numpy as np
+import pandas as pd
+
+# Allow running as a plain script as well as with -m
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.common import compare_results, load_result, new_result, write_result
+from app.agents.analyzer import (AnalysisOutput, VisualizationRecommendation, _create_analysis_report_docx,
+                                 _generate_plots, _perform_statistical_analysis, get_local_data_summary,
+                                 try_parse_csv_or_table)
+
+STAGES = ("parse", "summary", "stats", "plots", "docx")
+
+PRESETS = {
+    "quick": {"rows": [1000, 10000], "numeric_cols": [2, 10], "categorical_cols": [1], "cardinality": [5], "nan_density": [0.0, 0.05]},
+    "default": {"rows": [1000, 10000, 100000], "numeric_cols": [2, 10, 50], "categorical_cols": [1, 3], "cardinality": [5, 1000], "nan_density": [0.0, 0.1]},
+    "full": {"rows": [1000, 10000, 100000, 1000000, 5000000], "numeric_cols": [2, 10, 50, 200, 500], "categorical_cols": [1, 5], "cardinality": [5, 1000, 100000], "nan_density": [0.0, 0.1, 0.3]},
+}
+
+
+def make_table(rows: int, numeric_cols: int, categorical_cols: int, cardinality: int, nan_density: float, seed: int = 0) -> pd.DataFrame:
+    """Generates a deterministic synthetic table with the requested shape."""
+    rng = np.random.default_rng(seed)
+    columns: Dict[str, Any] = {}
+    for i in range(numeric_cols):
+        # Mix of scales and some correlation with the first column, like real business data
+        values = rng.normal(loc=100 * (i + 1), scale=10 * (i + 1), size=rows)
+        if i and i % 3 == 0:
+            values = values + 0.5 * columns["num_0"]
+        columns[f"num_{i}"] = values
+    for i in range(categorical_cols):
+        codes = rng.integers(0, max(1, cardinality), size=rows)
+        columns[f"cat_{i}"] = pd.Categorical.from_codes(codes % max(1, cardinality), [f"c{k}" for k in range(max(1, cardinality))]).astype(object)
+    df = pd.DataFrame(columns)
+    if nan_density > 0:
+        mask = rng.random(df.shape) < nan_density
+        df = df.mask(mask)
+    return df
+
+
+def _fixed_analysis(statistical_results, plot_paths: List[str], columns: List[str]) -> AnalysisOutput:
+    """Analysis text of a typical size, standing in for the LLM response."""
+    sentence = "Revenue grew steadily across regions while costs remained within the planned range. "
+    return AnalysisOutput(
+        summary=sentence * 6,
+        insights=[sentence.strip()] * 5,
+        recommended_visualizations=[
+            VisualizationRecommendation(chart_type="bar_chart", columns=columns[:2], description=sentence.strip())
+        ],
+        risk_flags=[sentence.strip()] * 2,
+        pandas_code_snippet="df.describe()",
+        statistical_results=statistical_results,
+        plot_image_paths=plot_paths,
+    )
+
+
+def _stage_calls(csv_text: str, workdir: str) -> List[Tuple[str, Callable[[Dict[str, Any]], Any]]]:
+    """Returns the stages in order; each receives the outputs of the previous ones."""
+    plot_dir = os.path.join(workdir, "plots")
+
+    def parse(state):
+        state["df"] = try_parse_csv_or_table(csv_text)
+        if state["df"] is None:
+            raise RuntimeError("The synthetic table could not be parsed.")
+
+    def summary(state):
+        state["summary"] = get_local_data_summary(state["df"])
+
+    def stats(state):
+        state["stats"] = _perform_statistical_analysis(state["df"])
+
+    def plots(state):
+        shutil.rmtree(plot_dir, ignore_errors=True)
+        os.makedirs(plot_dir)
+        state["plots"] = _generate_plots(state["df"], plot_dir)
+
+    def docx(state):
+        analysis = _fixed_analysis(state.get("stats"), state.get("plots", []), list(state["df"].columns))
+        _create_analysis_report_docx(state["df"], analysis, os.path.join(workdir, "report.docx"), plot_dir)
+
+    return [("parse", parse), ("summary", summary), ("stats", stats), ("plots", plots), ("docx", docx)]
+
+
+def _quiet(call: Callable, *args):
+    """Runs a stage with its progress prints suppressed."""
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        return call(*args)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+
+def run_case(csv_text: str, stages: List[str], repeat: int, measure_memory: bool, skip: set) -> Dict[str, Dict[str, Any]]:
+    """Times every selected stage (median of `repeat` runs) and optionally its peak memory."""
+    workdir = tempfile.mkdtemp(prefix="bench_analyzer_")
+    results: Dict[str, Dict[str, Any]] = {}
+    try:
+        calls = _stage_calls(csv_text, workdir)
+        timings: Dict[str, List[float]] = {name: [] for name, _ in calls}
+        for _ in range(repeat):
+            state: Dict[str, Any] = {}
+            for name, call in calls:
+                # Later stages need the DataFrame, so parse always runs
+                if name != "parse" and (name not in stages or name in skip):
+                    continue
+                gc.collect()
+                started = time.perf_counter()
+                _quiet(call, state)
+                timings[name].append(time.perf_counter() - started)
+
+        for name, _ in calls:
+            if name in stages and name in skip:
+                results[name] = {"skipped": "budget"}
+            elif name in stages and timings[name]:
+                results[name] = {"seconds": round(statistics.median(timings[name]), 4)}
+
+        if measure_memory:
+            state = {}
+            for name, call in calls:
+                if name != "parse" and (name not in stages or name in skip):
+                    continue
+                gc.collect()
+                tracemalloc.start()
+                _quiet(call, state)
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                if name in results and "seconds" in results[name]:
+                    results[name]["peak_mb"] = round(peak / (1024 * 1024), 2)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def _case_name(rows: int, numeric_cols: int, categorical_cols: int, cardinality: int, nan_density: float) -> str:
+    return f"rows={rows},num={numeric_cols},cat={categorical_cols},card={cardinality},nan={nan_density:g}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for the analyzer stages over synthetic tables.")
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="default", help="Grid used for axes that are not given explicitly.")
+    parser.add_argument("--rows", type=int, nargs="+", help="Row counts.")
+    parser.add_argument("--numeric-cols", type=int, nargs="+", help="Numeric column counts.")
+    parser.add_argument("--categorical-cols", type=int, nargs="+", help="Categorical column counts.")
+    parser.add_argument("--cardinality", type=int, nargs="+", help="Distinct values per categorical column.")
+    parser.add_argument("--nan-density", type=float, nargs="+", help="Fraction of cells set to NaN (0-1).")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES), help="Stages to measure.")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per case; the median is reported.")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc peak-memory pass.")
+    parser.add_argument("--stage-budget", type=float, default=120.0, help="Skip a stage for larger row counts once it takes longer than this (seconds).")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the synthetic data.")
+    parser.add_argument("--output", "-o", help="Result file (default: benchmarks/results/bench_analyzer_<commit>_<time>.json).")
+    parser.add_argument("--compare", help="Baseline result file to compare this run against.")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Regression threshold in percent for --compare.")
+    args = parser.parse_args()
+
+    preset = PRESETS[args.preset]
+    grid = {
+        "rows": sorted(args.rows or preset["rows"]),
+        "numeric_cols": args.numeric_cols or preset["numeric_cols"],
+        "categorical_cols": args.categorical_cols or preset["categorical_cols"],
+        "cardinality": args.cardinality or preset["cardinality"],
+        "nan_density": args.nan_density or preset["nan_density"],
+    }
+    config = dict(grid, stages=args.stages, repeat=args.repeat, memory=not args.no_memory,
+                  stage_budget=args.stage_budget, seed=args.seed, pandas=pd.__version__, numpy=np.__version__)
+    result = new_result("bench_analyzer", config)
+
+    print(f"{'case':<52}" + "".join(f"{stage:>16}" for stage in args.stages))
+    # Rows vary fastest, so the budget check sees growing tables of the same shape
+    shapes = itertools.product(grid["numeric_cols"], grid["categorical_cols"], grid["cardinality"], grid["nan_density"])
+    for numeric_cols, categorical_cols, cardinality, nan_density in shapes:
+        over_budget: set = set()
+        for rows in grid["rows"]:
+            name = _case_name(rows, numeric_cols, categorical_cols, cardinality, nan_density)
+            if "parse" in over_budget:
+                # Every stage needs the parsed table, so the whole case is skipped
+                result["results"][name] = {"rows": rows, "skipped": "budget"}
+                print(f"{name:<52}{'skipped (parse over budget)':>32}")
+                continue
+            df = make_table(rows, numeric_cols, categorical_cols, cardinality, nan_density, args.seed)
+            csv_text = df.to_csv(index=False)
+            del df
+            stages = run_case(csv_text, args.stages, args.repeat, not args.no_memory, over_budget)
+            result["results"][name] = {
+                "rows": rows,
+                "numeric_cols": numeric_cols,
+                "categorical_cols": categorical_cols,
+                "cardinality": cardinality,
+                "nan_density": nan_density,
+                "csv_mb": round(len(csv_text) / (1024 * 1024), 2),
+                "stages": stages,
+            }
+            cells = []
+            for stage in args.stages:
+                entry = stages.get(stage, {})
+                if "seconds" in entry:
+                    memory = f"/{entry['peak_mb']:.0f}M" if "peak_mb" in entry else ""
+                    cells.append(f"{entry['seconds']:>9.3f}s{memory:>6}")
+                    if entry["seconds"] > args.stage_budget:
+                        over_budget.add(stage)
+                else:
+                    cells.append(f"{entry.get('skipped', '-'):>16}")
+            print(f"{name:<52}" + "".join(cells))
+
+    write_result(result, args.output)
+    if args.compare:
+        metrics = {f"stages.{stage}.seconds": False for stage in args.stages}
+        metrics.update({f"stages.{stage}.peak_mb": False for stage in args.stages})
+        if compare_results(load_result(args.compare), result, metrics, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
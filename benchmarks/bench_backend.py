@@ -0,0 +1,298 @@
+"""
+End-to-end load benchmark for the backend server (wps_addin/backend_server.py).
+
+By default a backend is launched on a free port with LLM_PROVIDER=stub, so the run needs no
+network and no API key, and its latency comes from the server rather than a remote model.
+Every endpoint is driven at a fixed concurrency (closed loop). For each endpoint the script
+records p50/p95/p99 latency, throughput, error counts, and server RSS/CPU (with psutil).
+It writes a JSON result file that can be compared with an earlier run.
+
+Usage:
+    python -m benchmarks.bench_backend
+    python -m benchmarks.bench_backend --concurrency 16 --requests 200 --endpoints create_memo download
+    python -m benchmarks.bench_backend --url http://127.0.0.1:8000 --pid 4242
+    python -m benchmarks.bench_backend --compare benchmarks/results/bench_backend_<commit>_<time>.json
+
+Each request carries a unique nonce in one text field, so the backend's coalescing of identical
+in-flight requests (wps_addin/single_flight.py) does not turn the load into a few shared runs.
+--identical-payloads sends the same payload every time, to measure that coalescing instead.
+"""
+import argparse
+import itertools
+import os
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+import requests
+
+# Allow running as a plain script as well as with -m
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.common import (REPO_ROOT, ResourceSampler, compare_results, latency_summary,
+                               load_result, new_result, write_result)
+
+# Metrics checked by --compare (True = higher is better)
+COMPARE_METRICS = {
+    "latency_ms.p50": False,
+    "latency_ms.p95": False,
+    "latency_ms.p99": False,
+    "throughput_rps": True,
+}
+
+
+def _sample_csv(rows: int) -> str:
+    """Deterministic CSV with numeric and categorical columns for /analyze."""
+    lines = ["region,units,revenue,cost,channel"]
+    for i in range(rows):
+        lines.append(f"{['North', 'South', 'East', 'West'][i % 4]},{10 + (i * 7) % 90},{1000 + (i * 37) % 5000},{400 + (i * 23) % 2000},{['web', 'store'][i % 2]}")
+    return "\n".join(lines)
+
+
+def _document_payload(doc_type: str) -> Dict[str, Any]:
+    return {
+        "doc_type": doc_type,
+        "topic": "Quarterly planning for the operations team",
+        "audience": "Operations Team",
+        "tone": "formal",
+        "length": "medium",
+        "data_sources": ["Budget is 5% under plan", "Two new hires start in May"],
+    }
+
+
+class Scenario:
+    """One benchmarked endpoint: how to call it and how to prepare for it."""
+
+    def __init__(self, name: str, method: str, path: str, payload: Optional[Dict[str, Any]] = None,
+                 prepare: Optional[Callable[[requests.Session, str], str]] = None, vary: Optional[str] = None):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.payload = payload
+        # prepare(session, base_url) returns the final path (e.g. a concrete download URL)
+        self.prepare = prepare
+        # Text field of the payload that gets the per-request nonce
+        self.vary = vary
+
+    def payload_for(self, number: int, identical: bool = False) -> Optional[Dict[str, Any]]:
+        """The payload of request `number`: unique per request unless `identical` is set."""
+        if self.payload is None or self.vary is None or identical:
+            return self.payload
+        return dict(self.payload, **{self.vary: f"{self.payload[self.vary]} (request {number})"})
+
+
+def _prepare_download(session: requests.Session, base_url: str) -> str:
+    """Generates one document and returns the path of its download link."""
+    response = session.post(f"{base_url}/create_memo", json=_document_payload("memo"), timeout=300)
+    response.raise_for_status()
+    match = re.search(r'/download/(\S+)', response.json().get("result", ""))
+    if not match:
+        raise RuntimeError("Could not find a download link in the /create_memo response.")
+    return f"/download/{match.group(1)}"
+
+
+def build_scenarios(csv_rows: int) -> Dict[str, Scenario]:
+    scenarios = [
+        Scenario("process", "POST", "/process", {"prompt": "Write a short welcome note for new team members."}, vary="prompt"),
+        Scenario("summarize", "POST", "/summarize", {"prompt": "Summarize", "content": "The project is on track. " * 200}, vary="content"),
+        Scenario("analyze", "POST", "/analyze", {"prompt": "Which region performs best?", "content": _sample_csv(csv_rows)}, vary="prompt"),
+        Scenario("create_report", "POST", "/create_report", {"prompt": "Q3 sales performance"}, vary="prompt"),
+        Scenario("create_memo", "POST", "/create_memo", _document_payload("memo"), vary="topic"),
+        Scenario("create_minutes", "POST", "/create_minutes", _document_payload("minutes"), vary="topic"),
+        Scenario("create_cover_letter", "POST", "/create_cover_letter", _document_payload("cover_letter"), vary="topic"),
+        Scenario("generate_document", "POST", "/generate_document", _document_payload("memo"), vary="topic"),
+        Scenario("download", "GET", "/download/{file}", prepare=_prepare_download),
+    ]
+    return {scenario.name: scenario for scenario in scenarios}
+
+
+#  Backend process
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def launch_backend(port: int, workdir: str, stub_env: Dict[str, str]) -> subprocess.Popen:
+    """Starts the backend with uvicorn (no reload) using the stub LLM provider."""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = REPO_ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    env["LLM_PROVIDER"] = "stub"
+    env.update(stub_env)
+    log = open(os.path.join(workdir, "backend.log"), "w")
+    # The server writes generated files relative to its working directory
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "wps_addin.backend_server:app",
+         "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+
+
+def wait_until_ready(base_url: str, timeout: float, process: Optional[subprocess.Popen] = None):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Backend exited with code {process.returncode} during startup.")
+        try:
+            if requests.get(f"{base_url}/", timeout=2).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Backend at {base_url} did not become ready within {timeout:.0f}s.")
+
+
+#  Load generation
+def run_scenario(base_url: str, scenario: Scenario, concurrency: int, total: int, warmup: int,
+                 timeout: float, sampler: ResourceSampler, identical_payloads: bool = False) -> Dict[str, Any]:
+    """Sends `total` requests with `concurrency` in flight and returns the case statistics."""
+    local = threading.local()
+    numbers = itertools.count(1)
+
+    def session() -> requests.Session:
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        return local.session
+
+    path = scenario.prepare(session(), base_url) if scenario.prepare else scenario.path
+    url = base_url + path
+
+    def call() -> tuple:
+        payload = scenario.payload_for(next(numbers), identical_payloads)
+        started = time.perf_counter()
+        try:
+            response = session().request(scenario.method, url, json=payload, timeout=timeout)
+            status = response.status_code
+            _ = response.content
+        except requests.RequestException as e:
+            status = type(e).__name__
+        return time.perf_counter() - started, status
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f"bench-{scenario.name}") as executor:
+        list(executor.map(lambda _: call(), range(warmup)))
+        sampler.mark()
+        started = time.perf_counter()
+        outcomes = list(executor.map(lambda _: call(), range(total)))
+        wall = time.perf_counter() - started
+    resources = sampler.window()
+
+    ok_latencies = [latency for latency, status in outcomes if status == 200]
+    statuses: Dict[str, int] = {}
+    for _, status in outcomes:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    result = {
+        "method": scenario.method,
+        "path": scenario.path,
+        "concurrency": concurrency,
+        "requests": total,
+        "ok": len(ok_latencies),
+        "errors": total - len(ok_latencies),
+        "status_counts": statuses,
+        "duration_s": round(wall, 3),
+        "throughput_rps": round(len(ok_latencies) / wall, 3) if wall else 0.0,
+        "latency_ms": latency_summary(ok_latencies),
+    }
+    result.update(resources)
+    if resources["cpu_seconds"] is not None and ok_latencies:
+        result["cpu_ms_per_request"] = round(1000.0 * resources["cpu_seconds"] / len(ok_latencies), 3)
+    return result
+
+
+def _print_case(name: str, case: Dict[str, Any]):
+    latency = case["latency_ms"] or {}
+    resources = ""
+    if case.get("rss_mb_peak") is not None:
+        resources = f"  rss={case['rss_mb_peak']:.0f}MB cpu={case['cpu_percent_mean']:.0f}%"
+    print(f"{name:<22} ok={case['ok']:>5}/{case['requests']:<5} rps={case['throughput_rps']:>8.2f}  "
+          f"p50={latency.get('p50', float('nan')):>8.1f}ms p95={latency.get('p95', float('nan')):>8.1f}ms "
+          f"p99={latency.get('p99', float('nan')):>8.1f}ms{resources}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end load benchmark for the backend server.")
+    parser.add_argument("--url", help="Benchmark an already running backend instead of launching one.")
+    parser.add_argument("--pid", type=int, help="PID of the backend given with --url, for RSS/CPU sampling.")
+    parser.add_argument("--endpoints", nargs="+", help="Endpoints to run (default: all).")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight (default: 8).")
+    parser.add_argument("--requests", type=int, default=100, help="Measured requests per endpoint (default: 100).")
+    parser.add_argument("--warmup", type=int, default=5, help="Unmeasured requests per endpoint (default: 5).")
+    parser.add_argument("--timeout", type=float, default=300, help="Per-request timeout in seconds.")
+    parser.add_argument("--csv-rows", type=int, default=200, help="Rows in the /analyze sample table.")
+    parser.add_argument("--stub-latency-ms", default="200", help="STUB_LLM_LATENCY_MS for the launched backend.")
+    parser.add_argument("--stub-tokens-per-sec", default="0", help="STUB_LLM_TOKENS_PER_SEC for the launched backend.")
+    parser.add_argument("--stub-error-rate", default="0", help="STUB_LLM_ERROR_RATE for the launched backend.")
+    parser.add_argument("--output", "-o", help="Result file (default: benchmarks/results/bench_backend_<commit>_<time>.json).")
+    parser.add_argument("--compare", help="Baseline result file to compare this run against.")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Regression threshold in percent for --compare.")
+    parser.add_argument("--keep-workdir", action="store_true", help="Keep the launched backend's working directory and log.")
+    parser.add_argument("--identical-payloads", action="store_true", help="Send the same payload every time (measures request coalescing, not throughput).")
+    args = parser.parse_args()
+
+    scenarios = build_scenarios(args.csv_rows)
+    selected = args.endpoints or list(scenarios)
+    unknown = [name for name in selected if name not in scenarios]
+    if unknown:
+        parser.error(f"Unknown endpoints: {unknown}. Choose from {list(scenarios)}.")
+
+    stub_env = {
+        "STUB_LLM_LATENCY_MS": args.stub_latency_ms,
+        "STUB_LLM_TOKENS_PER_SEC": args.stub_tokens_per_sec,
+        "STUB_LLM_ERROR_RATE": args.stub_error_rate,
+    }
+    process, workdir = None, None
+    if args.url:
+        base_url, pid = args.url.rstrip("/"), args.pid
+    else:
+        workdir = tempfile.mkdtemp(prefix="bench_backend_")
+        port = _free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        print(f"Launching backend (stub LLM) on {base_url}, working directory {workdir}")
+        process = launch_backend(port, workdir, stub_env)
+        pid = process.pid
+
+    config = {
+        "url": args.url,
+        "endpoints": selected,
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "warmup": args.warmup,
+        "csv_rows": args.csv_rows,
+        "identical_payloads": args.identical_payloads,
+        "stub": None if args.url else stub_env,
+    }
+    result = new_result("bench_backend", config)
+    sampler = ResourceSampler(pid)
+    try:
+        wait_until_ready(base_url, timeout=120, process=process)
+        sampler.start()
+        for name in selected:
+            case = run_scenario(base_url, scenarios[name], args.concurrency, args.requests, args.warmup, args.timeout,
+                                sampler, args.identical_payloads)
+            result["results"][name] = case
+            _print_case(name, case)
+    finally:
+        sampler.stop()
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if workdir and not args.keep_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    write_result(result, args.output)
+    if args.compare:
+        regressed = compare_results(load_result(args.compare), result, COMPARE_METRICS, args.threshold)
+        if regressed:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
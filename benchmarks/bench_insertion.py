@@ -0,0 +1,90 @@
+"""
+Benchmark of inserting long results into a document: one Selection.TypeText call (the old
+behaviour) against the chunked RangeWriter (wps_addin/document_writer.py).
+
+Runs against FakeDocument (benchmarks/common.py), an in-memory document with a simple COM cost model, so it works
+on any machine. The model (fixed cost per call, cost per character, and a higher per-character
+cost for TypeText) can be tuned with the options to match timings measured against real WPS.
+Reported per case: total time, throughput, number of COM calls, and the slowest single call.
+The slowest call is how long WPS is frozen at most, because it cannot repaint during a call.
+
+Usage:
+    python -m benchmarks.bench_insertion
+    python -m benchmarks.bench_insertion --sizes 10000 100000 --typing-us-per-char 40
+    python -m benchmarks.bench_insertion --compare benchmarks/results/bench_insertion_<commit>_<time>.json
+"""
+import argparse
+import os
+import sys
+from typing import Any, Dict
+
+# Allow running as a plain script as well as with -m
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.common import FakeDocument, compare_results, load_result, new_result, write_result
+from wps_addin.document_writer import RangeWriter, TypeTextWriter
+
+WRITERS = ("typetext", "range")
+
+
+def make_text(chars: int) -> str:
+    """Report-like text: paragraphs of a few sentences each."""
+    sentence = "Revenue grew steadily across regions while costs remained within the planned range. "
+    paragraph = sentence * 5 + "\n"
+    return (paragraph * (chars // len(paragraph) + 1))[:chars]
+
+
+def run_case(writer_name: str, text: str, args) -> Dict[str, Any]:
+    document = FakeDocument(
+        "Existing content.\r",
+        call_overhead=args.call_overhead_ms / 1000.0,
+        per_char=args.us_per_char / 1e6,
+        typing_per_char=args.typing_us_per_char / 1e6,
+    )
+    if writer_name == "typetext":
+        writer = TypeTextWriter(document.Selection)
+    else:
+        writer = RangeWriter(document, document.Selection, target_call_seconds=args.target_call_ms / 1000.0, yield_seconds=0.0)
+    stats = writer.write(text)
+    inserted = text.replace("\n", "\r") if writer_name == "range" else text
+    assert document.text == "Existing content.\r" + inserted, "insertion lost or reordered text"
+    return {
+        "seconds": round(stats.seconds, 4),
+        "chars_per_second": round(stats.chars_per_second, 1),
+        "com_calls": document.calls,
+        "slowest_call_ms": round(stats.slowest_call * 1000.0, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark chunked Range insertion against TypeText on a fake document.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[2000, 20000, 100000], help="Characters inserted per case.")
+    parser.add_argument("--writers", nargs="+", choices=WRITERS, default=list(WRITERS), help="Writers to compare.")
+    parser.add_argument("--call-overhead-ms", type=float, default=2.0, help="Modelled cost of one COM call.")
+    parser.add_argument("--us-per-char", type=float, default=0.5, help="Modelled cost per character inserted through a Range.")
+    parser.add_argument("--typing-us-per-char", type=float, default=20.0, help="Modelled cost per character of TypeText.")
+    parser.add_argument("--target-call-ms", type=float, default=50.0, help="RangeWriter's target duration per call.")
+    parser.add_argument("--output", "-o", help="Result file (default: benchmarks/results/bench_insertion_<commit>_<time>.json).")
+    parser.add_argument("--compare", help="Baseline result file to compare this run against.")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Regression threshold in percent for --compare.")
+    args = parser.parse_args()
+
+    result = new_result("bench_insertion", {key: value for key, value in vars(args).items() if key not in ("output", "compare")})
+    print(f"{'case':<20}{'seconds':>10}{'chars/s':>14}{'calls':>8}{'slowest ms':>12}")
+    for size in args.sizes:
+        text = make_text(size)
+        for writer_name in args.writers:
+            case = f"{writer_name}_{size}"
+            entry = run_case(writer_name, text, args)
+            result["results"][case] = entry
+            print(f"{case:<20}{entry['seconds']:>10.3f}{entry['chars_per_second']:>14,.0f}{entry['com_calls']:>8}{entry['slowest_call_ms']:>12.1f}")
+
+    write_result(result, args.output)
+    if args.compare:
+        regressed = compare_results(load_result(args.compare), result, {
+            "seconds": False, "chars_per_second": True, "slowest_call_ms": False,
+        }, args.threshold)
+        sys.exit(1 if regressed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+"""
+Helpers shared by the benchmark scripts: latency statistics, process resource sampling,
+machine-readable result files that can be compared across commits, and an in-memory stand-in
+for a WPS document (also used by the tests).
+"""
+import datetime
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+try:
+    import psutil  # Optional: RSS and CPU sampling
+except ImportError:
+    psutil = None
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+RESULT_SCHEMA_VERSION = 1
+
+
+#  Statistics
+def percentile(values: Sequence[float], pct: float) -> float:
+    """Percentile with linear interpolation between closest ranks (same as numpy's default)."""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100.0
+    low, high = math.floor(rank), math.ceil(rank)
+    if low == high:
+        return ordered[int(rank)]
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def latency_summary(seconds: Sequence[float]) -> Dict[str, float]:
+    """Summarises latencies (given in seconds) in milliseconds."""
+    if not seconds:
+        return {}
+    millis = [value * 1000.0 for value in seconds]
+    return {
+        "min": round(min(millis), 3),
+        "mean": round(sum(millis) / len(millis), 3),
+        "p50": round(percentile(millis, 50), 3),
+        "p95": round(percentile(millis, 95), 3),
+        "p99": round(percentile(millis, 99), 3),
+        "max": round(max(millis), 3),
+    }
+
+
+#  Resource sampling
+class ResourceSampler:
+    """
+    Samples RSS and CPU of a process (and its children) on a background thread.
+
+    Use mark() to start a measurement window and window() to read peak RSS, mean CPU
+    percentage and CPU seconds consumed since the mark. Without psutil every reading is None.
+    """
+
+    def __init__(self, pid: Optional[int], interval: float = 0.2):
+        self.interval = interval
+        self._process = psutil.Process(pid) if (psutil and pid) else None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._rss_peak = 0
+        self._cpu_samples: List[float] = []
+        self._cpu_mark = 0.0
+        self._time_mark = 0.0
+
+    @property
+    def available(self) -> bool:
+        return self._process is not None
+
+    def _processes(self) -> list:
+        try:
+            return [self._process] + self._process.children(recursive=True)
+        except psutil.Error:
+            return []
+
+    def _cpu_seconds(self) -> float:
+        total = 0.0
+        for process in self._processes():
+            try:
+                times = process.cpu_times()
+                total += times.user + times.system
+            except psutil.Error:
+                pass
+        return total
+
+    def _rss(self) -> int:
+        total = 0
+        for process in self._processes():
+            try:
+                total += process.memory_info().rss
+            except psutil.Error:
+                pass
+        return total
+
+    def start(self):
+        if not self.available:
+            return
+        self.mark()
+        self._thread = threading.Thread(target=self._run, name="resource-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+
+    def _run(self):
+        last_cpu, last_time = self._cpu_seconds(), time.perf_counter()
+        while not self._stop.wait(self.interval):
+            cpu, now = self._cpu_seconds(), time.perf_counter()
+            rss = self._rss()
+            with self._lock:
+                self._rss_peak = max(self._rss_peak, rss)
+                if now > last_time:
+                    self._cpu_samples.append(100.0 * (cpu - last_cpu) / (now - last_time))
+            last_cpu, last_time = cpu, now
+
+    def mark(self):
+        """Starts a new measurement window."""
+        if not self.available:
+            return
+        with self._lock:
+            self._rss_peak = self._rss()
+            self._cpu_samples = []
+        self._cpu_mark = self._cpu_seconds()
+        self._time_mark = time.perf_counter()
+
+    def window(self) -> Dict[str, Optional[float]]:
+        """Resource usage since the last mark()."""
+        if not self.available:
+            return {"rss_mb_peak": None, "cpu_percent_mean": None, "cpu_seconds": None}
+        cpu_seconds = self._cpu_seconds() - self._cpu_mark
+        elapsed = time.perf_counter() - self._time_mark
+        with self._lock:
+            rss_peak = max(self._rss_peak, self._rss())
+            samples = list(self._cpu_samples)
+        cpu_mean = sum(samples) / len(samples) if samples else (100.0 * cpu_seconds / elapsed if elapsed else 0.0)
+        return {
+            "rss_mb_peak": round(rss_peak / (1024 * 1024), 2),
+            "cpu_percent_mean": round(cpu_mean, 1),
+            "cpu_seconds": round(cpu_seconds, 3),
+        }
+
+
+#  Result files
+def git_revision() -> Dict[str, Any]:
+    """Returns the current commit and whether the working tree has local changes."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, timeout=10).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_ROOT, capture_output=True, text=True, timeout=30).stdout.strip())
+        return {"commit": commit or None, "dirty": dirty}
+    except (OSError, subprocess.SubprocessError):
+        return {"commit": None, "dirty": None}
+
+
+def environment_info() -> Dict[str, Any]:
+    return {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "psutil": psutil is not None,
+    }
+
+
+def new_result(benchmark: str, config: Dict[str, Any]) -> Dict[str, Any]:
+    """Creates the common envelope of a result file."""
+    return {
+        "schema": RESULT_SCHEMA_VERSION,
+        "benchmark": benchmark,
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "git": git_revision(),
+        "environment": environment_info(),
+        "config": config,
+        "results": {},
+    }
+
+
+def write_result(result: Dict[str, Any], output: Optional[str] = None) -> str:
+    """Writes a result file. The default name contains the benchmark, commit and time."""
+    if not output:
+        commit = (result["git"].get("commit") or "nogit")[:10]
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        output = os.path.join(RESULTS_DIR, f"{result['benchmark']}_{commit}_{timestamp}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    print(f"Results written to: {output}")
+    return output
+
+
+def load_result(path: str) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _lookup(entry: Dict[str, Any], metric: str) -> Optional[float]:
+    value: Any = entry
+    for part in metric.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value if isinstance(value, (int, float)) else None
+
+
+def compare_results(baseline: Dict[str, Any], current: Dict[str, Any], metrics: Dict[str, bool], threshold_pct: float = 10.0) -> bool:
+    """
+    Prints a per-case comparison of two result files and returns True if any metric
+    regressed by more than `threshold_pct`.
+
+    Args:
+        metrics: Dotted metric paths inside each case (e.g. 'latency_ms.p95') mapped to
+            True when higher is better (throughput) and False when lower is better.
+    """
+    base_commit = (baseline.get("git", {}).get("commit") or "?")[:10]
+    current_commit = (current.get("git", {}).get("commit") or "?")[:10]
+    print(f"\nComparison: {base_commit} (baseline) -> {current_commit} (current), threshold {threshold_pct:.0f}%")
+    print(f"{'case':<28}{'metric':<22}{'baseline':>12}{'current':>12}{'change':>10}")
+    regressed = False
+    for case, entry in current.get("results", {}).items():
+        base_entry = baseline.get("results", {}).get(case)
+        if base_entry is None:
+            print(f"{case:<28}{'(new case)':<22}")
+            continue
+        for metric, higher_is_better in metrics.items():
+            old, new = _lookup(base_entry, metric), _lookup(entry, metric)
+            if old is None or new is None:
+                continue
+            change = ((new - old) / old * 100.0) if old else 0.0
+            worse = (change < -threshold_pct) if higher_is_better else (change > threshold_pct)
+            regressed = regressed or worse
+            flag = "  REGRESSION" if worse else ""
+            print(f"{case:<28}{metric:<22}{old:>12.2f}{new:>12.2f}{change:>+9.1f}%{flag}")
+    return regressed
+
+
+#  In-memory WPS document
+class FakeDocument:
+    """
+    A document held in a Python string, with Range and Selection objects that mimic the COM API
+    used by the writers. COM cost is modelled as a fixed overhead per call plus a cost per
+    character; TypeText is charged its (much higher) per-character typing cost.
+    """
+
+    def __init__(self, text="", call_overhead=0.0, per_char=0.0, typing_per_char=0.0):
+        self.text = text
+        self.call_overhead = call_overhead
+        self.per_char = per_char
+        self.typing_per_char = typing_per_char
+        self.calls = 0
+        self.styles = []  # (start, end, style) applied
+        self.Selection = FakeSelection(self, len(text), len(text))
+
+    def _charge(self, chars, per_char=None):
+        self.calls += 1
+        cost = self.call_overhead + chars * (self.per_char if per_char is None else per_char)
+        if cost:
+            time.sleep(cost)
+
+    def _insert(self, position, text):
+        self.text = self.text[:position] + text + self.text[position:]
+
+    def Range(self, start, end):
+        return FakeRange(self, start, end)
+
+
+class FakeRange:
+    def __init__(self, document, start, end):
+        self._document = document
+        self.Start = start
+        self.End = end
+
+    @property
+    def Text(self):
+        return self._document.text[self.Start:self.End]
+
+    @Text.setter
+    def Text(self, value):
+        self._document._charge(len(value))
+        self._document.text = self._document.text[:self.Start] + value + self._document.text[self.End:]
+        self.End = self.Start + len(value)
+
+    def InsertAfter(self, text):
+        self._document._charge(len(text))
+        self._document._insert(self.End, text)
+        self.End += len(text)
+
+    @property
+    def Style(self):
+        return None
+
+    @Style.setter
+    def Style(self, value):
+        self._document._charge(0)
+        self._document.styles.append((self.Start, self.End, value))
+
+
+class FakeSelection:
+    def __init__(self, document, start, end):
+        self._document = document
+        self.Start = start
+        self.End = end
+
+    @property
+    def Range(self):
+        return FakeRange(self._document, self.Start, self.End)
+
+    def SetRange(self, start, end):
+        self.Start, self.End = start, end
+
+    def TypeText(self, Text):
+        self._document._charge(len(Text), self._document.typing_per_char)
+        self._document.text = self._document.text[:self.Start] + Text + self._document.text[self.End:]
+        self.Start = self.End = self.Start + len(Text)
@@ -1,4 +1,5 @@
 import argparse
+import json
 import os
 import sys
 import subprocess
@@ -63,10 +64,11 @@ def insert_content_into_wps(wps_doc, content: str):
 def save_content_to_docx(content: str, filename_prefix: str) -> str:
     """Saves a string as a new .docx file."""
     try:
-        from docx import Document
-        doc = Document()
+        from app.agents.docx_factory import new_document
+        from app.agents.markdown_docx import render_markdown
+        doc = new_document(font_name=None, font_size=None)
         
-        doc.add_paragraph(content)
+        render_markdown(doc, content)
         
         sanitized_prefix = "".join(c for c in filename_prefix if c.isalnum() or c in " _-").rstrip()
         output_filename = f"{sanitized_prefix.replace(' ', '_')}_{os.urandom(4).hex()}.docx"
@@ -94,17 +96,83 @@ def open_file_os_agnostic(filepath: str):
     except Exception as e:
         print(f"Error automatically opening file: {e}")
 
+def run_batch(batch_file: str, concurrency: int, output_file: str = None):
+    """
+    Sends a JSONL file (or JSON array) of DocumentRequests to the batch endpoint and
+    prints each item's status as the server streams it back.
+    """
+    with open(batch_file, "rb") as f:
+        body = f.read()
+
+    print(f"-> Sending batch '{batch_file}' to {API_BASE_URL}/batch_documents (concurrency={concurrency})")
+    counts = {"ok": 0, "error": 0, "invalid": 0}
+    out = open(output_file, "w", encoding="utf-8") if output_file else None
+    try:
+        # No overall read timeout: results arrive as each document finishes
+        with requests.post(
+            f"{API_BASE_URL}/batch_documents",
+            params={"concurrency": concurrency},
+            data=body,
+            headers={"Content-Type": "application/x-ndjson"},
+            stream=True,
+            timeout=(10, None),
+        ) as response:
+            response.raise_for_status()
+            for raw_line in response.iter_lines():
+                if not raw_line:
+                    continue
+                line = raw_line.decode("utf-8")
+                record = json.loads(line)
+                if record.get("event") == "accepted":
+                    print(f"Batch accepted: {record['total']} item(s).")
+                    continue
+                status = record.get("status") or "unknown"
+                counts[status] = counts.get(status, 0) + 1
+                if status == "ok":
+                    print(f"[{record['index']}] OK   {record.get('doc_type')}: {record.get('topic')} -> {record.get('download')}")
+                else:
+                    print(f"[{record['index']}] {status.upper()}: {record.get('error')}")
+                if out:
+                    out.write(line + "\n")
+                    out.flush()
+    finally:
+        if out:
+            out.close()
+
+    print("-" * 37)
+    print(f"Batch finished: {counts['ok']} succeeded, {counts['error']} failed, {counts['invalid']} invalid.")
+    if output_file:
+        print(f"Per-item results written to: {os.path.abspath(output_file)}")
+
 def main():
     """
     Main function to orchestrate the client-side of the application.
     It handles user input and communicates with the FastAPI server.
     """
     parser = argparse.ArgumentParser(description="AI Office Automation Pipeline. Provide your request in natural language.")
-    parser.add_argument("prompt", help="Your natural language request (e.g., 'write a report on Q1 sales' or 'analyze the selected text').")
+    parser.add_argument("prompt", nargs="?", help="Your natural language request (e.g., 'write a report on Q1 sales' or 'analyze the selected text').")
     parser.add_argument("--wps", action="store_true", help="Enable WPS functionality.")
+    parser.add_argument("--batch", metavar="FILE", help="Generate documents from a JSONL file (or JSON array) of DocumentRequests.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Maximum documents generated in parallel in batch mode.")
+    parser.add_argument("--output", metavar="FILE", help="Write per-item batch results (JSONL) to this file.")
     
     args = parser.parse_args()
 
+    if args.batch:
+        try:
+            run_batch(args.batch, args.concurrency, args.output)
+        except FileNotFoundError:
+            print(f"\nError: Batch file not found: {args.batch}")
+        except requests.exceptions.ConnectionError:
+            print(f"\nError: Could not connect to the FastAPI server at {API_BASE_URL}.")
+            print("Please ensure the backend server is running.")
+        except requests.exceptions.HTTPError as e:
+            print(f"\nHTTP Error from server: {e}")
+            print(f"Server response: {e.response.text}")
+        return
+    if not args.prompt:
+        parser.error("a prompt is required unless --batch is given")
+
     # Determine context based on mode
     if args.wps:
         print("--- AI Office Assistant Initialized (WPS Mode) ---")
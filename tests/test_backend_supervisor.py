@@ -0,0 +1,47 @@
+"""
+The backend supervisor does not start a second backend next to one it did not start that holds
+the port without answering /ready; it reports that backend as unhealthy.
+"""
+import os
+import socket
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+from wps_addin import backend_supervisor
+from wps_addin.backend_supervisor import UNHEALTHY, BackendSupervisor, default_command
+
+
+def test_hung_adopted_backend_is_reported_not_respawned():
+    # Listens but never accepts: connections succeed and /ready never answers
+    hung = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    hung.bind(("127.0.0.1", 0))
+    hung.listen(8)
+    messages = []
+    supervisor = BackendSupervisor([sys.executable, "-c", "pass"], ready_url=f"http://127.0.0.1:{hung.getsockname()[1]}/ready",
+                                   log=messages.append, health_interval=0.2, startup_timeout=1.0, spawn_lock_port=None)
+    try:
+        supervisor.start()
+        deadline = time.monotonic() + 15
+        while supervisor.state != UNHEALTHY:
+            assert time.monotonic() < deadline, messages
+            time.sleep(0.2)
+    finally:
+        supervisor.stop()
+        hung.close()
+    assert supervisor.process is None and supervisor.restarts == 0
+    assert not any("started" in message for message in messages), messages
+    assert any("-> starting" in message for message in messages), messages  # First taken as warming up
+    assert any("did not start" in message for message in messages), messages
+
+
+def test_development_command_runs_without_reload(monkeypatch):
+    # A development checkout: plain Python, no bundled AI_Backend_Server next to the add-in
+    monkeypatch.setattr(sys, "executable", os.path.join(os.sep, "usr", "bin", "python3"))
+    monkeypatch.delattr(sys, "frozen", raising=False)
+    monkeypatch.setattr(backend_supervisor.os.path, "isfile", lambda path: False)
+    command, cwd = default_command()
+    assert command == [sys.executable, "-m", "wps_addin.run_backend", "--no-reload"]
+    assert cwd == ROOT
@@ -0,0 +1,55 @@
+"""
+RangeWriter failing part-way: write_with_fallback() types the rest, so the document receives
+the whole result exactly once.
+"""
+import os
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+from benchmarks.common import FakeDocument, FakeRange
+from wps_addin.document_writer import RangeWriter, TypeTextWriter, write_with_fallback
+
+
+class FlakyDocument(FakeDocument):
+    """Raises on the InsertAfter call number `fail_at`, like a COM error from a busy WPS."""
+
+    def __init__(self, text, fail_at):
+        super().__init__(text)
+        self.fail_at = fail_at
+        self.inserts = 0
+
+    def Range(self, start, end):
+        return FlakyRange(self, start, end)
+
+
+class FlakyRange(FakeRange):
+    def InsertAfter(self, text):
+        self._document.inserts += 1
+        if self._document.inserts == self._document.fail_at:
+            raise OSError("The RPC server is unavailable.")
+        super().InsertAfter(text)
+
+
+def _write(document, text):
+    messages = []
+    writer = RangeWriter(document, document.Selection, initial_chunk=512, min_chunk=512, max_chunk=512, yield_seconds=0.0)
+    stats = write_with_fallback(writer, TypeTextWriter(document.Selection), text, log=messages.append)
+    return stats, messages
+
+
+def test_failure_part_way_types_the_rest():
+    text = " ".join(f"word{i}" for i in range(1000))
+    document = FlakyDocument("Before. ", fail_at=3)
+    stats, messages = _write(document, text)
+    assert document.text == "Before. " + text
+    assert stats.chunks == 1 and stats.chars < len(text)  # TypeText wrote the remainder
+    assert any("RangeWriter failed" in message for message in messages), messages
+
+
+def test_failure_before_the_first_chunk_types_everything():
+    document = FlakyDocument("Before. ", fail_at=1)
+    stats, _ = _write(document, "Result line one\nline two")
+    assert document.text == "Before. Result line one\rline two"
+    assert stats.chars == len("Result line one\rline two")
@@ -0,0 +1,142 @@
+"""
+Idempotency-Key handling (wps_addin/idempotency.py), run against the in-memory and the SQLite
+store: replay of a stored response, 422 for a reused key, a concurrent retry attaching to the
+running original, server errors not being stored, and 409 when the original fails.
+"""
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+from wps_addin.idempotency import IdempotencyMiddleware, IdempotencyStore, SQLiteIdempotencyStore
+
+
+class _App:
+    """Answers {"status": N, "delay": seconds} bodies with that status after the delay, counting runs."""
+
+    def __init__(self):
+        self.runs = 0
+
+    async def __call__(self, scope, receive, send):
+        request = json.loads((await receive())["body"])
+        self.runs += 1
+        run = self.runs
+        await asyncio.sleep(request.get("delay", 0))
+        body = json.dumps({"run": run}).encode()
+        await send({"type": "http.response.start", "status": request.get("status", 200),
+                    "headers": [(b"content-type", b"application/json"), (b"x-internal", b"not replayed")]})
+        await send({"type": "http.response.body", "body": body})
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        yield IdempotencyStore()
+    else:
+        store = SQLiteIdempotencyStore(str(tmp_path / "state.sqlite3"))
+        yield store
+        store.close()
+
+
+@pytest.fixture
+def service(store):
+    app = _App()
+    middleware = IdempotencyMiddleware(app, store, paths=["/create_memo"])
+    middleware.poll_interval = 0.01
+    return app, middleware
+
+
+async def _post(middleware, payload, key="key-1"):
+    messages = [{"type": "http.request", "body": json.dumps(payload).encode(), "more_body": False}]
+    sent = []
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await asyncio.sleep(3600)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "POST", "path": "/create_memo", "headers": [(b"idempotency-key", key.encode())]}
+    await middleware(scope, receive, send)
+    start, body = sent
+    return start["status"], dict(start["headers"]), json.loads(body["body"])
+
+
+def test_completed_response_is_replayed(service):
+    app, middleware = service
+
+    async def scenario():
+        first = await _post(middleware, {"topic": "x", "n": 1})
+        again = await _post(middleware, {"n": 1, "topic": "x"})  # Same payload, other formatting
+        return first, again
+
+    (status, headers, body), (replay_status, replay_headers, replay_body) = asyncio.run(scenario())
+    assert status == replay_status == 200 and body == replay_body == {"run": 1}
+    assert b"idempotent-replayed" not in headers and replay_headers[b"idempotent-replayed"] == b"true"
+    assert replay_headers[b"content-type"] == b"application/json" and b"x-internal" not in replay_headers
+    assert app.runs == 1
+
+
+def test_key_reused_for_another_body_is_rejected(service):
+    app, middleware = service
+
+    async def scenario():
+        await _post(middleware, {"topic": "x"})
+        return await _post(middleware, {"topic": "y"})
+
+    status, _, body = asyncio.run(scenario())
+    assert status == 422 and "different request" in body["detail"]
+    assert app.runs == 1
+
+
+def test_concurrent_retry_attaches_to_the_original(service):
+    app, middleware = service
+
+    async def scenario():
+        original = asyncio.create_task(_post(middleware, {"delay": 0.3}))
+        await asyncio.sleep(0.05)
+        retry = await _post(middleware, {"delay": 0.3})
+        return await original, retry
+
+    (status, _, body), (retry_status, retry_headers, retry_body) = asyncio.run(scenario())
+    assert status == retry_status == 200 and body == retry_body == {"run": 1}
+    assert retry_headers[b"idempotent-replayed"] == b"true"
+    assert app.runs == 1
+
+
+def test_server_errors_are_not_stored(service):
+    app, middleware = service
+
+    async def scenario():
+        failed = await _post(middleware, {"status": 503})
+        retried = await _post(middleware, {"status": 503})
+        return failed, retried
+
+    (status, _, body), (retry_status, retry_headers, retry_body) = asyncio.run(scenario())
+    assert status == retry_status == 503 and body == {"run": 1} and retry_body == {"run": 2}
+    assert b"idempotent-replayed" not in retry_headers
+    assert app.runs == 2
+
+
+def test_retry_attached_to_a_failed_original_gets_409(service):
+    app, middleware = service
+
+    async def scenario():
+        original = asyncio.create_task(_post(middleware, {"status": 500, "delay": 0.3}))
+        await asyncio.sleep(0.05)
+        retry = await _post(middleware, {"status": 500, "delay": 0.3})
+        again = await _post(middleware, {"status": 500, "delay": 0.3})  # The key is free again
+        return await original, retry, again
+
+    (status, _, _), (retry_status, _, retry_body), (again_status, _, again_body) = asyncio.run(scenario())
+    assert status == 500
+    assert retry_status == 409 and "failed" in retry_body["detail"]
+    assert again_status == 500 and again_body == {"run": 2}
+    assert app.runs == 2
@@ -0,0 +1,63 @@
+"""
+Incremental JSON parsing of LLM responses (app/agents/json_stream.py): locating the object in
+prose and fences, repairing truncation, and feeding the response in arbitrary chunks.
+"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+from app.agents.json_stream import IncrementalJSONParser, JSONStreamError, parse_json_response
+
+FENCED = 'Sure! Note: use {braces}.\n```json\n{"action": "x", "params": {"topic": "Q3"}}\n```'
+
+
+@pytest.mark.parametrize("text, expected", [
+    (FENCED, {"action": "x", "params": {"topic": "Q3"}}),
+    ('Example {"action": "old"} below:\n```\n{"action": "new"}\n```', {"action": "new"}),
+    ('Fill in {name} and {date}: {"action": "memo"}', {"action": "memo"}),
+    ('{ }', {}),
+])
+def test_object_is_found_after_prose_with_braces(text, expected):
+    parser = IncrementalJSONParser()
+    parser.feed(text)
+    assert parser.close() == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"title": "Q3", "summary": "Sales grew by', {"title": "Q3", "summary": "Sales grew by"}),
+    ('{"title": "Q3", "points": [1, 2, 3', {"title": "Q3", "points": [1, 2, 3]}),
+    ('{"title": "Q3", "points": ["north", "sou', {"title": "Q3", "points": ["north", "sou"]}),
+    ('{"title": "Q3", "sections": [{"heading": "A", "body": "x"}, {"heading": "B", "bo',
+     {"title": "Q3", "sections": [{"heading": "A", "body": "x"}, {"heading": "B"}]}),
+    ('{"title": "Q3", "points": [1, 2,', {"title": "Q3", "points": [1, 2]}),
+])
+def test_truncated_values_are_repaired(text, expected):
+    assert parse_json_response(text) == expected
+
+
+def test_trailing_commas_are_tolerated():
+    assert parse_json_response('{"points": [1, 2,], "meta": {"a": 1,}, "done": true,}') == {
+        "points": [1, 2], "meta": {"a": 1}, "done": True}
+
+
+def test_nothing_usable_raises():
+    with pytest.raises(JSONStreamError):
+        parse_json_response("No JSON here, only {prose}.")
+    with pytest.raises(JSONStreamError):
+        parse_json_response('{"title": ')
+
+
+def test_char_by_char_feeding_matches_whole_parse():
+    text = FENCED.replace('"params"', '"text": "a \\"quoted\\" {brace}", "params"')
+    parser = IncrementalJSONParser()
+    completed = []
+    for char in text:
+        completed.extend(parser.feed(char))
+    assert parser.done
+    assert [name for name, _ in completed] == ["action", "text", "params"]
+    assert parser.close() == parse_json_response(text) == {
+        "action": "x", "text": 'a "quoted" {brace}', "params": {"topic": "Q3"}}
@@ -0,0 +1,69 @@
+"""
+The Linux proxy's /backend pass-through (zwps_addin/linux_ai_client.py) frees its forwarding slot
+and closes the upstream response however the relay ends, including a client that is gone before
+the body is first read.
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+pytest.importorskip("fastapi")
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(ROOT, "zwps_addin"))
+
+import linux_ai_client as proxy  # noqa: E402
+from starlette.requests import ClientDisconnect, Request  # noqa: E402
+
+
+class _Chunks(httpx.AsyncByteStream):
+    async def __aiter__(self):
+        for chunk in (b"chunk-1 ", b"chunk-2"):
+            yield chunk
+
+
+def _request():
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    scope = {"type": "http", "method": "GET", "path": "/backend/stream", "query_string": b"", "headers": [],
+             "asgi": {"spec_version": "2.4"}}
+    return scope, receive, Request(scope, receive)
+
+
+async def _passthrough(send):
+    proxy.backend = httpx.AsyncClient(base_url="http://backend", transport=httpx.MockTransport(
+        lambda request: httpx.Response(200, stream=_Chunks(), headers={"content-type": "text/plain"})))
+    try:
+        scope, receive, request = _request()
+        response = await proxy.backend_passthrough("stream", request)
+        assert proxy.limit.in_flight == 1
+        try:
+            await response(scope, receive, send)
+        finally:
+            assert proxy.limit.in_flight == 0
+            assert response.upstream.is_closed
+    finally:
+        await proxy.backend.aclose()
+
+
+def test_relayed_body_releases_the_slot():
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(_passthrough(send))
+    assert sent[0]["status"] == 200
+    assert b"".join(message.get("body", b"") for message in sent[1:]) == b"chunk-1 chunk-2"
+
+
+def test_client_gone_before_the_body_releases_the_slot():
+    async def send(message):
+        raise OSError("connection reset by peer")
+
+    with pytest.raises(ClientDisconnect):
+        asyncio.run(_passthrough(send))
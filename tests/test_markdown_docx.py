@@ -0,0 +1,77 @@
+"""
+Markdown to .docx rendering (app/agents/markdown_docx.py): headings, lists, tables, inline
+emphasis and escaping of text that is not valid in WordprocessingML.
+"""
+import os
+import sys
+
+import pytest
+
+docx = pytest.importorskip("docx")
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+from app.agents.markdown_docx import MarkdownDocxRenderer, render_markdown
+
+
+def _paragraphs(markdown, **kwargs):
+    document = docx.Document()
+    render_markdown(document, markdown, **kwargs)
+    return document, [(paragraph.style.name, paragraph.text) for paragraph in document.paragraphs]
+
+
+@pytest.mark.parametrize("line, expected", [
+    ("# About C#", ("Heading 1", "About C#")),
+    ("## F#", ("Heading 2", "F#")),
+    ("### Closed heading ###", ("Heading 3", "Closed heading")),
+    ("#### Trailing spaces   ", ("Heading 4", "Trailing spaces")),
+    ("###### Six #", ("Heading 6", "Six")),
+])
+def test_headings(line, expected):
+    _, paragraphs = _paragraphs(line)
+    assert paragraphs == [expected]
+
+
+def test_heading_offset_and_non_headings():
+    _, paragraphs = _paragraphs("## Section\n#hashtag\n####### seven", heading_offset=1)
+    assert paragraphs == [("Heading 3", "Section"), ("Normal", "#hashtag\n####### seven")]
+
+
+def test_lists():
+    _, paragraphs = _paragraphs("- one\n  * nested\n1. first\n2) second\n\nplain")
+    assert paragraphs == [("List Bullet", "one"), ("List Bullet 2", "nested"),
+                          ("List Number", "first"), ("List Number", "second"), ("Normal", "plain")]
+
+
+def test_table():
+    document, paragraphs = _paragraphs("| Region | Sales |\n|---|---:|\n| North | 10 |\n| a \\| b |")
+    assert paragraphs == []
+    (table,) = document.tables
+    assert [[cell.text for cell in row.cells] for row in table.rows] == [
+        ["Region", "Sales"], ["North", "10"], ["a | b", ""]]
+    assert all(run.bold for run in table.rows[0].cells[0].paragraphs[0].runs)
+
+
+def test_inline_emphasis():
+    document, _ = _paragraphs("Some **bold**, *italic* and `code`.")
+    runs = [(run.text, bool(run.bold), bool(run.italic)) for run in document.paragraphs[0].runs]
+    assert runs == [("Some ", False, False), ("bold", True, False), (", ", False, False),
+                    ("italic", False, True), (" and ", False, False), ("code", False, False), (".", False, False)]
+
+
+def test_escaping():
+    _, paragraphs = _paragraphs('# R&D <b>"x"</b>\nTom & Jerry\x07 <tag>')
+    assert paragraphs == [("Heading 1", 'R&D <b>"x"</b>'), ("Normal", "Tom & Jerry <tag>")]
+
+
+def test_chunked_feed_matches_whole_render():
+    markdown = "# Title\n\nText with **bold**.\n- a\n- b\n| h1 | h2 |\n|--|--|\n| 1 | 2 |\n```\ncode <x>\n```\n"
+    whole, whole_paragraphs = _paragraphs(markdown)
+    document = docx.Document()
+    renderer = MarkdownDocxRenderer(document)
+    for index in range(0, len(markdown), 3):
+        renderer.feed(markdown[index:index + 3])
+    renderer.close()
+    assert [(p.style.name, p.text) for p in document.paragraphs] == whole_paragraphs
+    assert len(document.tables) == len(whole.tables) == 1
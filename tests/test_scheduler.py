@@ -0,0 +1,185 @@
+"""
+Admission control (wps_addin/scheduler.py): slots per workload class, priority dispatch under
+the total limit, rejection with Retry-After, the grant/timeout/cancel race in acquire() and
+reclassification of a request by its body.
+"""
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+from wps_addin.scheduler import AdmissionController, AdmissionMiddleware, Overloaded, WorkloadClass
+
+
+def _controller(max_total=None, max_wait=5.0, concurrency=1, max_queue=4):
+    return AdmissionController([
+        WorkloadClass("interactive", concurrency, max_queue, priority=0),
+        WorkloadClass("heavy", concurrency, max_queue, priority=2),
+    ], max_total=max_total, max_wait=max_wait)
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def _counts(controller, name):
+    snapshot = controller.snapshot()[name]
+    return snapshot["running"], snapshot["queued"]
+
+
+def test_default_total_lets_every_class_run_beside_the_largest_pool():
+    controller = AdmissionController([WorkloadClass("interactive", 8, 4, 0), WorkloadClass("document", 4, 4, 1),
+                                      WorkloadClass("heavy", 2, 4, 2)])
+    assert controller.max_total == 10
+
+
+def test_freed_slot_goes_to_the_highest_priority_waiter():
+    async def scenario():
+        controller = _controller(max_total=2, concurrency=2)
+        await controller.acquire("heavy")
+        await controller.acquire("heavy")
+        order = []
+
+        async def wait_for_slot(name):
+            await controller.acquire(name)
+            order.append(name)
+
+        heavy = asyncio.create_task(wait_for_slot("heavy"))
+        await _settle()
+        interactive = asyncio.create_task(wait_for_slot("interactive"))  # Queued later, runs first
+        await _settle()
+        assert _counts(controller, "heavy") == (2, 1) and _counts(controller, "interactive") == (0, 1)
+
+        controller.release("heavy", 0.0)
+        await _settle()
+        assert order == ["interactive"]
+        controller.release("heavy", 0.0)
+        await _settle()
+        assert order == ["interactive", "heavy"]
+        await asyncio.gather(heavy, interactive)
+        assert controller.running_total == 2
+
+    asyncio.run(scenario())
+
+
+def test_full_queue_and_long_wait_are_rejected():
+    async def scenario():
+        controller = _controller(max_wait=0.05, max_queue=1)
+        await controller.acquire("heavy")
+        waiting = asyncio.create_task(controller.acquire("heavy"))
+        await _settle()
+        with pytest.raises(Overloaded) as full:
+            await controller.acquire("heavy")
+        assert full.value.reason == "queue full" and full.value.retry_after >= 1
+        with pytest.raises(Overloaded) as timed_out:
+            await waiting
+        assert "no slot within" in timed_out.value.reason
+        assert controller.snapshot()["heavy"] == {"running": 1, "queued": 0, "rejected": 2, "admitted": 1, "concurrency": 1}
+
+    asyncio.run(scenario())
+
+
+def test_slot_granted_as_the_wait_is_cancelled_is_given_back():
+    async def scenario():
+        controller = _controller()
+        await controller.acquire("heavy")
+        waiter = asyncio.create_task(controller.acquire("heavy"))
+        await _settle()
+        controller.release("heavy", 0.0)  # Grants the slot to the waiter...
+        waiter.cancel()  # ...which is cancelled before it can see the grant
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert _counts(controller, "heavy") == (0, 0) and controller.running_total == 0
+        await asyncio.wait_for(controller.acquire("heavy"), 1.0)  # The slot is free again
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def scenario():
+        controller = _controller()
+        await controller.acquire("heavy")
+        waiter = asyncio.create_task(controller.acquire("heavy"))
+        await _settle()
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert _counts(controller, "heavy") == (1, 0)
+        controller.release("heavy", 0.0)
+        assert controller.running_total == 0
+
+    asyncio.run(scenario())
+
+
+#  Middleware
+async def _call(middleware, path="/summarize", body=b"{}"):
+    messages = [{"type": "http.request", "body": body[:2], "more_body": True},
+                {"type": "http.request", "body": body[2:], "more_body": False}]
+    sent = []
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await asyncio.sleep(3600)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "POST", "path": path, "headers": []}
+    await middleware(scope, receive, send)
+    return sent
+
+
+class _RecordingApp:
+    def __init__(self, controller):
+        self.controller = controller
+        self.calls = []
+
+    async def __call__(self, scope, receive, send):
+        message = await receive()
+        self.calls.append((message["body"], self.controller.snapshot()))
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+
+def test_busy_class_gets_503_with_retry_after():
+    async def scenario():
+        controller = _controller(max_queue=0)
+        app = _RecordingApp(controller)
+        middleware = AdmissionMiddleware(app, controller, classify=lambda scope: "heavy")
+        await controller.acquire("heavy")
+        start, body = await _call(middleware)
+        assert start["status"] == 503 and not app.calls
+        headers = dict(start["headers"])
+        assert int(headers[b"retry-after"]) >= 1
+        assert "Server busy" in json.loads(body["body"])["detail"]
+
+    asyncio.run(scenario())
+
+
+def test_request_is_reclassified_by_its_body():
+    def classify_body(scope, body, name):
+        return "heavy" if "document_id" in json.loads(body) else name
+
+    async def scenario():
+        controller = _controller()
+        app = _RecordingApp(controller)
+        middleware = AdmissionMiddleware(app, controller, classify=lambda scope: "interactive",
+                                         classify_body=classify_body, body_paths=["/summarize"])
+        for payload in ({"document_id": "abc", "content": ""}, {"content": "short text"}):
+            body = json.dumps(payload).encode()
+            start, _ = await _call(middleware, body=body)
+            assert start["status"] == 200
+        (heavy_body, heavy_snapshot), (inline_body, inline_snapshot) = app.calls
+        assert json.loads(heavy_body)["document_id"] == "abc"  # The app receives the body unchanged
+        assert heavy_snapshot["heavy"]["running"] == 1 and heavy_snapshot["interactive"]["running"] == 0
+        assert inline_snapshot["interactive"]["running"] == 1 and inline_snapshot["heavy"]["running"] == 0
+        assert controller.running_total == 0
+
+    asyncio.run(scenario())
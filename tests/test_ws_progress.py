@@ -0,0 +1,77 @@
+"""
+The /ws channel pushes the analysis stages as progress events, including the stages that run in
+the analysis worker processes. Runs the backend against the stub LLM.
+"""
+import os
+import sys
+import tempfile
+import time
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+STATE_DIR = tempfile.mkdtemp(prefix="ws-progress-")
+os.environ.update({
+    "LLM_PROVIDER": "stub",
+    "STUB_LLM_LATENCY_MS": "0",
+    "ANALYSIS_WORKERS": "1",
+    "TRACE_LOG_FILE": "",
+    "ARTIFACT_DIR": os.path.join(STATE_DIR, "generated_documents"),
+})
+sys.path.insert(0, ROOT)
+
+fastapi_testclient = pytest.importorskip("fastapi.testclient")
+
+TABLE = "region,month,sales,units\n" + "\n".join(
+    f"{region},{month},{100 + 7 * month + len(region)},{month % 5 + 1}"
+    for region in ("north", "south", "east") for month in range(1, 25)
+)
+
+
+@pytest.fixture(scope="module")
+def client():
+    from wps_addin import backend_server
+    with fastapi_testclient.TestClient(backend_server.app) as test_client:
+        deadline = time.monotonic() + 120
+        while test_client.get("/ready").status_code != 200:
+            assert time.monotonic() < deadline, "the analysis workers did not warm up"
+            time.sleep(0.2)
+        yield test_client
+
+
+def _call(client, endpoint, payload):
+    events = []
+    with client.websocket_connect("/ws") as websocket:
+        websocket.send_json({"type": "hello", "session": "", "last_seq": 0})
+        assert websocket.receive_json()["type"] == "welcome"
+        websocket.send_json({"type": "request", "id": "req-1", "endpoint": endpoint, "payload": payload})
+        while True:
+            event = websocket.receive_json()
+            events.append(event)
+            if event["type"] == "result":
+                return events
+
+
+def test_analyze_pushes_worker_stages(client):
+    events = _call(client, "/analyze", {"content": TABLE, "prompt": "Which region sells most?"})
+    assert events[-1]["status"] == 200, events[-1]
+    started = {event["stage"] for event in events if event["type"] == "progress" and event["state"] == "start"}
+    for stage in ("analyze.parse", "analyze.stats", "analyze.plots", "analyze.docx"):
+        assert stage in started, f"no progress event for {stage}: {sorted(started)}"
+    ended = [event for event in events if event["type"] == "progress" and event["state"] == "end"]
+    assert all(event["id"] == "req-1" for event in ended)
+
+
+def test_foreign_origin_is_refused_and_resume_is_lenient(client):
+    from starlette.websockets import WebSocketDisconnect
+    with pytest.raises(WebSocketDisconnect):
+        with client.websocket_connect("/ws", headers={"origin": "http://evil.example"}) as websocket:
+            websocket.send_json({"type": "hello", "session": "", "last_seq": 0})
+            websocket.receive_json()
+    with client.websocket_connect("/ws", headers={"origin": "http://127.0.0.1:8000"}) as websocket:
+        websocket.send_json({"type": "hello", "session": "", "last_seq": 0})
+        session = websocket.receive_json()["session"]
+    # A malformed resume position falls back to resending the buffered events
+    with client.websocket_connect("/ws") as websocket:
+        websocket.send_json({"type": "hello", "session": session, "last_seq": "not a number"})
+        assert websocket.receive_json() == {"type": "welcome", "session": session, "resumed": True}
@@ -7,17 +7,51 @@ import datetime
 import traceback
 import os
 import sys
+import json
+import queue
 import threading
+import time
+import uuid
 import requests
 import logging
 from tkinter import simpledialog, Tk
+from addin_executor import BUSY, DUPLICATE, AddinExecutor, RequestCancelled, call_cancellable
+from document_writer import RangeWriter, TypeTextWriter, write_with_fallback
+from document_blocks import DELTA_UPLOAD_MIN_CHARS, DeltaUploader
+from compression import post_json
+from backend_supervisor import BackendSupervisor, default_command
+
+try:
+    import websocket  # websocket-client; without it every call uses plain HTTP
+except ImportError:
+    websocket = None
 
 # Configuration - BACKEND IP address
 BACKEND_URL = "http://127.0.0.1:8000"
+BACKEND_WS_URL = BACKEND_URL.replace("http", "ws", 1) + "/ws"
+
+# Automatic retries of a backend call after a timeout or a dropped connection
+BACKEND_RETRIES = 2
+
+# Start the local backend when the add-in loads (ignored if BACKEND_URL is another machine)
+AUTO_START_BACKEND = True
+# How long a ribbon action waits for a backend that is still starting
+BACKEND_START_WAIT = 120
 
 # Consistent naming
 WPS_ADDIN_ENTRY_NAME = "WPSAIAddin.Connect"
 
+# Shared by all ribbon actions: bounded, deduplicated and cancellable
+request_executor = AddinExecutor()
+
+def _post_document_blocks(payload):
+    response = post_json(requests, f"{BACKEND_URL}/document_blocks", payload, timeout=120)
+    response.raise_for_status()
+    return response.json()
+
+# Long documents are uploaded as blocks; only blocks the backend has not seen are sent
+document_uploader = DeltaUploader(_post_document_blocks)
+
 def setup_logging():
     """Setup file-based logging"""
     try:
@@ -68,18 +102,166 @@ def get_wps_application():
         log_message(f"Error getting WPS Application object: {e}")
         return None
 
-def insert_text_at_cursor(text):
-    """Inserts text into the active document at the current cursor position."""
+def insert_text_at_cursor(text, style=None):
+    """
+    Inserts text into the active document at the current cursor position.
+    Long results are written in chunks (see document_writer.RangeWriter) so WPS stays responsive.
+    If that fails part-way, the rest is typed at the cursor with Selection.TypeText.
+    """
     wps_app = get_wps_application()
     if wps_app and wps_app.Documents.Count > 0:
         try:
-            wps_app.Selection.TypeText(Text=text)
-            log_message("Text successfully inserted into active WPS document.")
+            write_with_fallback(RangeWriter.for_application(wps_app, log=log_message),
+                                TypeTextWriter(wps_app.Selection, log=log_message), text, style=style, log=log_message)
         except Exception as e:
             log_message(f"Error inserting text into WPS document: {e}\n{traceback.format_exc()}")
     else:
         log_message("Warning: Could not find an active WPS document to insert text into.")
 
+def set_status_bar(text):
+    """Shows a progress message in the WPS status bar (ignored if WPS is not reachable)."""
+    wps_app = get_wps_application()
+    if wps_app:
+        try:
+            wps_app.StatusBar = text
+        except Exception:
+            pass
+
+class ChannelError(Exception):
+    """The WebSocket channel is unavailable; the caller falls back to HTTP."""
+
+class BackendChannel:
+    """
+    A persistent WebSocket connection to the backend shared by all ribbon actions.
+    Requests are multiplexed by id; progress, streamed tokens and results are pushed by the
+    server. After a dropped connection the channel reconnects to the same session, receives
+    the events it missed and resends requests that have no result yet.
+    """
+
+    RECONNECT_ATTEMPTS = 3
+
+    def __init__(self, url=BACKEND_WS_URL):
+        self.url = url
+        self.session = ""
+        self.last_seq = 0
+        self._socket = None
+        self._lock = threading.Lock()
+        self._pending = {}  # request id -> (queue of events, request frame)
+
+    def _connect(self):
+        """Opens the socket and resumes the session. Call with the lock held."""
+        sock = websocket.create_connection(self.url, timeout=5)
+        sock.send(json.dumps({"type": "hello", "session": self.session, "last_seq": self.last_seq}))
+        welcome = json.loads(sock.recv())
+        if not welcome.get("resumed"):
+            self.last_seq = 0
+        self.session = welcome["session"]
+        sock.settimeout(None)
+        self._socket = sock
+        threading.Thread(target=self._read, args=(sock,), name="backend-channel", daemon=True).start()
+        # Requests sent before a drop: the server skips those still running in the session and
+        # replays finished ones through their Idempotency-Key
+        for _, frame in list(self._pending.values()):
+            sock.send(json.dumps(frame))
+        log_message(f"Backend channel connected (session {self.session}, resumed: {welcome.get('resumed')})")
+
+    def _read(self, sock):
+        try:
+            while True:
+                event = json.loads(sock.recv())
+                self.last_seq = max(self.last_seq, event.get("seq", 0))
+                entry = self._pending.get(event.get("id"))
+                if entry is not None:
+                    entry[0].put(event)
+        except Exception as e:
+            log_message(f"Backend channel dropped: {e}")
+        with self._lock:
+            if self._socket is not sock:
+                return
+            self._socket = None
+            for attempt in range(self.RECONNECT_ATTEMPTS):
+                if not self._pending:
+                    return
+                time.sleep(2 ** attempt)
+                try:
+                    self._connect()
+                    return
+                except Exception as e:
+                    log_message(f"Backend channel reconnect {attempt + 1}/{self.RECONNECT_ATTEMPTS} failed: {e}")
+            for events, _ in self._pending.values():
+                events.put({"type": "disconnected"})
+
+    def call(self, endpoint, payload, request_id, on_event=None, timeout=300, cancel=None):
+        """
+        Runs a request over the channel and returns (status, body, retry_after).
+        `on_event` is called on this thread with each progress and token event.
+        Raises ChannelError if the channel cannot be used, RequestCancelled if `cancel` is set.
+        """
+        frame = {"type": "request", "id": request_id, "endpoint": endpoint, "payload": payload}
+        events = queue.Queue()
+        with self._lock:
+            self._pending[request_id] = (events, frame)
+            try:
+                if self._socket is None:
+                    self._connect()
+                else:
+                    self._socket.send(json.dumps(frame))
+            except Exception as e:
+                self._pending.pop(request_id, None)
+                raise ChannelError(f"Could not reach {self.url}: {e}")
+        try:
+            deadline = time.monotonic() + timeout
+            while True:
+                if cancel is not None:
+                    cancel.check()
+                if time.monotonic() >= deadline:
+                    raise ChannelError(f"No result for {endpoint} within {timeout}s")
+                try:
+                    event = events.get(timeout=0.5)  # Short waits, so a cancel is noticed quickly
+                except queue.Empty:
+                    continue
+                if event["type"] == "result":
+                    return event["status"], event.get("body"), event.get("retry_after")
+                if event["type"] == "disconnected":
+                    raise ChannelError("The connection to the backend was lost")
+                if on_event is not None and event["type"] in ("progress", "token"):
+                    on_event(event)
+        finally:
+            self._pending.pop(request_id, None)
+
+_supervisor = None
+_supervisor_lock = threading.Lock()
+
+def get_backend_supervisor():
+    """Returns the add-in's backend supervisor, starting it on first use; None if disabled or no backend is installed."""
+    global _supervisor
+    if not AUTO_START_BACKEND or not BACKEND_URL.startswith(("http://127.0.0.1", "http://localhost")):
+        return None
+    with _supervisor_lock:
+        if _supervisor is None:
+            command, cwd = default_command()
+            if command is None:
+                log_message("Backend supervisor disabled: AI_Backend_Server was not found.")
+                return None
+            log_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs")
+            _supervisor = BackendSupervisor(command, cwd=cwd, ready_url=f"{BACKEND_URL}/ready",
+                                            output_path=os.path.join(log_dir, "backend.log"), log=log_message)
+            _supervisor.start()
+        return _supervisor
+
+_channel = None
+_channel_lock = threading.Lock()
+
+def get_backend_channel():
+    """Returns the shared channel, or None if websocket-client is not installed."""
+    global _channel
+    if websocket is None:
+        return None
+    with _channel_lock:
+        if _channel is None:
+            _channel = BackendChannel()
+        return _channel
+
 class WPSAddinBase:
     """Base class for WPS Add-in with shared functionality"""
     
@@ -93,6 +275,7 @@ class WPSAddinBase:
         'GetTabLabel', 'GetGroupLabel', 'GetRunPromptLabel', 'GetAnalyzeDocLabel',
         'GetSummarizeDocLabel', 'GetCreateMemoLabel', 'GetCreateMinutesLabel',
         'GetCreateCoverLetterLabel', 'OnCreateMemo', 'OnCreateMinutes', 'OnCreateCoverLetter',
+        'GetCancelRequestsLabel', 'OnCancelRequests',
         'GetCustomUI'
     ]
     _public_attrs_ = ['ribbon']
@@ -125,9 +308,20 @@ class WPSAddinBase:
                     "connection_error": "\n\nERROR: Could not connect to the backend server. Please ensure the AI Backend is running.\n\n",
                     "unexpected_error": "\n\nAn unexpected error occurred: {e}\n\n",
                     "result_header": "\n\n--- AI Assistant Result ---\n", "result_footer": "\n--- End of Result ---\n\n",
-                    "no_active_doc": "No active document found."
+                    "no_active_doc": "No active document found.",
+                    "progress_stage": "AI Assistant: {stage}...",
+                    "progress_tokens": "AI Assistant: receiving response ({chars} characters)...",
+                    "stage_parse": "reading the data", "stage_stats": "running statistics", "stage_plots": "drawing charts",
+                    "stage_llm": "waiting for the AI model", "stage_docx": "writing the Word document",
+                    "cancel_requests": "Cancel AI Request", "request_cancelled": "\n\nAI Assistant: Request cancelled.\n\n",
+                    "requests_cancelled": "AI Assistant: {count} request(s) cancelled.",
+                    "request_duplicate": "AI Assistant: The same request is already running.",
+                    "addin_busy": "\n\nAI Assistant: Too many requests are waiting. Try again when one has finished.\n\n",
+                    "backend_starting": "AI Assistant: starting the AI backend..."
                 }
             }
+            # The backend starts in the background while WPS finishes loading
+            get_backend_supervisor()
             log_message("--- Add-in __init__ completed successfully. ---")
         except FileNotFoundError:
             log_message(f"FATAL ERROR: Ribbon XML file not found at {ribbon_path}")
@@ -181,6 +375,7 @@ class WPSAddinBase:
     def GetCreateMemoLabel(self, c): return self._get_localized_string("create_memo")
     def GetCreateMinutesLabel(self, c): return self._get_localized_string("create_minutes")
     def GetCreateCoverLetterLabel(self, c): return self._get_localized_string("create_cover_letter")
+    def GetCancelRequestsLabel(self, c): return self._get_localized_string("cancel_requests")
 
     def OnLoadImage(self, imageName):
         import win32api
@@ -194,17 +389,155 @@ class WPSAddinBase:
             log_message(f"ERROR: Failed to load image '{imageName}': {e}")
             return None
 
-    def _call_backend_task(self, endpoint: str, payload: dict):
+    def _post_with_retries(self, endpoint: str, payload: dict, idempotency_key: str = None, cancel=None):
+        """
+        Posts to the backend (large bodies compressed), retrying after timeouts, dropped connections and 503 (server
+        busy, honouring Retry-After). Every attempt sends the same Idempotency-Key, so a retry
+        picks up the original run instead of starting a second one. Raises RequestCancelled
+        as soon as `cancel` is set, also while a post or a retry delay is in progress.
+        """
+        headers = {"Idempotency-Key": idempotency_key or uuid.uuid4().hex}
+        for attempt in range(BACKEND_RETRIES + 1):
+            try:
+                response = call_cancellable(cancel, post_json, requests, f"{BACKEND_URL}{endpoint}", payload,
+                                            headers=headers, timeout=300)
+                if response.status_code != 503 or attempt == BACKEND_RETRIES:
+                    return response
+                delay = min(int(response.headers.get("Retry-After", "5")), 60)
+                log_message(f"Backend busy, retrying {endpoint} in {delay}s")
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+                if attempt == BACKEND_RETRIES:
+                    raise
+                log_message(f"Retrying {endpoint} after {type(e).__name__} (attempt {attempt + 2}/{BACKEND_RETRIES + 1})")
+                delay = 2 ** attempt
+            if cancel is None:
+                time.sleep(delay)
+            elif cancel.wait(delay):
+                cancel.check()
+
+    def _progress_reporter(self):
+        """Returns an event handler that shows channel progress in the status bar."""
+        stages = {"parse": "stage_parse", "stats": "stage_stats", "plots": "stage_plots",
+                  "llm": "stage_llm", "stream": "stage_llm", "generate": "stage_llm", "docx": "stage_docx", "save": "stage_docx"}
+        state = {"chars": 0, "shown": 0.0}
+
+        def on_event(event):
+            if event["type"] == "token":
+                state["chars"] += len(event.get("text", ""))
+                if time.monotonic() - state["shown"] < 0.5:
+                    return  # Throttled: the status bar is updated over COM
+                state["shown"] = time.monotonic()
+                set_status_bar(self._get_localized_string("progress_tokens").format(chars=state["chars"]))
+            elif event.get("state") == "start":
+                key = stages.get(event.get("stage", "").rsplit(".", 1)[-1])
+                if key:
+                    set_status_bar(self._get_localized_string("progress_stage").format(stage=self._get_localized_string(key)))
+        return on_event
+
+    def _request_backend(self, endpoint: str, payload: dict, cancel=None) -> str:
+        """
+        Runs a backend request and returns its result text. The WebSocket channel is used when
+        available (progress in the status bar); otherwise, or if the channel fails, the request
+        is posted over HTTP with the same Idempotency-Key, which attaches to a run already started.
+        """
+        request_id = uuid.uuid4().hex
+        channel = get_backend_channel()
+        if channel is not None:
+            try:
+                for attempt in range(BACKEND_RETRIES + 1):
+                    status, body, retry_after = channel.call(endpoint, payload, request_id, self._progress_reporter(), cancel=cancel)
+                    if status != 503 or attempt == BACKEND_RETRIES:
+                        break
+                    delay = min(retry_after or 5, 60)
+                    log_message(f"Backend busy, retrying {endpoint} in {delay}s")
+                    if cancel is not None and cancel.wait(delay):
+                        cancel.check()
+                if status >= 400:
+                    detail = body.get("detail") if isinstance(body, dict) else body
+                    raise RuntimeError(f"Backend returned {status}: {detail}")
+                return body.get("result", "") if isinstance(body, dict) else ""
+            except ChannelError as e:
+                log_message(f"WebSocket channel unavailable ({e}); using HTTP for {endpoint}")
+            finally:
+                set_status_bar("")
+        response = self._post_with_retries(endpoint, payload, request_id, cancel)
+        response.raise_for_status()
+        return response.json().get("result", "")
+
+    def _request_document(self, endpoint: str, payload: dict, cancel=None) -> str:
+        """
+        Like _request_backend, for a payload carrying the document text: long documents are
+        delta-uploaded first and referenced by their document id. If the upload fails (e.g. an
+        older backend), the whole text is posted as before.
+        """
+        content = payload.get("content", "")
+        if len(content) < DELTA_UPLOAD_MIN_CHARS:
+            return self._request_backend(endpoint, payload, cancel)
+        try:
+            doc_id, sent = document_uploader.upload(content)
+            log_message(f"Uploaded {sent} of {len(content)} characters for {endpoint}")
+        except Exception as e:
+            log_message(f"Delta upload failed ({e}); sending the whole document to {endpoint}")
+            return self._request_backend(endpoint, payload, cancel)
+        if cancel is not None:
+            cancel.check()
+        try:
+            return self._request_backend(endpoint, dict(payload, content="", document_id=doc_id), cancel)
+        except RequestCancelled:
+            raise
+        except Exception:
+            document_uploader.forget()  # The next call uploads everything again
+            raise
+
+    def _submit_backend_task(self, endpoint: str, payload: dict):
+        """Queues a backend call on the shared executor (identical calls in flight run once)."""
+        key = (endpoint, json.dumps(payload, sort_keys=True))
+        status, _ = request_executor.submit(key, self._call_backend_task, endpoint, payload)
+        if status == DUPLICATE:
+            log_message(f"Ignoring duplicate request to {endpoint}")
+            set_status_bar(self._get_localized_string("request_duplicate"))
+        elif status == BUSY:
+            log_message(f"Refusing request to {endpoint}: {request_executor.in_flight} requests in flight")
+            insert_text_at_cursor(self._get_localized_string("addin_busy"))
+
+    def OnCancelRequests(self, c):
+        count = request_executor.cancel_all()
+        log_message(f"Cancel requested for {count} backend request(s)")
+        set_status_bar(self._get_localized_string("requests_cancelled").format(count=count))
+
+    def _wait_for_backend(self, cancel=None):
+        """Waits (up to BACKEND_START_WAIT) for a backend the supervisor is still starting."""
+        supervisor = get_backend_supervisor()
+        if supervisor is None or supervisor.ready:
+            return
+        log_message(f"Waiting for the backend to start ({supervisor.state})")
+        set_status_bar(self._get_localized_string("backend_starting"))
+        try:
+            deadline = time.monotonic() + BACKEND_START_WAIT
+            while not supervisor.wait_ready(0.5) and time.monotonic() < deadline:
+                if cancel is not None:
+                    cancel.check()
+        finally:
+            set_status_bar("")
+
+    def _call_backend_task(self, endpoint: str, payload: dict, cancel=None):
         log_message(f"Calling backend endpoint: {endpoint}")
         try:
             insert_text_at_cursor(self._get_localized_string("contacting_server"))
-            response = requests.post(f"{BACKEND_URL}{endpoint}", json=payload, timeout=300)
-            response.raise_for_status()
-            result = response.json().get("result", "")
+            self._wait_for_backend(cancel)
+            if "content" in payload:
+                result = self._request_document(endpoint, payload, cancel)
+            else:
+                result = self._request_backend(endpoint, payload, cancel)
+            if cancel is not None:
+                cancel.check()  # Cancelled while the last response was arriving
             header = self._get_localized_string("result_header")
             footer = self._get_localized_string("result_footer")
             insert_text_at_cursor(f"{header}{result}{footer}")
             log_message(f"Successfully received response from {endpoint}.")
+        except RequestCancelled:
+            log_message(f"Request to {endpoint} cancelled")
+            insert_text_at_cursor(self._get_localized_string("request_cancelled"))
         except requests.exceptions.ConnectionError:
             log_message(f"Connection error to {endpoint}")
             insert_text_at_cursor(self._get_localized_string("connection_error"))
@@ -219,24 +552,21 @@ class WPSAddinBase:
         root.destroy()
         if not prompt:
             return insert_text_at_cursor(self._get_localized_string("action_cancelled"))
-        threading.Thread(target=self._call_backend_task,
-                        args=("/process", {"prompt": prompt})).start()
+        self._submit_backend_task("/process", {"prompt": prompt})
 
     def OnAnalyzeDocument(self, c):
         wps_app = get_wps_application()
         if not wps_app or wps_app.Documents.Count == 0:
             return insert_text_at_cursor(self._get_localized_string("no_active_doc"))
         content = wps_app.ActiveDocument.Content.Text
-        threading.Thread(target=self._call_backend_task,
-                        args=("/analyze", {"content": content, "prompt": "Analyze the document content."})).start()
+        self._submit_backend_task("/analyze", {"content": content, "prompt": "Analyze the document content."})
 
     def OnSummarizeDocument(self, c):
         wps_app = get_wps_application()
         if not wps_app or wps_app.Documents.Count == 0:
             return insert_text_at_cursor(self._get_localized_string("no_active_doc"))
         content = wps_app.ActiveDocument.Content.Text
-        threading.Thread(target=self._call_backend_task,
-                        args=("/summarize", {"content": content, "prompt": "Summarize the document content."})).start()
+        self._submit_backend_task("/summarize", {"content": content, "prompt": "Summarize the document content."})
 
     def OnCreateMemo(self, c):
         root = Tk(); root.withdraw()
@@ -249,7 +579,7 @@ class WPSAddinBase:
                                         self._get_localized_string("memo_audience"))
         root.destroy()
         payload = {"doc_type": "memo", "topic": topic, "audience": audience or "Internal Team"}
-        threading.Thread(target=self._call_backend_task, args=("/create_memo", payload)).start()
+        self._submit_backend_task("/create_memo", payload)
 
     def OnCreateMinutes(self, c):
         root = Tk(); root.withdraw()
@@ -268,7 +598,7 @@ class WPSAddinBase:
             "members_present": [name.strip() for name in (attendees or "").split(',') if name.strip()],
             "data_sources": [data.strip() for data in (info or "").split(',') if data.strip()]
         }
-        threading.Thread(target=self._call_backend_task, args=("/create_minutes", payload)).start()
+        self._submit_backend_task("/create_minutes", payload)
 
     def OnCreateCoverLetter(self, c):
         root = Tk(); root.withdraw()
@@ -281,4 +611,4 @@ class WPSAddinBase:
                                         self._get_localized_string("cover_letter_audience"))
         root.destroy()
         payload = {"doc_type": "cover_letter", "topic": topic, "audience": audience or "Hiring Manager"}
-        threading.Thread(target=self._call_backend_task, args=("/create_cover_letter", payload)).start()
\ No newline at end of file
+        self._submit_backend_task("/create_cover_letter", payload)
\ No newline at end of file
@@ -0,0 +1,126 @@
+"""
+Bounded, cancellable executor for the add-in's backend requests.
+Ribbon actions run on a small shared pool of worker threads instead of one new thread per
+click. The number of running plus waiting requests is capped, an action identical to one that
+is still in flight is not started twice, and every request can be cancelled from the ribbon.
+Blocking calls such as an HTTP post run through call_cancellable(), so a cancel takes effect
+within CANCEL_POLL_SECONDS instead of when the backend finally answers.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Running plus waiting requests are capped at ADDIN_MAX_WORKERS + ADDIN_MAX_QUEUED
+ADDIN_MAX_WORKERS = 2
+ADDIN_MAX_QUEUED = 4
+# How often a task waiting in call_cancellable() looks at its cancel token
+CANCEL_POLL_SECONDS = 0.5
+
+STARTED, DUPLICATE, BUSY = "started", "duplicate", "busy"
+
+
+class RequestCancelled(Exception):
+    """Raised inside a task whose cancel token was set."""
+
+
+class CancelToken(threading.Event):
+    """Set by cancel_all(); long-running tasks check it between steps."""
+
+    def check(self):
+        if self.is_set():
+            raise RequestCancelled()
+
+
+def call_cancellable(cancel, fn, *args, **kwargs):
+    """
+    Returns fn(*args, **kwargs), run on a helper thread while this one checks `cancel` every
+    CANCEL_POLL_SECONDS. A cancel raises RequestCancelled at once; the abandoned call ends on
+    its own (e.g. when the request times out) and its result is dropped.
+    """
+    if cancel is None:
+        return fn(*args, **kwargs)
+    cancel.check()
+    outcome = {}
+    done = threading.Event()
+
+    def run():
+        try:
+            outcome["result"] = fn(*args, **kwargs)
+        except BaseException as e:
+            outcome["error"] = e
+        finally:
+            done.set()
+
+    threading.Thread(target=run, name="ai-request-call", daemon=True).start()
+    while not done.wait(CANCEL_POLL_SECONDS):
+        cancel.check()
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["result"]
+
+
+def _init_worker_thread():
+    # Worker threads talk to WPS over COM, which needs a per-thread initialization
+    try:
+        import pythoncom
+        pythoncom.CoInitialize()
+    except ImportError:
+        pass
+
+
+class AddinExecutor:
+    """
+    Runs add-in tasks on a bounded thread pool.
+
+    Args:
+        max_workers (int): Requests that run at the same time.
+        max_queued (int): Requests that may wait for a worker; more are refused.
+    """
+
+    def __init__(self, max_workers=ADDIN_MAX_WORKERS, max_queued=ADDIN_MAX_QUEUED):
+        self.limit = max_workers + max_queued
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ai-request",
+                                        initializer=_init_worker_thread)
+        self._tasks = {}  # key -> (future, cancel token)
+        self._lock = threading.Lock()
+
+    def submit(self, key, fn, *args):
+        """
+        Queues fn(*args, cancel=token) unless an identical task (same key) is in flight or
+        the queue is full. Returns (status, future): status is STARTED, DUPLICATE (future of
+        the running task) or BUSY (future is None).
+        """
+        with self._lock:
+            if key in self._tasks:
+                return DUPLICATE, self._tasks[key][0]
+            if len(self._tasks) >= self.limit:
+                return BUSY, None
+            token = CancelToken()
+            future = self._pool.submit(fn, *args, cancel=token)
+            self._tasks[key] = (future, token)
+
+        def forget(_future):
+            with self._lock:
+                if self._tasks.get(key, (None,))[0] is future:
+                    del self._tasks[key]
+
+        future.add_done_callback(forget)
+        return STARTED, future
+
+    @property
+    def in_flight(self):
+        with self._lock:
+            return len(self._tasks)
+
+    def cancel_all(self):
+        """Cancels waiting tasks and signals running ones. Returns the number of tasks affected."""
+        with self._lock:
+            tasks = list(self._tasks.values())
+        for future, token in tasks:
+            token.set()
+            future.cancel()
+        return len(tasks)
+
+    def shutdown(self):
+        self.cancel_all()
+        self._pool.shutdown(wait=False)
@@ -0,0 +1,264 @@
+"""
+Worker-process pool for the CPU-bound part of data analysis.
+Parsing, statistics, plotting and the Word report of /analyze are pure Python/NumPy work that
+holds the GIL, so on the server's threadpool one large analysis slows every other request and
+several analyses never use more than one core. The pool runs those stages in separate processes.
+Workers are started and warmed up (pandas, scipy, seaborn and the matplotlib backend imported,
+one throwaway plot drawn) before the first request, so an analysis does not pay the import cost.
+Large text inputs (the pasted table) are handed over through shared memory instead of the
+executor's pickle pipe.
+
+A task runs inside the trace of the request that submitted it. Its spans (analyze.parse,
+analyze.stats, analyze.plots, analyze.docx, ...) are sent back over a queue as they start and
+end and re-emitted in the server process, so the span log, the metrics and the add-in's
+progress events see them as if the stage had run in the server. A task's future completes
+once all of its spans have arrived.
+"""
+import itertools
+import multiprocessing
+import queue
+import signal
+import threading
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import Callable, Dict, List, Optional
+
+from app.agents.tracing import add_span_listener, continue_trace, emit_span, remote_context
+
+# Text arguments above this size (bytes) go through shared memory
+SHARED_MEMORY_THRESHOLD = 64 * 1024
+# Seconds a finished task waits for span events that never arrive (e.g. the worker died)
+SPAN_DRAIN_TIMEOUT = 2.0
+
+# Worker side: the queue to the server process, and the task being run
+_span_queue = None
+_task_token: Optional[int] = None
+
+
+class _SharedText:
+    """Placeholder for a str argument stored in a shared memory block."""
+
+    __slots__ = ("name", "size")
+
+    def __init__(self, name: str, size: int):
+        self.name = name
+        self.size = size
+
+    def load(self) -> str:
+        # Workers share the parent's resource tracker, so attaching here does not take ownership;
+        # the parent unlinks the block once the task is done
+        block = shared_memory.SharedMemory(name=self.name)
+        try:
+            return bytes(block.buf[:self.size]).decode("utf-8")
+        finally:
+            block.close()
+
+
+def _forward_span(event: str, span_obj):
+    """Worker span listener: sends the spans of the current task to the server process."""
+    if _task_token is not None:
+        _span_queue.put((_task_token, event, span_obj))
+
+
+def _call_with_shared(func: Callable, args: tuple, context=None, token: Optional[int] = None):
+    """
+    Runs in the worker: swaps shared-memory placeholders back for their text, then calls func
+    inside the submitter's trace. A final "done" event tells the server all spans were sent.
+    """
+    global _task_token
+    _task_token = token if _span_queue is not None else None
+    try:
+        with continue_trace(context):
+            return func(*[arg.load() if isinstance(arg, _SharedText) else arg for arg in args])
+    finally:
+        if _task_token is not None:
+            _span_queue.put((_task_token, "done", None))
+        _task_token = None
+
+
+def _warm_worker(span_queue=None):
+    """Process initializer: imports the analysis stack and draws one plot so the first task is fast."""
+    global _span_queue
+    # Ctrl+C in the server's console reaches the whole process group; the pool stops the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if span_queue is not None:
+        _span_queue = span_queue
+        add_span_listener(_forward_span)
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import pandas  # noqa: F401
+    import scipy.stats  # noqa: F401
+    import seaborn  # noqa: F401
+    import app.agents.analyzer  # noqa: F401
+
+    plt.figure()
+    plt.plot([0, 1], [0, 1])
+    plt.close("all")
+
+
+def _ping() -> int:
+    time.sleep(0.05)  # Keeps this worker busy so the next ping starts another one
+    return multiprocessing.current_process().pid
+
+
+class _Task:
+    """A submitted task. Its future completes once the worker's result and all its spans are in."""
+
+    __slots__ = ("future", "result", "spans_done", "finished_at")
+
+    def __init__(self):
+        self.future = Future()
+        self.result: Optional[Future] = None
+        self.spans_done = False
+        self.finished_at = 0.0
+
+
+class AnalysisPool(Executor):
+    """
+    A process pool for analysis stages, usable wherever a concurrent.futures.Executor is expected.
+
+    Args:
+        max_workers (int): Worker processes (roughly the number of analyses that run in parallel).
+        start_method (Optional[str]): multiprocessing start method; default "spawn", which behaves
+            the same on Windows, Linux and in the PyInstaller build.
+    """
+
+    def __init__(self, max_workers: int, start_method: Optional[str] = None):
+        self.max_workers = max(1, max_workers)
+        self._context = multiprocessing.get_context(start_method or "spawn")
+        self._lock = threading.Lock()
+        self._spans = self._context.Queue()
+        self._tasks: Dict[int, _Task] = {}
+        self._tokens = itertools.count(1)
+        self._pool = self._new_pool()
+        self._relay = threading.Thread(target=self._relay_spans, name="analysis-pool-spans", daemon=True)
+        self._relay.start()
+        self.pending = 0  # Tasks submitted and not finished
+        self.completed = 0
+        self.restarts = 0
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self.max_workers, mp_context=self._context,
+                                   initializer=_warm_worker, initargs=(self._spans,))
+
+    def warm(self) -> List[int]:
+        """Starts every worker and waits until they are initialized. Returns the worker pids."""
+        futures = [self._pool.submit(_ping) for _ in range(self.max_workers)]
+        return sorted({future.result() for future in futures})
+
+    def submit(self, fn: Callable, /, *args, **kwargs) -> Future:
+        if kwargs:
+            raise TypeError("AnalysisPool.submit takes positional arguments only.")
+        token, task = next(self._tokens), _Task()
+        blocks = []
+        try:
+            shared_args = []
+            for arg in args:
+                if isinstance(arg, str) and len(arg) > SHARED_MEMORY_THRESHOLD // 4:
+                    data = arg.encode("utf-8")
+                    if len(data) > SHARED_MEMORY_THRESHOLD:
+                        block = shared_memory.SharedMemory(create=True, size=len(data))
+                        block.buf[:len(data)] = data
+                        blocks.append(block)
+                        arg = _SharedText(block.name, len(data))
+                shared_args.append(arg)
+            with self._lock:
+                self._tasks[token] = task
+            future = self._submit(_call_with_shared, fn, tuple(shared_args), remote_context(), token)
+        except BaseException:
+            with self._lock:
+                self._tasks.pop(token, None)
+            _release(blocks)
+            raise
+
+        with self._lock:
+            self.pending += 1
+
+        def on_done(result: Future):
+            _release(blocks)
+            with self._lock:
+                self.pending -= 1
+                self.completed += 1
+            self._finish(token, result=result)
+
+        future.add_done_callback(on_done)
+        return task.future
+
+    def _submit(self, *args) -> Future:
+        try:
+            return self._pool.submit(*args)
+        except BrokenProcessPool:
+            # A worker died (crash, out of memory); start a fresh pool for the following tasks
+            with self._lock:
+                print("Analysis pool: a worker process died, restarting the pool.")
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = self._new_pool()
+                self.restarts += 1
+            return self._pool.submit(*args)
+
+    #  Spans of the workers
+    def _finish(self, token: int, result: Optional[Future] = None, spans_done: bool = False):
+        """Records the worker's result or its "done" event; completes the task once it has both."""
+        with self._lock:
+            task = self._tasks.get(token)
+            if task is None:
+                return
+            if result is not None:
+                task.result, task.finished_at = result, time.monotonic()
+                # A task that never ran, or whose worker died, sends no "done" event
+                if result.cancelled() or isinstance(result.exception(), BrokenProcessPool):
+                    spans_done = True
+            task.spans_done = task.spans_done or spans_done
+            if task.result is None or not task.spans_done:
+                return
+            del self._tasks[token]
+        if task.result.cancelled():
+            task.future.cancel()
+        elif task.result.exception() is not None:
+            task.future.set_exception(task.result.exception())
+        else:
+            task.future.set_result(task.result.result())
+
+    def _relay_spans(self):
+        """Re-emits the spans sent by the workers in this process, as their stages start and end."""
+        while True:
+            try:
+                item = self._spans.get(timeout=0.5)
+            except queue.Empty:
+                item = ()
+            except (EOFError, OSError):
+                return  # The queue was closed
+            if item is None:
+                return
+            if item:
+                token, event, span_obj = item
+                if event == "done":
+                    self._finish(token, spans_done=True)
+                else:
+                    emit_span(event, span_obj)
+            with self._lock:
+                expired = [token for token, task in self._tasks.items()
+                           if task.result is not None and time.monotonic() - task.finished_at > SPAN_DRAIN_TIMEOUT]
+            for token in expired:
+                self._finish(token, spans_done=True)
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False):
+        self._pool.shutdown(wait=wait, cancel_futures=cancel_futures)
+        if wait:
+            # Also stops the relay and closes the queue, so no semaphores are left behind at exit
+            self._spans.put(None)
+            self._relay.join(timeout=SPAN_DRAIN_TIMEOUT)
+            self._spans.close()
+            self._spans.join_thread()
+            # Released now rather than by the exit handlers: a server stopped by uvicorn's reloader
+            # is killed before they run, which would leave the queue's semaphores behind
+            self._pool = self._spans = None
+
+
+def _release(blocks: List[shared_memory.SharedMemory]):
+    for block in blocks:
+        block.close()
+        block.unlink()
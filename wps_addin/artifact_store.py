@@ -0,0 +1,349 @@
+"""
+Content-addressed store for generated files (memos, minutes, cover letters, reports, analyses).
+Every file is stored once as a blob named after the hash of its content, in sharded
+subdirectories (<root>/blobs/ab/cd/<sha256>.docx) so no directory grows large. A SQLite index
+maps artifact ids to blobs, giving O(1) lookups for downloads. Artifact ids are derived from the
+normalized request and the content hash, so a repeated generation with the same result gets the
+same, cacheable download link. A background sweeper deletes expired artifacts (TTL) and evicts
+the least recently downloaded ones when the store exceeds its size quota.
+Several backend worker processes can share one store: changes that add or remove blobs run in
+IMMEDIATE transactions, which SQLite serializes across processes.
+"""
+import hashlib
+import io
+import json
+import mimetypes
+import os
+import sqlite3
+import threading
+import time
+import zipfile
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from wps_addin.shared_state import BUSY_TIMEOUT, Lease
+
+MEDIA_TYPES = {
+    ".docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    ".xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    ".pdf": "application/pdf",
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS artifacts (
+    id          TEXT PRIMARY KEY,
+    kind        TEXT NOT NULL,
+    filename    TEXT NOT NULL,
+    path        TEXT NOT NULL,
+    media_type  TEXT NOT NULL,
+    size        INTEGER NOT NULL,
+    created_at  REAL NOT NULL,
+    last_access REAL NOT NULL,
+    expires_at  REAL
+);
+CREATE INDEX IF NOT EXISTS artifacts_expires_at ON artifacts (expires_at);
+CREATE INDEX IF NOT EXISTS artifacts_last_access ON artifacts (last_access);
+CREATE INDEX IF NOT EXISTS artifacts_path ON artifacts (path);
+"""
+
+# Columns added after the first version of the index (added to existing databases on open)
+_MIGRATIONS = {
+    "content_hash": "ALTER TABLE artifacts ADD COLUMN content_hash TEXT",
+    "request_hash": "ALTER TABLE artifacts ADD COLUMN request_hash TEXT",
+}
+
+
+class Artifact(BaseModel):
+    """An indexed file in the store."""
+    id: str
+    kind: str
+    filename: str  # Name offered to the user when downloading
+    path: str      # Absolute path on disk (shared by artifacts with the same content)
+    media_type: str
+    size: int
+    created_at: float
+    last_access: float
+    expires_at: Optional[float] = None
+    content_hash: Optional[str] = None
+    request_hash: Optional[str] = None
+
+    @property
+    def etag(self) -> Optional[str]:
+        return f'"{self.content_hash}"' if self.content_hash else None
+
+
+def _media_type(filename: str) -> str:
+    extension = os.path.splitext(filename)[1].lower()
+    return MEDIA_TYPES.get(extension) or mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+
+def _normalize(value: Any) -> Any:
+    """Trims and collapses whitespace in strings, recursively, so cosmetic differences hash alike."""
+    if isinstance(value, str):
+        return " ".join(value.split())
+    if isinstance(value, dict):
+        return {str(key): _normalize(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(item) for item in value]
+    return value
+
+
+def request_hash(kind: str, payload: Dict[str, Any]) -> str:
+    """
+    Hash of a normalized request: keys sorted, strings trimmed with whitespace collapsed.
+    Two requests that only differ in formatting get the same hash.
+    """
+    canonical = json.dumps({"kind": kind, "request": _normalize(payload)}, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def content_hash(data: bytes, filename: str = "") -> str:
+    """
+    SHA-256 of a file's content. Office files (.docx/.xlsx) are zip archives whose entries carry
+    the time they were written, so they are hashed by entry names and uncompressed data instead:
+    saving the same document twice gives the same hash.
+    """
+    digest = hashlib.sha256()
+    if os.path.splitext(filename)[1].lower() in (".docx", ".xlsx"):
+        try:
+            with zipfile.ZipFile(io.BytesIO(data)) as archive:
+                for name in sorted(archive.namelist()):
+                    member = archive.read(name)
+                    digest.update(name.encode("utf-8") + b"\0" + str(len(member)).encode() + b"\0")
+                    digest.update(member)
+            return digest.hexdigest()
+        except zipfile.BadZipFile:
+            digest = hashlib.sha256()
+    digest.update(data)
+    return digest.hexdigest()
+
+
+class ArtifactStore:
+    """
+    Indexed, size-bounded store of generated files.
+
+    Args:
+        root (str): Directory holding the shards and the index database.
+        ttl_seconds (Optional[float]): Lifetime of an artifact. None keeps artifacts until evicted by the quota.
+        max_bytes (Optional[int]): Size quota; least recently downloaded artifacts are evicted above it.
+    """
+
+    INDEX_NAME = "index.sqlite3"
+
+    def __init__(self, root: str, ttl_seconds: Optional[float] = 7 * 24 * 3600, max_bytes: Optional[int] = 2 * 1024 ** 3):
+        self.root = os.path.abspath(root)
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        os.makedirs(self.root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(self.root, self.INDEX_NAME), timeout=BUSY_TIMEOUT, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+        columns = {row["name"] for row in self._db.execute("PRAGMA table_info(artifacts)")}
+        for column, statement in _MIGRATIONS.items():
+            if column not in columns:
+                self._db.execute(statement)
+        self._db.execute("CREATE INDEX IF NOT EXISTS artifacts_request ON artifacts (request_hash)")
+        self._sweeper: Optional[threading.Thread] = None
+        self._stop_sweeper = threading.Event()
+
+    #  Adding artifacts
+    def _blob_path(self, digest: str, extension: str) -> str:
+        directory = os.path.join(self.root, "blobs", digest[:2], digest[2:4])
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, digest + extension)
+
+    def put_bytes(self, data: bytes, kind: str, filename: str, request_hash: Optional[str] = None, ttl_seconds: Optional[float] = None) -> Artifact:
+        """
+        Stores `data` once per content hash and indexes it as an artifact.
+
+        The artifact id is derived from the kind, the request hash (or the file name if there is
+        none) and the content hash. Storing the same content for the same request again returns
+        the existing artifact with its expiry renewed, so its download link stays the same.
+
+        Args:
+            filename (str): Name offered for downloads; '{id}' is replaced by the artifact id.
+            request_hash (Optional[str]): request_hash() of the request that produced the file.
+        """
+        digest = content_hash(data, filename)
+        key = request_hash or filename
+        artifact_id = hashlib.sha256(f"{kind}\0{key}\0{digest}".encode("utf-8")).hexdigest()[:32]
+        filename = filename.replace("{id}", artifact_id)
+        path = self._blob_path(digest, os.path.splitext(filename)[1].lower())
+
+        now = time.time()
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        artifact = Artifact(
+            id=artifact_id, kind=kind, filename=filename, path=path, media_type=_media_type(filename),
+            size=len(data), created_at=now, last_access=now, expires_at=now + ttl if ttl else None,
+            content_hash=digest, request_hash=request_hash,
+        )
+        # Blob files are written and removed under the lock and a write transaction, so a sweep
+        # (in any worker process) cannot delete a blob between the existence check and the insert
+        with self._lock, self._db:
+            self._db.execute("BEGIN IMMEDIATE")
+            if not os.path.exists(path):
+                temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(temp_path, "wb") as f:
+                    f.write(data)
+                os.replace(temp_path, path)  # Readers never see a half-written file
+            existing = self._db.execute("SELECT created_at FROM artifacts WHERE id = ?", (artifact_id,)).fetchone()
+            if existing is not None:
+                artifact.created_at = existing["created_at"]
+            # Re-inserting a duplicate renews it (and restores a blob removed by an earlier sweep)
+            self._db.execute(
+                "INSERT OR REPLACE INTO artifacts (id, kind, filename, path, media_type, size, created_at, last_access, "
+                "expires_at, content_hash, request_hash) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (artifact.id, artifact.kind, artifact.filename, os.path.relpath(path, self.root), artifact.media_type,
+                 artifact.size, artifact.created_at, artifact.last_access, artifact.expires_at, digest, request_hash),
+            )
+        return artifact
+
+    def save_document(self, document_obj, kind: str, request_hash: Optional[str] = None, ttl_seconds: Optional[float] = None) -> Artifact:
+        """Saves a python-docx Document into the store."""
+        buffer = io.BytesIO()
+        document_obj.save(buffer)
+        return self.put_bytes(buffer.getvalue(), kind, f"{kind}_{{id}}.docx", request_hash, ttl_seconds)
+
+    def ingest_file(self, source_path: str, kind: str, move: bool = True, request_hash: Optional[str] = None, ttl_seconds: Optional[float] = None) -> Artifact:
+        """
+        Adds a file written elsewhere (e.g. by the report or analysis agents) to the store.
+
+        Args:
+            source_path (str): The file to add. It keeps its name for downloads.
+            move (bool): Remove the source file once it is stored (default).
+        """
+        with open(source_path, "rb") as f:
+            data = f.read()
+        artifact = self.put_bytes(data, kind, os.path.basename(source_path), request_hash, ttl_seconds)
+        if move:
+            self._remove_file(source_path)
+        return artifact
+
+    #  Lookup
+    def _row_to_artifact(self, row: sqlite3.Row) -> Artifact:
+        data = dict(row)
+        data["path"] = os.path.join(self.root, data["path"])
+        return Artifact(**data)
+
+    def get(self, artifact_id: str, touch: bool = True) -> Optional[Artifact]:
+        """Returns the artifact with this id, or None if it is unknown, expired or missing on disk."""
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT * FROM artifacts WHERE id = ?", (artifact_id,)).fetchone()
+            if row is None or (row["expires_at"] is not None and row["expires_at"] <= now):
+                return None
+            if touch:
+                with self._db:
+                    self._db.execute("UPDATE artifacts SET last_access = ? WHERE id = ?", (now, artifact_id))
+        artifact = self._row_to_artifact(row)
+        return artifact if os.path.exists(artifact.path) else None
+
+    def _unreferenced(self, paths: List[str]) -> List[str]:
+        """Returns the blob paths (relative) that no artifact row refers to any more. Call with the lock held."""
+        return [path for path in set(paths)
+                if self._db.execute("SELECT 1 FROM artifacts WHERE path = ? LIMIT 1", (path,)).fetchone() is None]
+
+    def delete(self, artifact_id: str) -> bool:
+        with self._lock, self._db:
+            self._db.execute("BEGIN IMMEDIATE")
+            row = self._db.execute("SELECT path FROM artifacts WHERE id = ?", (artifact_id,)).fetchone()
+            if row is None:
+                return False
+            self._db.execute("DELETE FROM artifacts WHERE id = ?", (artifact_id,))
+            for path in self._unreferenced([row["path"]]):
+                self._remove_file(os.path.join(self.root, path))
+        return True
+
+    def usage(self) -> Tuple[int, int]:
+        """Returns (artifact count, bytes on disk) from the index. Shared blobs are counted once."""
+        with self._lock:
+            (count,) = self._db.execute("SELECT COUNT(*) FROM artifacts").fetchone()
+            (total,) = self._db.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM (SELECT path, MAX(size) AS size FROM artifacts GROUP BY path)"
+            ).fetchone()
+        return count, total
+
+    #  Cleanup
+    @staticmethod
+    def _remove_file(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            # e.g. the file is still open on Windows; the next sweep will not see it again
+            print(f"Warning: Could not delete artifact file {path}: {e}")
+
+    def sweep(self) -> Tuple[int, int]:
+        """
+        Deletes expired artifacts, then evicts least recently downloaded ones until the store
+        is within its size quota. Returns (expired, evicted) counts.
+        """
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute("BEGIN IMMEDIATE")
+            expired: List[sqlite3.Row] = self._db.execute(
+                "SELECT id, path FROM artifacts WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,)
+            ).fetchall()
+            evicted: List[sqlite3.Row] = []
+            if self.max_bytes:
+                live = self._db.execute(
+                    "SELECT id, path, size FROM artifacts WHERE expires_at IS NULL OR expires_at > ? ORDER BY last_access", (now,)
+                ).fetchall()
+                # A blob only frees space once every artifact sharing it is evicted
+                references: Dict[str, int] = {}
+                sizes: Dict[str, int] = {}
+                for row in live:
+                    references[row["path"]] = references.get(row["path"], 0) + 1
+                    sizes[row["path"]] = row["size"]
+                total = sum(sizes.values())
+                for row in live:
+                    if total <= self.max_bytes:
+                        break
+                    evicted.append(row)
+                    references[row["path"]] -= 1
+                    if references[row["path"]] == 0:
+                        total -= sizes[row["path"]]
+            doomed = expired + evicted
+            if doomed:
+                self._db.executemany("DELETE FROM artifacts WHERE id = ?", [(row["id"],) for row in doomed])
+                for path in self._unreferenced([row["path"] for row in doomed]):
+                    self._remove_file(os.path.join(self.root, path))
+
+        if doomed:
+            print(f"Artifact store: removed {len(expired)} expired and {len(evicted)} evicted artifacts.")
+        return len(expired), len(evicted)
+
+    def start_sweeper(self, interval_seconds: float = 300.0, lease: Optional[Lease] = None):
+        """
+        Runs sweep() every `interval_seconds` on a daemon thread.
+
+        Args:
+            lease (Optional[Lease]): When several worker processes share the store, only the
+                holder of this lease sweeps.
+        """
+        if self._sweeper is not None:
+            return
+
+        def run():
+            while not self._stop_sweeper.wait(interval_seconds):
+                try:
+                    if lease is None or lease.acquire():
+                        self.sweep()
+                except Exception as e:
+                    print(f"Warning: Artifact sweep failed: {e}")
+
+        self._stop_sweeper.clear()
+        self._sweeper = threading.Thread(target=run, name="artifact-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def close(self):
+        self._stop_sweeper.set()
+        if self._sweeper is not None:
+            self._sweeper.join()
+            self._sweeper = None
+        with self._lock:
+            self._db.close()
@@ -437,16 +437,33 @@ This server is intended to be run as a standalone 64-bit executable.
 """
 import os
 import sys
-from fastapi import FastAPI, HTTPException
+import json
+from fastapi import FastAPI, Header, HTTPException, Request, WebSocket
 from pydantic import BaseModel
 import docx
-import uuid  # For generating unique filenames
+import re
+import hmac
+import threading
+import time
+import anyio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
 
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import Response
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from starlette.middleware.gzip import DEFAULT_EXCLUDED_CONTENT_TYPES
 
 from dotenv import load_dotenv
 
+if __name__ == "__main__":
+    # Started as a script (python -m wps_addin.backend_server): hand over to the launcher, so the
+    # server is initialized once, in the module imported as wps_addin.backend_server, and
+    # spawned analysis workers re-import the light launcher instead of this module
+    import runpy
+    runpy.run_module("wps_addin.run_backend", run_name="__main__", alter_sys=True)
+    sys.exit()
+
 def get_base_path():
     """ Get the base path for the application, handling PyInstaller's _MEIPASS folder. """
     if getattr(sys, 'frozen', False):
@@ -485,13 +502,31 @@ try:
     from app.agents.reports import ReportAgent
     from app.agents.articles import ArticleAgent
     from app.agents.documents import DocumentGenerationAgent, DocumentRequest  # DocumentRequest is crucial
+    from wps_addin.batch_pipeline import parse_batch_items, run_bounded
+    from app.agents.tracing import add_chunk_listener, add_span_listener, bind_context, configure_from_env as configure_tracing, request_context, span
+    from app.agents.docx_factory import default_factory
+    from wps_addin import batch_pipeline, metrics
+    from wps_addin.artifact_store import MEDIA_TYPES, ArtifactStore, request_hash
+    from wps_addin.single_flight import SingleFlight, flight_key
+    from wps_addin.idempotency import IdempotencyMiddleware, SQLiteIdempotencyStore
+    from wps_addin.shared_state import Lease
+    from wps_addin.ws_channel import WebSocketChannel
+    from wps_addin.scheduler import AdmissionController, AdmissionMiddleware, WorkloadClass
+    from wps_addin.sampling_profiler import FORMATS as PROFILE_FORMATS, SamplingProfiler
+    from wps_addin.analysis_pool import AnalysisPool
+    from wps_addin.block_store import BlockStore, UnknownDocument
+    from wps_addin.compression import RequestDecompressionMiddleware
+    from wps_addin.document_blocks import block_hash, content_defined_groups, split_blocks
 except ImportError as e:
     print(f"FATAL: Could not import agent modules. Ensure the 'app' folder is in the same directory. Error: {e}")
     sys.exit(1)
 
 print("Backend Server: Initializing AI agents...")
+configure_tracing()
+add_span_listener(metrics.llm_span_listener)
 try:
-    llm_client = LLMClient(provider="deepseek")
+    # LLM_PROVIDER=stub runs the backend against the local fake model (no network, for load tests)
+    llm_client = LLMClient(provider=os.getenv("LLM_PROVIDER", "deepseek"), model=os.getenv("LLM_MODEL") or None)
     report_agent = ReportAgent(llm_client)
     article_agent = ArticleAgent(llm_client)
     data_agent = StructuredDataAgent(llm_client)
@@ -502,163 +537,486 @@ except Exception as e:
     sys.exit(1)
 
 # Initialize FastAPI Server
+# Batch generation limits (overridable from the environment)
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "32"))
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "1000"))
+# Admin endpoints (e.g. /admin/profile) are disabled unless a token is configured
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "120"))
+# Server worker processes (main() passes --workers on to uvicorn through this variable)
+BACKEND_WORKERS = max(1, int(os.getenv("BACKEND_WORKERS", "1")))
+# Worker processes for the CPU-bound analysis stages (0 runs them in the server process).
+# The default splits the cores between the server workers; with a single core it is 0.
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", str(max(0, min(4, (os.cpu_count() or 2) // BACKEND_WORKERS - 1)))))
+
+# Generated files: indexed store with TTL and size-quota cleanup
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", "generated_documents")
+ARTIFACT_TTL_HOURS = float(os.getenv("ARTIFACT_TTL_HOURS", "168"))
+ARTIFACT_MAX_MB = float(os.getenv("ARTIFACT_MAX_MB", "2048"))
+ARTIFACT_SWEEP_SECONDS = float(os.getenv("ARTIFACT_SWEEP_SECONDS", "300"))
+artifact_store = ArtifactStore(
+    ARTIFACT_DIR,
+    ttl_seconds=ARTIFACT_TTL_HOURS * 3600 if ARTIFACT_TTL_HOURS > 0 else None,
+    max_bytes=int(ARTIFACT_MAX_MB * 1024 * 1024) if ARTIFACT_MAX_MB > 0 else None,
+)
+# State shared by all server workers (idempotency records, leases), next to the artifact index
+STATE_DB = os.getenv("BACKEND_STATE_DB", os.path.join(ARTIFACT_DIR, "state.sqlite3"))
+# Only one worker at a time runs the artifact sweeper
+sweeper_lease = Lease(STATE_DB, "artifact-sweeper", ttl_seconds=3 * ARTIFACT_SWEEP_SECONDS)
+if sweeper_lease.acquire():
+    artifact_store.sweep()
+artifact_store.start_sweeper(ARTIFACT_SWEEP_SECONDS, lease=sweeper_lease)
+
+# Delta uploads: document blocks and chunk summaries shared by all workers
+DOCUMENT_CACHE_HOURS = float(os.getenv("DOCUMENT_CACHE_HOURS", "72"))
+block_store = BlockStore(STATE_DB, ttl_seconds=DOCUMENT_CACHE_HOURS * 3600)
+# Documents longer than this are summarized chunk by chunk (chunk summaries are cached)
+SUMMARY_CHUNK_CHARS = int(os.getenv("SUMMARY_CHUNK_CHARS", "12000"))
+SUMMARY_WORKERS = int(os.getenv("SUMMARY_WORKERS", "4"))
+
+# Identical requests in flight at the same time share one computation
+flights = SingleFlight()
+
+# Retries that send the same Idempotency-Key get the stored result instead of a new run
+IDEMPOTENCY_TTL_HOURS = float(os.getenv("IDEMPOTENCY_TTL_HOURS", "24"))
+IDEMPOTENT_PATHS = ["/process", "/summarize", "/analyze", "/create_report",
+                    "/generate_document", "/create_cover_letter", "/create_minutes", "/create_memo"]
+idempotency_store = SQLiteIdempotencyStore(STATE_DB, ttl_seconds=IDEMPOTENCY_TTL_HOURS * 3600)
+
+# Responses at least this large are gzip-compressed for clients that accept it
+GZIP_MIN_BYTES = int(os.getenv("GZIP_MIN_BYTES", "1024"))
+
+# Admission control: separate pools per workload class, interactive requests first
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, str(default)))
+
+SHORT_SUMMARY_BYTES = _env_int("SCHED_SHORT_SUMMARY_BYTES", 20000)
+admission = AdmissionController(
+    [
+        WorkloadClass("interactive", _env_int("SCHED_INTERACTIVE_CONCURRENCY", 8), _env_int("SCHED_INTERACTIVE_QUEUE", 64), priority=0),
+        WorkloadClass("document", _env_int("SCHED_DOCUMENT_CONCURRENCY", 4), _env_int("SCHED_DOCUMENT_QUEUE", 32), priority=1),
+        WorkloadClass("heavy", _env_int("SCHED_HEAVY_CONCURRENCY", 2), _env_int("SCHED_HEAVY_QUEUE", 8), priority=2),
+    ],
+    max_total=_env_int("SCHED_MAX_TOTAL", 0) or None,
+    max_wait=float(os.getenv("SCHED_MAX_WAIT_SECONDS", "60")),
+)
+WORKLOAD_BY_PATH = {
+    "/process": "interactive",
+    "/summarize": "interactive",  # Long documents (inline or uploaded) are moved to 'heavy' below
+    "/document_blocks": "interactive",
+    "/generate_document": "document",
+    "/create_cover_letter": "document",
+    "/create_minutes": "document",
+    "/create_memo": "document",
+    "/analyze": "heavy",
+    "/create_report": "heavy",
+    "/batch_documents": "heavy",
+}
+
+def classify_request(scope):
+    """Workload class of a request, or None for requests that bypass admission control."""
+    if scope["method"] != "POST":
+        return None
+    workload = WORKLOAD_BY_PATH.get(scope["path"])
+    if scope["path"] == "/summarize":
+        try:
+            content_length = int(dict(scope["headers"]).get(b"content-length", b"0") or 0)
+        except ValueError:
+            content_length = 0  # Malformed header: the body parser rejects the request
+        if content_length > SHORT_SUMMARY_BYTES:
+            workload = "heavy"
+    return workload
+
+def classify_request_body(scope, body: bytes, workload: str) -> str:
+    """
+    A short /summarize body may refer to a delta-uploaded document (document_id) instead of
+    carrying the text. Only documents of at least DELTA_UPLOAD_MIN_CHARS are uploaded, and they
+    are summarized chunk by chunk, so they run in the 'heavy' pool like long inline documents.
+    """
+    if workload != "interactive":
+        return workload
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return workload
+    if isinstance(payload, dict) and payload.get("document_id") and not payload.get("content"):
+        return "heavy"
+    return workload
+
 app = FastAPI(title="AI Office Automation Backend Server")
 
+CORS_ORIGINS = ["http://localhost:5173", "http://127.0.0.1:5173"]  # React dev server origins
+
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["http://localhost:5173", "http://127.0.0.1:5173"],  # React dev server origins
+    allow_origins=CORS_ORIGINS,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
 )
 
+# Request ids supplied by clients are only kept if they look like ids
+_REQUEST_ID_RE = re.compile(r'^[A-Za-z0-9._:-]{1,128}$')
+
+@app.middleware("http")
+async def tracing_middleware(request: Request, call_next):
+    """Runs every request in a server span and returns its id in the X-Request-ID header."""
+    supplied_id = request.headers.get("X-Request-ID", "")
+    with request_context(supplied_id if _REQUEST_ID_RE.match(supplied_id) else None) as request_id:
+        with span(f"{request.method} {request.url.path}", kind="server", **{"http.method": request.method, "http.target": request.url.path}) as server_span:
+            response = await call_next(request)
+            # Name the span after the route template, so /download/{filename} is one operation
+            route = request.scope.get("route")
+            if route is not None:
+                server_span.name = f"{request.method} {route.path}"
+                server_span.set_attribute("http.route", route.path)
+            server_span.set_attribute("http.status_code", response.status_code)
+            if response.status_code >= 500:
+                server_span.status = "error"
+    response.headers["X-Request-ID"] = request_id
+    return response
+
+app.add_middleware(AdmissionMiddleware, controller=admission, classify=classify_request,
+                   classify_body=classify_request_body, body_paths=["/summarize"])
+# Retries attached to a running request do not take an admission slot
+app.add_middleware(IdempotencyMiddleware, store=idempotency_store, paths=IDEMPOTENT_PATHS)
+# Compressed request bodies are restored before idempotency and admission control look at them
+app.add_middleware(RequestDecompressionMiddleware)
+# Generated files are already zip archives, and batch progress must not wait in a gzip buffer
+app.add_middleware(GZipMiddleware, minimum_size=GZIP_MIN_BYTES, compresslevel=6,
+                   exclude_content_types=DEFAULT_EXCLUDED_CONTENT_TYPES + tuple(MEDIA_TYPES.values()) + ("application/x-ndjson",))
+# Outermost, so the latency includes the other middleware
+app.add_middleware(metrics.MetricsMiddleware)
+
+#  Metrics collected at scrape time
+metrics.register_cache("docx_prototypes", lambda: (default_factory.hits, default_factory.misses))
+metrics.register_cache("single_flight", flights.stats)
+metrics.register_cache("idempotency", idempotency_store.stats)
+metrics.register_cache("chunk_summaries", block_store.summary_stats)
+metrics.register_queue("batch_documents", lambda: batch_pipeline.stats.depth)
+metrics.register_queue("websocket_requests", lambda: channel.active_requests)
+
+def _admission_metrics():
+    snapshot = admission.snapshot()
+    def family(name, kind, documentation, field):
+        return metrics.CollectedMetric(name, kind, documentation, [({"workload": workload}, stats[field]) for workload, stats in snapshot.items()])
+    return [
+        family("admission_running", "gauge", "Requests running, by workload class.", "running"),
+        family("admission_queued", "gauge", "Requests waiting for a slot, by workload class.", "queued"),
+        family("admission_rejected", "counter", "Requests rejected with 503, by workload class.", "rejected"),
+        family("admission_admitted", "counter", "Requests admitted, by workload class.", "admitted"),
+    ]
+
+metrics.registry.add_collector(_admission_metrics)
+
+def _artifact_metrics():
+    files, size = artifact_store.usage()
+    return [
+        metrics.CollectedMetric("artifact_store_bytes", "gauge", "Size of the generated files in the artifact store.", [({}, size)]),
+        metrics.CollectedMetric("artifact_store_files", "gauge", "Number of generated files in the artifact store.", [({}, files)]),
+    ]
+
+metrics.registry.add_collector(_artifact_metrics)
+THREADPOOL_BUSY = metrics.registry.gauge("threadpool_busy_threads", "Worker threads in use by sync endpoints.")
+THREADPOOL_LIMIT = metrics.registry.gauge("threadpool_max_threads", "Size of the worker thread pool for sync endpoints.")
+
 # Define Pydantic Models for API Request Bodies
 class ProcessRequest(BaseModel):
     prompt: str
     content: str = ""  # Optional content field for analysis/summarization
+    document_id: str = ""  # A document uploaded through /document_blocks, used when content is empty
 
 class GeneralResponse(BaseModel):
     result: str
 
+class DocumentBlocksRequest(BaseModel):
+    blocks: List[str]  # Hashes of all blocks of the document, in order
+    texts: Dict[str, str] = {}  # Hash -> text of the blocks being uploaded
+
+class DocumentBlocksResponse(BaseModel):
+    document_id: str
+    missing: List[str]  # Blocks the server lacks; the document is stored once this is empty
+    blocks: int
+    chars: int
+
+# Add-in channel: requests multiplexed over one WebSocket, with pushed progress and tokens
+# Browser pages may only connect from the CORS origins or the backend's own origin
+channel = WebSocketChannel(app, paths=IDEMPOTENT_PATHS,
+                           allowed_origins=CORS_ORIGINS + ["http://127.0.0.1:8000", "http://localhost:8000"])
+add_span_listener(channel.span_listener)
+add_chunk_listener(channel.chunk_listener)
+
 # FastAPI Endpoints
+@app.websocket("/ws")
+async def websocket_endpoint(websocket: WebSocket):
+    """Persistent add-in connection (protocol in wps_addin/ws_channel.py)."""
+    await channel.serve(websocket)
+
 @app.get("/")
 def root():
     return {"message": "AI Office Backend Server is running."}
 
+# Readiness, polled by the add-in's backend supervisor (wps_addin/backend_supervisor.py)
+STARTED_AT = time.time()
+readiness = {"startup_complete": False, "analysis_pool": "disabled"}
+
+@app.get("/ready")
+def ready_endpoint():
+    """200 once startup has finished and the analysis workers are warm, 503 until then."""
+    ready = readiness["startup_complete"] and readiness["analysis_pool"] != "warming"
+    body = {"status": "ready" if ready else "starting", "pid": os.getpid(),
+            "uptime_seconds": round(time.time() - STARTED_AT, 1), **readiness}
+    if not ready:
+        return JSONResponse(body, status_code=503, headers={"Retry-After": "1"})
+    return body
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus scrape endpoint (text exposition format)."""
+    # The threadpool limiter can only be read from the event loop
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    THREADPOOL_BUSY.set(limiter.borrowed_tokens)
+    THREADPOOL_LIMIT.set(limiter.total_tokens)
+    return Response(content=metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.on_event("startup")
+async def size_threadpool():
+    """
+    Sizes the worker threadpool for sync endpoints to the admission pools, plus room for
+    batch items and unclassified endpoints (downloads), so admitted requests never queue
+    again behind the threadpool limit.
+    """
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    limiter.total_tokens = sum(workload.concurrency for workload in admission.classes.values()) + BATCH_MAX_CONCURRENCY + 8
+    print(f"Backend: Worker threadpool sized to {limiter.total_tokens} threads.")
+
+analysis_pool = None
+
+@app.on_event("startup")
+def start_analysis_pool():
+    """Starts the analysis worker processes and warms them up in the background."""
+    global analysis_pool
+    if ANALYSIS_WORKERS <= 0:
+        return
+    analysis_pool = AnalysisPool(ANALYSIS_WORKERS)
+    data_agent.cpu_executor = analysis_pool
+    metrics.register_queue("analysis_pool", lambda: analysis_pool.pending)
+    readiness["analysis_pool"] = "warming"
+
+    def warm():
+        started = time.monotonic()
+        try:
+            pids = analysis_pool.warm()
+            readiness["analysis_pool"] = "warm"
+            print(f"Backend: {len(pids)} analysis worker processes ready in {time.monotonic() - started:.1f}s.")
+        except Exception as e:
+            readiness["analysis_pool"] = "failed"  # Analyses start their workers on demand
+            print(f"Backend: Could not warm up the analysis workers: {e}")
+
+    threading.Thread(target=warm, name="analysis-pool-warmup", daemon=True).start()
+
+@app.on_event("startup")
+def mark_startup_complete():
+    # Registered after the other startup handlers, so it runs last
+    readiness["startup_complete"] = True
+
+@app.on_event("shutdown")
+def stop_analysis_pool():
+    if analysis_pool is not None:
+        data_agent.cpu_executor = None
+        # Requests have finished by now; waiting lets the workers and their queues close cleanly
+        analysis_pool.shutdown(wait=True, cancel_futures=True)
+
+@app.on_event("shutdown")
+def release_leases():
+    """Hands the sweeper over to another worker straight away."""
+    sweeper_lease.release()
+
+_profile_lock = anyio.Lock()
+
+@app.get("/admin/profile")
+async def profile_endpoint(
+    seconds: float = 10.0,
+    format: str = "collapsed",
+    interval_ms: float = 10.0,
+    idle: bool = False,
+    x_admin_token: str = Header(default=""),
+):
+    """
+    Samples the stacks of every thread of the running server for `seconds` and returns a
+    collapsed-stack file (for flamegraph tools) or speedscope JSON with one profile per thread.
+    Requires the X-Admin-Token header to match ADMIN_TOKEN.
+    """
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (ADMIN_TOKEN is not set).")
+    if not hmac.compare_digest(x_admin_token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token.")
+    if format not in PROFILE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format '{format}'. Choose from {list(PROFILE_FORMATS)}.")
+    if not 0 < seconds <= PROFILE_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must be between 0 and {PROFILE_MAX_SECONDS:g}.")
+    if _profile_lock.locked():
+        raise HTTPException(status_code=409, detail="A profile is already being recorded.")
+
+    async with _profile_lock:
+        profiler = SamplingProfiler(interval=interval_ms / 1000.0, include_idle=idle)
+        # The sampler runs on its own thread; the event loop keeps serving requests meanwhile
+        with profiler:
+            await anyio.sleep(seconds)
+
+    print(f"Backend: Recorded a {profiler.duration:.1f}s profile ({profiler.sample_count} samples).")
+    stamp = time.strftime("%Y%m%d_%H%M%S")
+    if format == "speedscope":
+        filename, media_type = f"profile_{stamp}.speedscope.json", "application/json"
+    else:
+        filename, media_type = f"profile_{stamp}.folded", "text/plain; charset=utf-8"
+    return Response(content=profiler.export(format), media_type=media_type,
+                    headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
 # Endpoint to serve downloadable files
 @app.get("/download/{filename}")
-async def download_file(filename: str):
-    """Serves a generated file for download."""
-    file_path = os.path.join("generated_documents", filename)  # Store in a subfolder
-    if not os.path.exists(file_path):
-        raise HTTPException(status_code=404, detail="File not found")
-
-    # Determine media type based on file extension
-    media_type = "application/octet-stream"
-    if filename.endswith(".docx"):
-        media_type = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-    elif filename.endswith(".pdf"):
-        media_type = "application/pdf"
-    elif filename.endswith(".xlsx"):
-        media_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    # Add more types as needed
-
-    with open(file_path, "rb") as file:
-        content = file.read()
-    
-    # Optional: Clean up the file after it's served if it's meant to be single-use
-    # os.remove(file_path)  # Uncomment if you want single-use files
+def download_file(filename: str, if_none_match: str = Header(default="")):
+    """Serves a generated file for download, by artifact id."""
+    artifact = artifact_store.get(filename)
+    if artifact is not None:
+        # Artifacts never change once stored, so the content hash is a strong ETag
+        headers = {"Cache-Control": "private, max-age=86400, immutable"}
+        if artifact.etag:
+            headers["ETag"] = artifact.etag
+            if artifact.etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+                return Response(status_code=304, headers=headers)
+        # FileResponse streams the file instead of reading it into memory
+        return FileResponse(artifact.path, media_type=artifact.media_type, filename=artifact.filename, headers=headers)
+
+    # Links handed out before the artifact store used the file name in generated_documents/
+    legacy_path = os.path.join("generated_documents", os.path.basename(filename))
+    if filename.endswith(".docx") and os.path.isfile(legacy_path):
+        return FileResponse(legacy_path, media_type=MEDIA_TYPES[".docx"], filename=os.path.basename(filename))
+    raise HTTPException(status_code=404, detail="File not found")
+
+def _download_link(artifact) -> str:
+    return f"http://127.0.0.1:8000/download/{artifact.id}"
+
+def save_document_and_get_download_link(document_obj: docx.Document, doc_type: str, source_request: BaseModel = None) -> str:
+    """
+    Saves a docx.Document object to the artifact store and returns its download URL.
+    Identical output for the same (normalized) request gets the same link.
+    """
+    fingerprint = request_hash(doc_type, source_request.model_dump(mode="json")) if source_request is not None else None
+    with span("docx.save"):
+        artifact = artifact_store.save_document(document_obj, doc_type, request_hash=fingerprint)
+    print(f"Document saved to: {artifact.path}")
+    return _download_link(artifact)
 
-    return Response(content=content, media_type=media_type, headers={
-        "Content-Disposition": f"attachment; filename={filename}"
-    })
+# General Document Generation Endpoint (The fallback)
+def _document_preview(document_obj: docx.Document) -> str:
+    """Returns the first 500 characters of a generated document for the response preview."""
+    paragraphs = document_obj.paragraphs
+    return "\n".join([para.text for para in paragraphs])[:500] + "..." if paragraphs else "No content generated."
 
-def save_document_and_get_download_link(document_obj: docx.Document, doc_type: str) -> str:
-    """Saves a docx.Document object to a temporary file and returns its download URL."""
-    # Ensure the directory for generated documents exists
-    output_dir = "generated_documents"
-    os.makedirs(output_dir, exist_ok=True)
+def _build_document(request: DocumentRequest):
+    output_document_obj = document_agent.generate_document(request)
+    download_link = save_document_and_get_download_link(output_document_obj, request.doc_type, request)
+    return download_link, _document_preview(output_document_obj)
+
+def build_document(request: DocumentRequest):
+    """
+    Generates and stores a document for the request. Returns (download_link, preview_text).
+    Concurrent identical requests (including batch items) share one generation.
+    """
+    return flights.do(flight_key("document", request.model_dump(mode="json")), _build_document, request)
 
-    unique_filename = f"{doc_type}_{uuid.uuid4().hex}.docx"
-    file_path = os.path.join(output_dir, unique_filename)
-    document_obj.save(file_path)
-    print(f"Document saved to: {file_path}")
-    return f"http://127.0.0.1:8000/download/{unique_filename}"
 
-# General Document Generation Endpoint (The fallback)
 @app.post("/generate_document", response_model=GeneralResponse)
 def generate_document_endpoint(request: DocumentRequest):
     """Generates a general document based on a complete DocumentRequest object."""
     print(f"Backend: Received a general document request for type: '{request.doc_type}'")
     try:
-        output_document_obj = document_agent.generate_document(request)
-        
-        # Use the save function to get download link
-        download_link = save_document_and_get_download_link(output_document_obj, request.doc_type)
-        
-        # Extract preview text for response
-        temp_file_path = "temp_generated_document.docx"
-        output_document_obj.save(temp_file_path)
-        doc = docx.Document(temp_file_path)
-        preview_text = "\n".join([para.text for para in doc.paragraphs])[:500] + "..." if doc.paragraphs else "No content generated."
-        os.remove(temp_file_path)
-
+        download_link, preview_text = build_document(request)
         result = f"Document generated successfully!\n\nPreview:\n{preview_text}\n\nDownload: {download_link}"
         return GeneralResponse(result=result)
     except Exception as e:
         print(f"Error in generate_document_endpoint: {e}")
         raise HTTPException(status_code=500, detail=f"Document generation failed: {str(e)}")
 
-# Dedicated Cover Letter Endpoint
+
 @app.post("/create_cover_letter", response_model=GeneralResponse)
 def create_cover_letter_endpoint(request: DocumentRequest):
     """Generates a cover letter from structured data."""
     print(f"Backend: Received a request to create a cover letter for: '{request.topic}'")
     try:
         request.doc_type = "cover_letter"
-        output_document_obj = document_agent.generate_document(request)
-        
-        download_link = save_document_and_get_download_link(output_document_obj, "cover_letter")
-        
-        temp_file_path = "temp_cover_letter.docx"
-        output_document_obj.save(temp_file_path)
-        doc = docx.Document(temp_file_path)
-        preview_text = "\n".join([para.text for para in doc.paragraphs])[:500] + "..." if doc.paragraphs else "No content generated."
-        os.remove(temp_file_path)
-        
+        download_link, preview_text = build_document(request)
         result = f"Cover letter generated successfully!\n\nPreview:\n{preview_text}\n\nDownload: {download_link}"
         return GeneralResponse(result=result)
     except Exception as e:
         print(f"Error in create_cover_letter_endpoint: {e}")
         raise HTTPException(status_code=500, detail=f"Cover letter creation failed: {str(e)}")
 
-# Dedicated Meeting Minutes Endpoint
+
 @app.post("/create_minutes", response_model=GeneralResponse)
 def create_minutes_endpoint(request: DocumentRequest):
     """Generates meeting minutes from structured data."""
     print(f"Backend: Received a request to create minutes for: '{request.topic}'")
     try:
         request.doc_type = "minutes"
-        output_document_obj = document_agent.generate_document(request)
-        
-        download_link = save_document_and_get_download_link(output_document_obj, "minutes")
-        
-        temp_file_path = "temp_minutes.docx"
-        output_document_obj.save(temp_file_path)
-        doc = docx.Document(temp_file_path)
-        preview_text = "\n".join([para.text for para in doc.paragraphs])[:500] + "..." if doc.paragraphs else "No content generated."
-        os.remove(temp_file_path)
-        
+        download_link, preview_text = build_document(request)
         result = f"Meeting minutes generated successfully!\n\nPreview:\n{preview_text}\n\nDownload: {download_link}"
         return GeneralResponse(result=result)
     except Exception as e:
         print(f"Error in create_minutes_endpoint: {e}")
         raise HTTPException(status_code=500, detail=f"Meeting minutes creation failed: {str(e)}")
 
-# Dedicated Memo Endpoint
+
 @app.post("/create_memo", response_model=GeneralResponse)
 def create_memo_endpoint(request: DocumentRequest):
     """Generates a memorandum from structured data."""
     print(f"Backend: Received a request to create a memo on topic: '{request.topic}'")
     try:
         request.doc_type = "memo"
-        output_document_obj = document_agent.generate_document(request)
-        
-        download_link = save_document_and_get_download_link(output_document_obj, "memo")
-        
-        temp_file_path = "temp_memo.docx"
-        output_document_obj.save(temp_file_path)
-        doc = docx.Document(temp_file_path)
-        preview_text = "\n".join([para.text for para in doc.paragraphs])[:500] + "..." if doc.paragraphs else "No content generated."
-        os.remove(temp_file_path)
-        
+        download_link, preview_text = build_document(request)
         result = f"Memo generated successfully!\n\nPreview:\n{preview_text}\n\nDownload: {download_link}"
         return GeneralResponse(result=result)
     except Exception as e:
         print(f"Error in create_memo_endpoint: {e}")
         raise HTTPException(status_code=500, detail=f"Memo creation failed: {str(e)}")
+
+
+def _batch_document_worker(request: DocumentRequest) -> dict:
+    """Generates one batch item and returns its per-item status fields."""
+    download_link, _ = build_document(request)
+    return {"doc_type": request.doc_type, "topic": request.topic, "download": download_link}
+
+@app.post("/batch_documents")
+async def batch_documents_endpoint(request: Request, concurrency: int = BATCH_CONCURRENCY):
+    """
+    Generates many documents in one call.
+
+    The body is a JSON array or JSON Lines of DocumentRequest objects. Items run through a
+    bounded concurrent pipeline and one NDJSON status line is streamed back per item as it
+    finishes (in completion order; use 'index' to match items to the input).
+    """
+    try:
+        items = parse_batch_items(await request.body(), DocumentRequest)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid batch body: {e}")
+    if not items:
+        raise HTTPException(status_code=400, detail="No document requests provided.")
+    if len(items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Batch too large: {len(items)} items (max {BATCH_MAX_ITEMS}).")
+
+    concurrency = max(1, min(concurrency, BATCH_MAX_CONCURRENCY))
+    print(f"Backend: Received a batch of {len(items)} document requests (concurrency={concurrency}).")
+
+    async def stream_results():
+        yield json.dumps({"event": "accepted", "total": len(items), "concurrency": concurrency}) + "\n"
+        async for record in run_bounded(items, _batch_document_worker, concurrency):
+            yield json.dumps(record) + "\n"
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
     
-# Dedicated endpoint for Report Generation
 @app.post("/create_report", response_model=GeneralResponse)
 def create_report_endpoint(request: ProcessRequest):
     """Creates a report based on the provided prompt."""
@@ -666,50 +1024,126 @@ def create_report_endpoint(request: ProcessRequest):
     try:
         # Assuming ReportAgent.create_report_content expects a 'topic'
         # The prompt from ProcessRequest is used as the topic.
-        output_content = report_agent.create_report(
-            topic=request.prompt, 
-            tone="professional",  # Default tone
-            length="standard"     # Default length
-        )
-        if not output_content:
-            raise HTTPException(status_code=500, detail="Failed to generate report content.")
-        return GeneralResponse(result=output_content)
+        def create():
+            output_content = report_agent.create_report(
+                topic=request.prompt,
+                tone="professional",  # Default tone
+                length="standard"     # Default length
+            )
+            if not output_content:
+                raise HTTPException(status_code=500, detail="Failed to generate report content.")
+            return artifact_store.ingest_file(output_content, kind="report", request_hash=request_hash("report", request.model_dump()))
+
+        artifact = flights.do(flight_key("create_report", {"prompt": request.prompt}), create)
+        return GeneralResponse(result=f"Report generated successfully!\n\nDownload: {_download_link(artifact)}")
     except Exception as e:
         print(f"Error in create_report_endpoint: {e}")
         raise HTTPException(status_code=500, detail=f"Report generation failed: {str(e)}")
     
+# Delta upload of document text for /analyze and /summarize (see wps_addin/document_blocks.py)
+@app.post("/document_blocks", response_model=DocumentBlocksResponse)
+def document_blocks_endpoint(request: DocumentBlocksRequest):
+    """Stores the uploaded blocks of a document and reports the blocks still missing."""
+    try:
+        doc_id, missing, chars = block_store.put_document(request.blocks, request.texts)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    uploaded = sum(len(text) for text in request.texts.values())
+    print(f"Backend: Received {len(request.texts)} of {len(request.blocks)} document blocks ({uploaded} of {chars} characters).")
+    return DocumentBlocksResponse(document_id=doc_id, missing=missing, blocks=len(request.blocks), chars=chars)
+
+def _document_blocks(request: ProcessRequest) -> List[Tuple[str, str]]:
+    """The (hash, text) blocks of the request's content, or of its uploaded document."""
+    if request.content or not request.document_id:
+        return [(block_hash(block), block) for block in split_blocks(request.content)]
+    try:
+        return block_store.blocks(request.document_id)
+    except UnknownDocument:
+        raise HTTPException(status_code=404, detail="Unknown document_id; upload the document again.")
+
 # Dedicated endpoint for Data Analysis
 @app.post("/analyze", response_model=GeneralResponse)
 def analyze_endpoint(request: ProcessRequest):
     """Analyzes provided text content."""
     print("Backend: Received request to analyze content.")
+    if request.document_id and not request.content:
+        request = request.model_copy(update={"content": "".join(text for _digest, text in _document_blocks(request))})
     try:
         if not request.content:
             raise HTTPException(status_code=400, detail="No content provided for analysis.")
         
-        # The data_agent.analyze_input_content generates the analysis text directly
-        output_content = data_agent.analyze_input(raw_input=request.content, user_question=request.prompt)
-        
-        if not output_content:
-            raise HTTPException(status_code=500, detail="Failed to generate analysis content.")
-        return GeneralResponse(result=output_content)
+        def analyze():
+            # The data_agent.analyze_input_content generates the analysis text directly
+            output_content = data_agent.analyze_input(raw_input=request.content, user_question=request.prompt)
+            if not output_content:
+                raise HTTPException(status_code=500, detail="Failed to generate analysis content.")
+            return artifact_store.ingest_file(output_content, kind="analysis", request_hash=request_hash("analysis", request.model_dump()))
+
+        artifact = flights.do(flight_key("analyze", request.model_dump()), analyze)
+        return GeneralResponse(result=f"Analysis report generated successfully!\n\nDownload: {_download_link(artifact)}")
     except Exception as e:
         print(f"Error in analyze_endpoint: {e}")
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
 
 # Dedicated endpoint for Summarization
+def _complete(prompt: str) -> str:
+    """Streams a completion, so WebSocket clients see the tokens as they arrive."""
+    return "".join(llm_client.stream_response(prompt)).strip()
+
+def _cached_summary(key: str, prompt: str) -> str:
+    """A summary from the chunk summary cache, generated (once across concurrent requests) if absent."""
+    key = f"{llm_client.provider}:{llm_client.model}:{key}"
+    summary = block_store.summary(key)
+    if summary is None:
+        summary = flights.do(flight_key("summarize_chunk", {"key": key}), _complete, prompt)
+        if summary:
+            block_store.put_summary(key, summary)
+    return summary
+
+def summarize_blocks(blocks: List[Tuple[str, str]]) -> str:
+    """
+    Summarizes a document given as (hash, text) blocks. Long documents are split into chunks
+    along content-defined block boundaries; each chunk summary is cached by the chunk's block
+    hashes, so after an edit only the changed chunks go to the LLM before the final combination.
+    """
+    content = "".join(text for _digest, text in blocks)
+    if len(content) <= SUMMARY_CHUNK_CHARS:
+        # The prompt field is not part of the summary request, so only the content is in the key
+        return flights.do(
+            flight_key("summarize", {"content": content}),
+            _complete,
+            f"Please provide a concise summary of the following document:\n\n{content}",
+        )
+    groups = content_defined_groups(
+        [len(text) for _digest, text in blocks], [int(digest[:8], 16) for digest, _text in blocks],
+        SUMMARY_CHUNK_CHARS // 2, SUMMARY_CHUNK_CHARS, divisor=2,
+    )
+    chunks = [(block_hash(":".join(digest for digest, _text in blocks[start:end])), "".join(text for _digest, text in blocks[start:end]))
+              for start, end in groups]
+
+    def summarize_chunk(chunk):
+        chunk_id, text = chunk
+        return _cached_summary(chunk_id, f"Summarize this section of a longer document concisely, keeping its key facts, figures and decisions:\n\n{text}")
+
+    with span("summarize.chunks", chunks=len(chunks)):
+        with ThreadPoolExecutor(max_workers=max(1, min(SUMMARY_WORKERS, len(chunks))), thread_name_prefix="summary-chunk") as executor:
+            partials = list(executor.map(bind_context(summarize_chunk), chunks))
+    sections = "\n\n".join(f"Section {number}:\n{partial}" for number, partial in enumerate(partials, 1))
+    return _cached_summary(
+        block_hash(":".join(chunk_id for chunk_id, _text in chunks)),
+        f"The following are summaries of consecutive sections of one document. Write a concise summary of the whole document:\n\n{sections}",
+    )
+
 @app.post("/summarize", response_model=GeneralResponse)
 def summarize_endpoint(request: ProcessRequest):
-    """Receives text content and returns a summary."""
+    """Receives text content (or an uploaded document id) and returns a summary."""
     print("Backend: Received request to summarize document.")
+    blocks = _document_blocks(request)
     try:
-        if not request.content:
+        if not blocks:
             raise HTTPException(status_code=400, detail="No content provided for summarization.")
-            
-        # Corrected: Using generate_response instead of get_completion
-        summary = llm_client.generate_response(
-            f"Please provide a concise summary of the following document:\n\n{request.content}"
-        )
+
+        summary = summarize_blocks(blocks)
         if not summary:
             raise HTTPException(status_code=500, detail="Failed to generate summary.")
         return GeneralResponse(result=summary)
@@ -724,7 +1158,7 @@ def process_general_prompt(request: ProcessRequest):
     print(f"Backend: Received general prompt: '{request.prompt}'. Content present: {len(request.content) > 0}")
     try:
         # Corrected: Using generate_response instead of get_completion
-        output_content = llm_client.generate_response(request.prompt)
+        output_content = flights.do(flight_key("process", {"prompt": request.prompt}), _complete, request.prompt)
         if not output_content:
             raise HTTPException(status_code=500, detail="Failed to get completion for general prompt.")
         return GeneralResponse(result=output_content)
@@ -732,41 +1166,5 @@ def process_general_prompt(request: ProcessRequest):
         print(f"Error in general process endpoint: {e}")
         raise HTTPException(status_code=500, detail=f"General prompt processing failed: {str(e)}")
 
-# This block allows running the server directly for development
-def main():
-    """
-    This is the main entry point for the bundled executable.
-    It configures and runs the Uvicorn server.
-    """
-    import uvicorn
-    
-    # Check if running in a bundled environment
-    is_bundled = getattr(sys, 'frozen', False)
-    
-    if is_bundled:
-        print("Starting backend server from bundled executable...")
-        # In a bundle, 'reload' must be False.
-        # We can also add file logging for the production server.
-        uvicorn.run(
-            "wps_addin.backend_server:app",  # Point to the app object
-            host="127.0.0.1",
-            port=8000,
-            reload=False,
-            log_level="info"
-        )
-    else:
-        # Development mode
-        print("Starting backend server for development with auto-reload...")
-        uvicorn.run(
-            "wps_addin.backend_server:app",
-            host="127.0.0.1",
-            port=8000,
-            reload=True,
-            log_level="info"
-        )
-
-if __name__ == "__main__":
-    main()
-
-
+# The server is started by wps_addin/run_backend.py (python -m wps_addin.run_backend)
 # uvicorn wps_addin.backend_server:app --reload (use to run the server)
@@ -0,0 +1,307 @@
+"""
+Starts and supervises the local AI backend.
+The add-in starts a supervisor when WPS loads it, so the backend (AI_Backend_Server.exe, or the
+backend module in a development checkout) is already starting before the first ribbon click.
+The supervisor polls the backend's /ready endpoint: it restarts the backend if the process
+exits or stops answering, with a growing delay after repeated crashes, and the regular checks
+keep the idle backend warm. `run_32bit.py /supervise` / `run_64bit.py /supervise` run the
+supervisor on its own, e.g. at sign-in, as a warm standby independent of WPS.
+
+Several WPS windows may each load the add-in. Only the supervisor holding the spawn lock (a
+listening socket on SPAWN_LOCK_PORT, released when its process ends) starts a backend; the
+others use the running one and take over if that supervisor goes away. A backend already
+running when the supervisor starts is used as is. The supervisor cannot restart such a backend:
+if it holds the backend's port but stops answering, the supervisor reports it as unhealthy
+instead of starting a second backend that could not bind the port.
+
+Only the standard library is used, so the 32-bit add-in can run it and it works on Linux.
+"""
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from typing import Callable, List, Optional, Tuple
+
+BACKEND_READY_URL = "http://127.0.0.1:8000/ready"
+# Local port held by the supervisor that may start the backend
+SPAWN_LOCK_PORT = 48217
+# Seconds between health checks of a ready backend (also what keeps it warm)
+HEALTH_INTERVAL = 5.0
+# Seconds a starting backend may take before it is considered hung
+STARTUP_TIMEOUT = 180.0
+# Failed health checks in a row before a running backend is restarted
+UNHEALTHY_AFTER = 3
+# Delay before a restart, doubling after each crash up to the maximum
+RESTART_DELAY = 1.0
+MAX_RESTART_DELAY = 60.0
+
+STOPPED, STARTING, READY, UNHEALTHY, FAILED = "stopped", "starting", "ready", "unhealthy", "failed"
+
+
+def default_command() -> Tuple[Optional[List[str]], Optional[str]]:
+    """
+    The command that starts the backend, and its working directory: the bundled
+    AI_Backend_Server executable installed next to the add-in, or in a development checkout
+    the backend launcher run by this Python, without auto-reload. (None, None) if neither is available.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    directories = [os.path.dirname(sys.executable), here] if getattr(sys, "frozen", False) else [here, os.path.dirname(here)]
+    for directory in directories:
+        for name in ("AI_Backend_Server.exe", "AI_Backend_Server"):
+            candidate = os.path.join(directory, name)
+            if os.path.isfile(candidate):
+                return [candidate], directory
+    # Inside WPS (an in-process add-in) sys.executable is WPS itself, not Python
+    if not getattr(sys, "frozen", False) and os.path.basename(sys.executable).lower().startswith("python"):
+        return [sys.executable, "-m", "wps_addin.run_backend", "--no-reload"], os.path.dirname(here)
+    return None, None
+
+
+class BackendSupervisor:
+    """
+    Keeps one backend process running and ready.
+
+    Args:
+        command (List[str]): Starts the backend.
+        cwd (Optional[str]): Working directory of the backend.
+        ready_url (str): The backend's readiness endpoint (200 when ready, 503 while warming up).
+        output_path (Optional[str]): File receiving the backend's output (discarded if None).
+        log (Callable[[str], None]): Receives state changes.
+        terminate_on_stop (bool): Whether stop() also ends the backend started by this supervisor.
+            The add-in leaves it running for the next WPS window; `/supervise` ends it.
+    """
+
+    def __init__(self, command: List[str], cwd: Optional[str] = None, ready_url: str = BACKEND_READY_URL,
+                 output_path: Optional[str] = None, log: Callable[[str], None] = print, terminate_on_stop: bool = False,
+                 health_interval: float = HEALTH_INTERVAL, startup_timeout: float = STARTUP_TIMEOUT,
+                 unhealthy_after: int = UNHEALTHY_AFTER, spawn_lock_port: Optional[int] = SPAWN_LOCK_PORT):
+        self.command = list(command)
+        self.cwd = cwd
+        self.ready_url = ready_url
+        self.output_path = output_path
+        self.log = log
+        self.terminate_on_stop = terminate_on_stop
+        self.health_interval = health_interval
+        self.startup_timeout = startup_timeout
+        self.unhealthy_after = unhealthy_after
+        self.spawn_lock_port = spawn_lock_port
+        self.state = STOPPED
+        self.process: Optional[subprocess.Popen] = None
+        self.restarts = 0
+        self.last_status = None  # Body of the last successful /ready
+        self._ready = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._spawn_lock: Optional[socket.socket] = None
+
+    #  Public interface
+    def start(self):
+        """Starts supervising in a background thread and returns at once. Calling it again has no effect."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="backend-supervisor", daemon=True)
+            self._thread.start()
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        return self._ready.wait(timeout)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=15)
+        if self.terminate_on_stop and self.process is not None:
+            self._terminate()
+        self._release_spawn_lock()
+        self._set_state(STOPPED)
+
+    def snapshot(self) -> dict:
+        return {"state": self.state, "pid": self.process.pid if self.process is not None else None,
+                "restarts": self.restarts, "backend": self.last_status}
+
+    #  Checks
+    def probe(self) -> Optional[dict]:
+        """The /ready body if the backend is ready, None if it is down or still warming up."""
+        try:
+            with urllib.request.urlopen(self.ready_url, timeout=2.0) as response:
+                return json.loads(response.read() or b"{}")
+        except urllib.error.HTTPError as e:
+            # A backend without /ready (an older version) is ready as soon as it answers
+            return {"status": "ready"} if e.code == 404 else None
+        except (urllib.error.URLError, OSError, ValueError):
+            return None
+
+    def port_held(self) -> bool:
+        """Whether something accepts connections on the backend's port (ready or not)."""
+        url = urllib.parse.urlsplit(self.ready_url)
+        try:
+            with socket.create_connection((url.hostname, url.port or 80), timeout=1.0):
+                return True
+        except OSError:
+            return False
+
+    def _acquire_spawn_lock(self) -> bool:
+        if self.spawn_lock_port is None or self._spawn_lock is not None:
+            return True
+        lock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        if hasattr(socket, "SO_EXCLUSIVEADDRUSE"):
+            lock.setsockopt(socket.SOL_SOCKET, socket.SO_EXCLUSIVEADDRUSE, 1)
+        try:
+            lock.bind(("127.0.0.1", self.spawn_lock_port))
+            lock.listen(1)
+        except OSError:
+            lock.close()
+            return False
+        self._spawn_lock = lock
+        return True
+
+    def _release_spawn_lock(self):
+        if self._spawn_lock is not None:
+            self._spawn_lock.close()
+            self._spawn_lock = None
+
+    #  Process control
+    def _set_state(self, state: str):
+        if state != self.state:
+            self.log(f"Backend supervisor: {self.state} -> {state}")
+            self.state = state
+        if state == READY:
+            self._ready.set()
+        else:
+            self._ready.clear()
+
+    def _spawn(self):
+        output = open(self.output_path, "ab") if self.output_path else subprocess.DEVNULL
+        flags = 0
+        if os.name == "nt":
+            # No console window, and Ctrl+C in a console that started WPS does not reach the backend
+            flags = subprocess.CREATE_NO_WINDOW | subprocess.CREATE_NEW_PROCESS_GROUP
+        try:
+            self.process = subprocess.Popen(self.command, cwd=self.cwd, stdin=subprocess.DEVNULL,
+                                            stdout=output, stderr=subprocess.STDOUT, creationflags=flags)
+        finally:
+            if output is not subprocess.DEVNULL:
+                output.close()  # The child has its own handle
+        self.log(f"Backend supervisor: started {' '.join(self.command)} (pid {self.process.pid})")
+
+    def _terminate(self):
+        process, self.process = self.process, None
+        if process is None or process.poll() is not None:
+            return
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait(timeout=10)
+
+    def _run(self):
+        delay = RESTART_DELAY
+        failures = 0
+        started_at = 0.0
+        held_since = None  # When a backend we did not start was first seen holding the port unready
+        while not self._stop.is_set():
+            status = self.probe()
+            if status is not None:
+                # Ours or one that was already running (another supervisor's, or started by hand)
+                self.last_status = status
+                failures, delay, held_since = 0, RESTART_DELAY, None
+                self._set_state(READY)
+                self._stop.wait(self.health_interval)
+                continue
+
+            if self.process is None and self.port_held():
+                # Not ours, so it cannot be restarted from here, and a second backend would fail to bind
+                # the port. It may still be warming up; after startup_timeout it is reported as hung.
+                now = time.monotonic()
+                held_since = held_since or now
+                if self.state in (READY, UNHEALTHY) or now - held_since > self.startup_timeout:
+                    if self.state != UNHEALTHY:
+                        self.log(f"Backend supervisor: {self.ready_url} is not ready, and its port is held by a backend this "
+                                 "supervisor did not start, so it cannot restart it. End that process to let a new one start.")
+                    self._set_state(UNHEALTHY)
+                else:
+                    self._set_state(STARTING)
+                self._stop.wait(min(self.health_interval, 2.0))
+                continue
+            held_since = None
+
+            if self.process is None:
+                if not self._acquire_spawn_lock():
+                    self._set_state(STARTING)  # Another supervisor is starting it
+                    self._stop.wait(1.0)
+                    continue
+                if self.state in (READY, UNHEALTHY):
+                    self.log("Backend supervisor: the backend stopped answering; starting a new one.")
+                try:
+                    self._spawn()
+                except OSError as e:
+                    self.log(f"Backend supervisor: could not start the backend: {e}")
+                    self._set_state(FAILED)
+                    self._stop.wait(delay)
+                    delay = min(delay * 2, MAX_RESTART_DELAY)
+                    continue
+                started_at = time.monotonic()
+                self._set_state(STARTING)
+                continue
+
+            exit_code = self.process.poll()
+            if exit_code is not None:
+                self.process = None
+                self.restarts += 1
+                self.log(f"Backend supervisor: the backend exited with code {exit_code}; restarting in {delay:.0f}s.")
+                self._set_state(FAILED)
+                self._stop.wait(delay)
+                delay = min(delay * 2, MAX_RESTART_DELAY)
+                continue
+
+            if self.state == STARTING:
+                if time.monotonic() - started_at > self.startup_timeout:
+                    self.log(f"Backend supervisor: not ready after {self.startup_timeout:.0f}s; restarting it.")
+                    self._terminate()
+                    self.restarts += 1
+                self._stop.wait(0.5)
+                continue
+
+            failures += 1
+            self._set_state(UNHEALTHY)
+            if failures >= self.unhealthy_after:
+                self.log(f"Backend supervisor: {failures} failed health checks; restarting the backend.")
+                self._terminate()
+                self.restarts += 1
+                failures = 0
+            self._stop.wait(min(self.health_interval, 2.0))
+
+
+def run_supervisor(log: Callable[[str], None] = print) -> int:
+    """Runs a supervisor in the foreground until interrupted, then stops the backend it started."""
+    command, cwd = default_command()
+    if command is None:
+        log("Backend supervisor: AI_Backend_Server was not found.")
+        return 1
+    supervisor = BackendSupervisor(command, cwd=cwd, log=log, terminate_on_stop=True)
+    supervisor.start()
+    try:
+        while True:
+            time.sleep(1.0)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        supervisor.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run_supervisor())
@@ -0,0 +1,136 @@
+"""
+Bounded concurrent pipeline for batch document generation.
+Parses a JSONL file (or a JSON array) of requests and runs them through a fixed number
+of worker slots, yielding a status record for every item as soon as it finishes.
+"""
+import asyncio
+import json
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, List, Optional, Tuple, Type
+
+from pydantic import BaseModel, ValidationError
+from starlette.concurrency import run_in_threadpool
+
+
+class BatchItem(BaseModel):
+    """A single parsed entry of a batch upload."""
+    index: int
+    request: Optional[Any] = None
+    error: Optional[str] = None
+
+
+class PipelineStats:
+    """Counts batch items waiting for a worker slot and items being generated."""
+
+    def __init__(self):
+        self.queued = 0
+        self.running = 0
+        self._lock = threading.Lock()
+
+    def add(self, queued: int = 0, running: int = 0):
+        with self._lock:
+            self.queued += queued
+            self.running += running
+
+    @property
+    def depth(self) -> int:
+        return self.queued + self.running
+
+
+# Shared by every batch request of the process (exported as the batch queue depth metric)
+stats = PipelineStats()
+
+
+def parse_batch_items(raw: bytes, model: Type[BaseModel]) -> List[BatchItem]:
+    """
+    Parses a batch body into validated request models.
+
+    Accepts either a JSON array of objects or JSON Lines (one object per line, blank lines
+    ignored). Invalid entries are kept with an error message so they can be reported
+    per item instead of failing the whole batch.
+
+    Raises:
+        ValueError: If the body is neither a JSON array nor JSON Lines.
+    """
+    text = raw.decode("utf-8-sig").strip()
+    if not text:
+        return []
+
+    entries: List[Tuple[Any, Optional[str]]] = []
+    if text.startswith("["):
+        try:
+            data = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON array: {e}")
+        entries = [(entry, None) for entry in data]
+    else:
+        for line in text.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entries.append((json.loads(line), None))
+            except json.JSONDecodeError as e:
+                entries.append((None, f"Invalid JSON: {e}"))
+
+    items = []
+    for index, (entry, error) in enumerate(entries):
+        if error is None:
+            try:
+                items.append(BatchItem(index=index, request=model.model_validate(entry)))
+                continue
+            except ValidationError as e:
+                error = "Invalid request: " + "; ".join(
+                    f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}" for err in e.errors()
+                )
+        items.append(BatchItem(index=index, error=error))
+    return items
+
+
+async def run_bounded(
+    items: List[BatchItem],
+    worker: Callable[[Any], dict],
+    concurrency: int,
+) -> AsyncIterator[dict]:
+    """
+    Runs `worker` over the items with at most `concurrency` in flight and yields one
+    status record per item in completion order.
+
+    The worker is a blocking function; it runs on the server threadpool. Items that failed
+    parsing are reported first with status 'invalid'. Pending work is cancelled if the
+    consumer stops iterating (e.g. the client disconnected).
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run_one(item: BatchItem) -> dict:
+        stats.add(queued=1)
+        try:
+            await semaphore.acquire()
+        finally:
+            stats.add(queued=-1)
+        stats.add(running=1)
+        started = time.perf_counter()
+        try:
+            result = await run_in_threadpool(worker, item.request)
+            record = {"index": item.index, "status": "ok", **result}
+        except Exception as e:
+            record = {"index": item.index, "status": "error", "error": str(e)}
+        finally:
+            stats.add(running=-1)
+            semaphore.release()
+        record["elapsed_s"] = round(time.perf_counter() - started, 3)
+        return record
+
+    for item in items:
+        if item.error is not None:
+            yield {"index": item.index, "status": "invalid", "error": item.error}
+
+    tasks = [asyncio.ensure_future(run_one(item)) for item in items if item.error is None]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
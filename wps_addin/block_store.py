@@ -0,0 +1,185 @@
+"""
+Server side of the delta upload (protocol in wps_addin/document_blocks.py).
+Blocks are stored once by hash, documents as their ordered block lists, and the summaries of
+document chunks by a key derived from the chunk's block hashes. Everything lives in the shared
+state database, so every server worker sees what any of them received. Entries not used for
+`ttl_seconds` are dropped.
+"""
+import json
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from wps_addin.document_blocks import block_hash, document_id
+from wps_addin.shared_state import connect
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS document_blocks (
+    hash    TEXT PRIMARY KEY,
+    text    TEXT NOT NULL,
+    used_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS documents (
+    id      TEXT PRIMARY KEY,
+    blocks  TEXT NOT NULL,
+    used_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chunk_summaries (
+    key     TEXT PRIMARY KEY,
+    summary TEXT NOT NULL,
+    used_at REAL NOT NULL
+);
+"""
+
+# Hashes per statement (SQLite limits the number of bound parameters)
+_BATCH = 500
+
+
+class UnknownDocument(KeyError):
+    """The document id was never uploaded, or its blocks have expired."""
+
+
+class BlockStore:
+    """
+    Block cache for delta uploads, with a cache of chunk summaries.
+
+    Args:
+        path (str): The shared state database.
+        ttl_seconds (float): Unused blocks, documents and summaries are dropped after this long.
+        max_document_chars (int): Largest document accepted.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float = 72 * 3600, max_document_chars: int = 20_000_000):
+        self.ttl_seconds = ttl_seconds
+        self.max_document_chars = max_document_chars
+        self._lock = threading.Lock()
+        self._db = connect(path)
+        self._db.executescript(_SCHEMA)
+        self._purged_at = 0.0
+        # Counters of this worker (for /metrics)
+        self.chars_received = 0
+        self.chars_reused = 0
+        self.summary_hits = 0
+        self.summary_misses = 0
+
+    def _purge(self, now: float):
+        """Drops expired entries, at most once a minute. Call inside a write transaction."""
+        if now - self._purged_at < 60:
+            return
+        self._purged_at = now
+        cutoff = now - self.ttl_seconds
+        for table in ("documents", "document_blocks", "chunk_summaries"):
+            self._db.execute(f"DELETE FROM {table} WHERE used_at <= ?", (cutoff,))
+
+    def _known(self, hashes: Sequence[str]) -> Dict[str, int]:
+        """Hash -> length of the stored blocks among `hashes`."""
+        known = {}
+        unique = list(dict.fromkeys(hashes))
+        for start in range(0, len(unique), _BATCH):
+            batch = unique[start:start + _BATCH]
+            rows = self._db.execute(
+                f"SELECT hash, length(text) AS size FROM document_blocks WHERE hash IN ({','.join('?' * len(batch))})", batch
+            ).fetchall()
+            known.update((row["hash"], row["size"]) for row in rows)
+        return known
+
+    def _touch(self, hashes: Sequence[str], now: float):
+        unique = list(dict.fromkeys(hashes))
+        for start in range(0, len(unique), _BATCH):
+            batch = unique[start:start + _BATCH]
+            self._db.execute(f"UPDATE document_blocks SET used_at = ? WHERE hash IN ({','.join('?' * len(batch))})", [now, *batch])
+
+    def put_document(self, hashes: List[str], texts: Dict[str, str]) -> Tuple[str, List[str], int]:
+        """
+        Stores the uploaded blocks and, if every block of the document is now known, the document.
+
+        Returns:
+            (document id, hashes still missing, characters of the document)
+
+        Raises:
+            ValueError: A text does not match its hash, or the document is too large.
+        """
+        for digest, text in texts.items():
+            if block_hash(text) != digest:
+                raise ValueError(f"Block {digest[:12]} does not match its hash.")
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._purge(now)
+                self._db.executemany(
+                    "INSERT OR IGNORE INTO document_blocks (hash, text, used_at) VALUES (?, ?, ?)",
+                    [(digest, text, now) for digest, text in texts.items()],
+                )
+                known = self._known(hashes)
+                missing = [digest for digest in dict.fromkeys(hashes) if digest not in known]
+                chars = sum(known.get(digest, 0) for digest in hashes)
+                if chars > self.max_document_chars:
+                    raise ValueError(f"Document exceeds {self.max_document_chars} characters.")
+                doc_id = document_id(hashes)
+                if not missing:
+                    self._touch(hashes, now)
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO documents (id, blocks, used_at) VALUES (?, ?, ?)",
+                        (doc_id, json.dumps(hashes), now),
+                    )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            received = sum(len(text) for text in texts.values())
+            self.chars_received += received
+            self.chars_reused += max(0, chars - received) if not missing else 0
+        return doc_id, missing, chars
+
+    def blocks(self, doc_id: str) -> List[Tuple[str, str]]:
+        """The (hash, text) blocks of an uploaded document, in order. Raises UnknownDocument."""
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT blocks FROM documents WHERE id = ?", (doc_id,)).fetchone()
+            if row is None:
+                raise UnknownDocument(doc_id)
+            hashes = json.loads(row["blocks"])
+            texts = {}
+            unique = list(dict.fromkeys(hashes))
+            for start in range(0, len(unique), _BATCH):
+                batch = unique[start:start + _BATCH]
+                rows = self._db.execute(
+                    f"SELECT hash, text FROM document_blocks WHERE hash IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                texts.update((r["hash"], r["text"]) for r in rows)
+            if len(texts) < len(unique):
+                raise UnknownDocument(doc_id)
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute("UPDATE documents SET used_at = ? WHERE id = ?", (now, doc_id))
+                self._touch(hashes, now)
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return [(digest, texts[digest]) for digest in hashes]
+
+    def text(self, doc_id: str) -> str:
+        return "".join(text for _digest, text in self.blocks(doc_id))
+
+    #  Chunk summaries
+    def summary(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute("SELECT summary FROM chunk_summaries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.summary_misses += 1
+                return None
+            self.summary_hits += 1
+            self._db.execute("UPDATE chunk_summaries SET used_at = ? WHERE key = ?", (time.time(), key))
+            return row["summary"]
+
+    def put_summary(self, key: str, summary: str):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO chunk_summaries (key, summary, used_at) VALUES (?, ?, ?)",
+                (key, summary, time.time()),
+            )
+
+    def summary_stats(self) -> Tuple[int, int]:
+        return self.summary_hits, self.summary_misses
@@ -0,0 +1,116 @@
+"""
+Delta upload of document text.
+Analyze and Summarize used to post the whole document on every click. The text is now cut into
+blocks of whole paragraphs and each block is identified by its SHA-256. The add-in remembers
+which blocks the backend already holds and uploads only the others; the backend rebuilds the
+text from its block cache (wps_addin/block_store.py) and caches per-chunk summaries by the same
+hashes, so unchanged parts of a document are neither re-sent nor re-summarized.
+
+Block boundaries are content-defined: a block ends after a paragraph whose fingerprint hits a
+fixed pattern (once a minimum size is reached). An edit therefore only changes the blocks around
+it; the boundaries before and after it stay where they were.
+
+This module has no dependencies beyond the standard library, so the 32-bit add-in can use it.
+
+Upload protocol (POST /document_blocks):
+    request:  {"blocks": ["<hash>", ...], "texts": {"<hash>": "<block text>", ...}}
+    response: {"document_id": "<id>", "missing": ["<hash>", ...], "blocks": n, "chars": n}
+`blocks` lists every block of the document in order, `texts` only those the server may not
+have. If `missing` is not empty, nothing was stored and the client sends those texts again.
+The document id is then passed to /summarize or /analyze instead of the content.
+"""
+
+import hashlib
+import threading
+import zlib
+from typing import Callable, Dict, List, Sequence, Tuple
+
+# Size bounds of one upload block (characters)
+BLOCK_MIN_CHARS = 512
+BLOCK_MAX_CHARS = 8192
+# Documents below this size are posted inline; the block bookkeeping is not worth it
+DELTA_UPLOAD_MIN_CHARS = 20000
+# Hashes remembered by the client before it starts over (the server reports what it lacks)
+MAX_KNOWN_BLOCKS = 100000
+
+
+def block_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def document_id(hashes: Sequence[str]) -> str:
+    """Id of one version of a document: the hash of its block list."""
+    return hashlib.sha256("\n".join(hashes).encode("ascii")).hexdigest()
+
+
+def content_defined_groups(sizes: Sequence[int], fingerprints: Sequence[int],
+                           min_chars: int, max_chars: int, divisor: int) -> List[Tuple[int, int]]:
+    """
+    Groups consecutive items into [start, end) ranges. A range is closed after an item whose
+    fingerprint is divisible by `divisor` once it holds `min_chars`, or when it reaches `max_chars`.
+    """
+    groups, start, size = [], 0, 0
+    for index, (item_size, fingerprint) in enumerate(zip(sizes, fingerprints)):
+        size += item_size
+        if size >= max_chars or (size >= min_chars and fingerprint % divisor == 0):
+            groups.append((start, index + 1))
+            start, size = index + 1, 0
+    if start < len(sizes):
+        groups.append((start, len(sizes)))
+    return groups
+
+
+def split_blocks(text: str, min_chars: int = BLOCK_MIN_CHARS, max_chars: int = BLOCK_MAX_CHARS) -> List[str]:
+    """Cuts text into blocks of whole paragraphs. "".join(split_blocks(text)) == text."""
+    pieces = []
+    for paragraph in text.splitlines(keepends=True):
+        # A paragraph longer than a block is cut at fixed offsets
+        pieces.extend(paragraph[start:start + max_chars] for start in range(0, len(paragraph), max_chars))
+    fingerprints = [zlib.crc32(piece.encode("utf-8")) for piece in pieces]
+    groups = content_defined_groups([len(piece) for piece in pieces], fingerprints, min_chars, max_chars, divisor=4)
+    return ["".join(pieces[start:end]) for start, end in groups]
+
+
+class DeltaUploader:
+    """
+    Client side of the upload: remembers which blocks the backend has and sends only new ones.
+
+    Args:
+        post (Callable[[dict], dict]): Posts a payload to /document_blocks and returns the
+            decoded response (raising on HTTP errors).
+    """
+
+    def __init__(self, post: Callable[[Dict], Dict]):
+        self.post = post
+        self._known = set()
+        self._lock = threading.Lock()
+        self.sent_chars = 0  # Block text uploaded so far
+
+    def upload(self, text: str) -> Tuple[str, int]:
+        """Uploads the blocks of `text` the backend lacks. Returns (document id, characters sent)."""
+        blocks = split_blocks(text)
+        hashes = [block_hash(block) for block in blocks]
+        by_hash = dict(zip(hashes, blocks))
+        with self._lock:
+            unsent = [digest for digest in by_hash if digest not in self._known]
+        sent = 0
+        for _attempt in range(2):
+            texts = {digest: by_hash[digest] for digest in unsent}
+            response = self.post({"blocks": hashes, "texts": texts})
+            sent += sum(len(block) for block in texts.values())
+            unsent = [digest for digest in response.get("missing", []) if digest in by_hash]
+            if not unsent:
+                break
+        else:
+            raise RuntimeError("The backend did not accept the document blocks.")
+        with self._lock:
+            if len(self._known) + len(by_hash) > MAX_KNOWN_BLOCKS:
+                self._known.clear()
+            self._known.update(by_hash)
+            self.sent_chars += sent
+        return response["document_id"], sent
+
+    def forget(self):
+        """Called when the backend may have lost its cache (e.g. a different server)."""
+        with self._lock:
+            self._known.clear()
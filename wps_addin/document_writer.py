@@ -0,0 +1,190 @@
+"""
+Insertion of long results into the WPS document.
+Selection.TypeText with a whole report (tens of thousands of characters) is processed like
+typing and blocks WPS until it is done. RangeWriter appends the text to a Range with
+InsertAfter in chunks instead. The chunk size adapts so each COM call takes about
+`target_call_seconds`, and Windows messages are pumped between chunks so WPS keeps
+repainting. A style is applied to the whole inserted block in one call. Throughput is logged.
+If a COM call of RangeWriter fails, write_with_fallback() types the part not yet inserted with
+TypeTextWriter, so a result is never lost half-written.
+
+The writer only needs Start/End/Range/SetRange on the selection and Range/InsertAfter/Style
+on the document, so the tests and benchmarks run it against FakeDocument (benchmarks/common.py),
+an in-memory stand-in with a simple COM latency model, on machines without WPS.
+"""
+
+import time
+from abc import ABC, abstractmethod
+
+
+class WriteStats:
+    """Outcome of one write()."""
+
+    __slots__ = ("chars", "chunks", "seconds", "slowest_call")
+
+    def __init__(self, chars, chunks, seconds, slowest_call):
+        self.chars = chars
+        self.chunks = chunks
+        self.seconds = seconds
+        self.slowest_call = slowest_call  # Longest single COM call: how long WPS was frozen at most
+
+    @property
+    def chars_per_second(self):
+        return self.chars / self.seconds if self.seconds else float("inf")
+
+    def __str__(self):
+        return (f"{self.chars} chars in {self.chunks} chunks, {self.seconds:.2f}s "
+                f"({self.chars_per_second:,.0f} chars/s, slowest call {self.slowest_call * 1000:.0f} ms)")
+
+
+class WriteInterrupted(Exception):
+    """A write failed part-way; `remaining` is the text that was not inserted."""
+
+    def __init__(self, remaining, cause):
+        super().__init__(f"{len(remaining)} characters not inserted: {cause}")
+        self.remaining = remaining
+        self.cause = cause
+
+
+class DocumentWriter(ABC):
+    """Writes text at the cursor of a document."""
+
+    @abstractmethod
+    def write(self, text, style=None):
+        """Inserts `text` at the cursor, leaves the cursor after it and returns WriteStats."""
+
+
+class TypeTextWriter(DocumentWriter):
+    """The previous behaviour (one Selection.TypeText call): the fallback of write_with_fallback() and a baseline for comparison."""
+
+    def __init__(self, selection, log=None):
+        self.selection = selection
+        self.log = log
+
+    def write(self, text, style=None):
+        started = time.perf_counter()
+        self.selection.TypeText(Text=text)
+        seconds = time.perf_counter() - started
+        stats = WriteStats(len(text), 1, seconds, seconds)
+        if self.log:
+            self.log(f"TypeText inserted {stats}")
+        return stats
+
+
+class RangeWriter(DocumentWriter):
+    """
+    Appends text through Range.InsertAfter in adaptively sized chunks.
+
+    Args:
+        document: The document (ActiveDocument) providing Range(start, end).
+        selection: The selection whose cursor position receives the text.
+        initial_chunk (int): Characters in the first chunk.
+        min_chunk, max_chunk (int): Bounds of the adaptive chunk size.
+        target_call_seconds (float): Desired duration of one InsertAfter call.
+        pump (Optional[Callable]): Called between chunks to process window messages
+            (pythoncom.PumpWaitingMessages in the add-in).
+        yield_seconds (float): Sleep between chunks, giving WPS's own thread time to run.
+        log (Optional[Callable[[str], None]]): Receives the throughput line.
+    """
+
+    def __init__(self, document, selection, initial_chunk=4096, min_chunk=512, max_chunk=65536,
+                 target_call_seconds=0.05, pump=None, yield_seconds=0.001, log=None):
+        self.document = document
+        self.selection = selection
+        self.initial_chunk = initial_chunk
+        self.min_chunk = min_chunk
+        self.max_chunk = max_chunk
+        self.target_call_seconds = target_call_seconds
+        self.pump = pump
+        self.yield_seconds = yield_seconds
+        self.log = log
+
+    @classmethod
+    def for_application(cls, wps_app, log=None):
+        """A writer for the active document of a running WPS (pumping COM messages between chunks)."""
+        try:
+            import pythoncom
+            pump = pythoncom.PumpWaitingMessages
+        except ImportError:
+            pump = None
+        return cls(wps_app.ActiveDocument, wps_app.Selection, pump=pump, log=log)
+
+    @staticmethod
+    def _chunk_end(text, start, size):
+        """End of the next chunk: a paragraph or word boundary in its second half, if there is one."""
+        end = start + size
+        if end >= len(text):
+            return len(text)
+        for separator in ("\r", " "):
+            boundary = text.rfind(separator, start + size // 2, end)
+            if boundary != -1:
+                return boundary + 1
+        return end
+
+    def _adapt(self, size, elapsed, inserted):
+        if elapsed <= 0:
+            return min(self.max_chunk, size * 2)
+        # Scale towards the target duration, at most doubling or halving per step
+        wanted = inserted * self.target_call_seconds / elapsed
+        return int(max(self.min_chunk, min(self.max_chunk, size * 2, max(size // 2, wanted))))
+
+    def write(self, text, style=None):
+        """
+        Like DocumentWriter.write. Raises WriteInterrupted if a COM call fails; the cursor is
+        then left after the text inserted so far, if WPS still allows it.
+        """
+        # Word and WPS use "\r" as the paragraph mark
+        text = text.replace("\r\n", "\r").replace("\n", "\r")
+        started = time.perf_counter()
+        position, size, chunks, slowest = 0, self.initial_chunk, 0, 0.0
+        target = None
+        try:
+            start = self.selection.Start
+            if self.selection.End != start:
+                self.selection.Range.Text = ""  # Replace the selection, as typing would
+            target = self.document.Range(start, start)
+
+            while position < len(text):
+                end = self._chunk_end(text, position, size)
+                call_started = time.perf_counter()
+                target.InsertAfter(text[position:end])  # The range grows to include the new text
+                elapsed = time.perf_counter() - call_started
+                slowest = max(slowest, elapsed)
+                size = self._adapt(size, elapsed, end - position)
+                position = end
+                chunks += 1
+                if position < len(text):
+                    if self.pump is not None:
+                        self.pump()
+                    time.sleep(self.yield_seconds)
+
+            end_position = target.End
+            if style is not None and chunks:
+                self.document.Range(start, end_position).Style = style  # One call for the whole block
+            self.selection.SetRange(end_position, end_position)
+        except Exception as e:
+            if target is not None and chunks:
+                try:
+                    self.selection.SetRange(target.End, target.End)
+                except Exception:
+                    pass
+            raise WriteInterrupted(text[position:], e) from e
+
+        stats = WriteStats(len(text), chunks, time.perf_counter() - started, slowest)
+        if self.log:
+            self.log(f"Inserted {stats}")
+        return stats
+
+
+def write_with_fallback(writer, fallback, text, style=None, log=None):
+    """
+    Writes `text` with `writer`; if that fails part-way (WriteInterrupted), `fallback` writes
+    the rest at the cursor, without the style. Returns the WriteStats of the writer that finished.
+    """
+    try:
+        return writer.write(text, style=style)
+    except WriteInterrupted as e:
+        if log:
+            log(f"{type(writer).__name__} failed ({e.cause}); inserting the remaining {len(e.remaining)} characters "
+                f"with {type(fallback).__name__}")
+        return fallback.write(e.remaining)
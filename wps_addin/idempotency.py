@@ -0,0 +1,329 @@
+"""
+Idempotency-Key support for the backend's POST endpoints.
+A client sends the same `Idempotency-Key` header when it retries a request. The first request
+with a key runs normally and its response is kept for a window. A retry that arrives while the
+first is still running waits for it (attaches to the running job). A retry that arrives later
+gets the stored response replayed. Either way no second LLM call or document is produced.
+IdempotencyStore keeps the records in memory; SQLiteIdempotencyStore keeps them in a database
+shared by all backend worker processes, so a retry may land on any worker.
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import anyio
+
+from wps_addin.compression import read_body, replayed_receive
+from wps_addin.shared_state import connect, process_id
+
+HEADER = "idempotency-key"
+REPLAY_HEADER = "Idempotent-Replayed"
+_KEY_RE = re.compile(r'^[\x21-\x7e]{1,255}$')
+
+# Response headers that are stored and replayed (length and encoding are recomputed)
+_REPLAYED_HEADERS = {b"content-type", b"content-disposition", b"etag", b"cache-control"}
+
+
+class StoredResponse:
+    """A completed response kept for replay."""
+
+    __slots__ = ("status", "headers", "body")
+
+    def __init__(self, status: int, headers: List[Tuple[bytes, bytes]], body: bytes):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+
+class _Entry:
+    __slots__ = ("fingerprint", "created", "done", "response", "token")
+
+    def __init__(self, fingerprint: str, token: str = ""):
+        self.fingerprint = fingerprint
+        self.created = time.monotonic()
+        self.done = threading.Event()
+        self.response: Optional[StoredResponse] = None
+        self.token = token  # Identifies the request that owns a shared record
+
+
+class IdempotencyStore:
+    """
+    In-memory record of idempotent requests, bounded in time (ttl_seconds) and size (max_entries).
+
+    Args:
+        ttl_seconds (float): How long a completed response is replayed for.
+        max_entries (int): Oldest records are dropped above this count.
+    """
+
+    def __init__(self, ttl_seconds: float = 24 * 3600, max_entries: int = 10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.replayed = 0
+        self.executed = 0
+
+    def _purge(self):
+        """Drops expired and excess records. Call with the lock held."""
+        deadline = time.monotonic() - self.ttl_seconds
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if entry.created > deadline and len(self._entries) <= self.max_entries:
+                break
+            del self._entries[key]
+
+    def begin(self, key: str, fingerprint: str) -> Tuple[bool, _Entry]:
+        """
+        Registers a request. Returns (is_new, entry): is_new is True if the caller must run the
+        request and then call complete(), False if it should wait for and replay `entry`.
+        """
+        with self._lock:
+            self._purge()
+            entry = self._entries.get(key)
+            if entry is not None:
+                self.replayed += 1
+                return False, entry
+            entry = self._entries[key] = _Entry(fingerprint)
+            self.executed += 1
+            return True, entry
+
+    def complete(self, key: str, entry: _Entry, response: Optional[StoredResponse]):
+        """
+        Stores the response of a request started with begin(). A None response (server
+        error, client gone) forgets the key, so the next retry runs the request again.
+        """
+        with self._lock:
+            if response is None and self._entries.get(key) is entry:
+                del self._entries[key]
+        entry.response = response
+        entry.done.set()
+
+    def poll(self, key: str, entry: _Entry) -> bool:
+        """Returns True once the request behind `entry` has completed (entry.response is then set)."""
+        return entry.done.is_set()
+
+    def stats(self) -> Tuple[int, int]:
+        """Returns (replayed, executed), i.e. (hits, misses) for the metrics cache collector."""
+        return self.replayed, self.executed
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS idempotency (
+    key         TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    token       TEXT NOT NULL,
+    owner       TEXT NOT NULL,
+    created_at  REAL NOT NULL,
+    done        INTEGER NOT NULL DEFAULT 0,
+    status      INTEGER,
+    headers     TEXT,
+    body        BLOB
+);
+CREATE INDEX IF NOT EXISTS idempotency_created_at ON idempotency (created_at);
+"""
+
+
+class SQLiteIdempotencyStore(IdempotencyStore):
+    """
+    Idempotency records in a SQLite database shared by the backend's worker processes.
+
+    Args:
+        path (str): The shared state database.
+        running_timeout (float): A record still marked running after this many seconds belongs to a
+            worker that died; the next request with the key runs again.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float = 24 * 3600, max_entries: int = 10000, running_timeout: float = 900.0):
+        super().__init__(ttl_seconds, max_entries)
+        self.running_timeout = running_timeout
+        self._owner = process_id()
+        self._db = connect(path)
+        self._db.executescript(_SCHEMA)
+
+    def _purge(self):
+        """Drops expired and excess records. Call inside a write transaction."""
+        self._db.execute("DELETE FROM idempotency WHERE created_at <= ?", (time.time() - self.ttl_seconds,))
+        self._db.execute(
+            "DELETE FROM idempotency WHERE key IN (SELECT key FROM idempotency ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def begin(self, key: str, fingerprint: str) -> Tuple[bool, _Entry]:
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._purge()
+                row = self._db.execute("SELECT fingerprint, token, done, created_at FROM idempotency WHERE key = ?", (key,)).fetchone()
+                if row is not None and (row["done"] or row["created_at"] > now - self.running_timeout):
+                    self._db.execute("COMMIT")
+                    self.replayed += 1
+                    return False, _Entry(row["fingerprint"], row["token"])
+                entry = _Entry(fingerprint, uuid.uuid4().hex)
+                self._db.execute(
+                    "INSERT OR REPLACE INTO idempotency (key, fingerprint, token, owner, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, fingerprint, entry.token, self._owner, now),
+                )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self.executed += 1
+            return True, entry
+
+    def complete(self, key: str, entry: _Entry, response: Optional[StoredResponse]):
+        with self._lock:
+            if response is None:
+                self._db.execute("DELETE FROM idempotency WHERE key = ? AND token = ?", (key, entry.token))
+            else:
+                headers = json.dumps([[base64.b64encode(name).decode(), base64.b64encode(value).decode()] for name, value in response.headers])
+                self._db.execute(
+                    "UPDATE idempotency SET done = 1, status = ?, headers = ?, body = ? WHERE key = ? AND token = ?",
+                    (response.status, headers, response.body, key, entry.token),
+                )
+        entry.response = response
+        entry.done.set()
+
+    def poll(self, key: str, entry: _Entry) -> bool:
+        if entry.done.is_set():
+            return True
+        with self._lock:
+            row = self._db.execute("SELECT token, done, status, headers, body FROM idempotency WHERE key = ?", (key,)).fetchone()
+        if row is not None and row["token"] == entry.token and not row["done"]:
+            return False
+        if row is not None and row["token"] == entry.token:
+            headers = [(base64.b64decode(name), base64.b64decode(value)) for name, value in json.loads(row["headers"])]
+            entry.response = StoredResponse(row["status"], headers, bytes(row["body"]))
+        # Otherwise the record was dropped because the original failed: response stays None
+        entry.done.set()
+        return True
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def _canonical(body: bytes) -> bytes:
+    """JSON bodies in a fixed serialization, so clients that format the same payload differently match."""
+    try:
+        return json.dumps(json.loads(body), sort_keys=True, separators=(",", ":")).encode("utf-8")
+    except ValueError:
+        return body
+
+
+def _error(status: int, detail: str) -> StoredResponse:
+    body = json.dumps({"detail": detail}).encode("utf-8")
+    return StoredResponse(status, [(b"content-type", b"application/json")], body)
+
+
+async def _send_response(send, response: StoredResponse, replayed: bool):
+    headers = list(response.headers) + [(b"content-length", str(len(response.body)).encode())]
+    if replayed:
+        headers.append((REPLAY_HEADER.lower().encode(), b"true"))
+    await send({"type": "http.response.start", "status": response.status, "headers": headers})
+    await send({"type": "http.response.body", "body": response.body})
+
+
+class IdempotencyMiddleware:
+    """
+    ASGI middleware that applies Idempotency-Key handling to POST requests on `paths`.
+    A key reused with a different body is rejected with 422. Requests without the header are
+    not affected.
+
+    Store calls run in worker threads: the SQLite store may wait for a write lock held by another
+    worker process, which must not stall the event loop (and every connection on it).
+
+    Args:
+        wait_timeout (float): How long a retry waits for the original request before getting 409.
+        store_threads (int): Threads for store calls, kept apart from the endpoints' threadpool.
+    """
+
+    poll_interval = 0.1
+
+    def __init__(self, app, store: IdempotencyStore, paths: Sequence[str], wait_timeout: float = 600.0, store_threads: int = 4):
+        self.app = app
+        self.store = store
+        self.paths = set(paths)
+        self.wait_timeout = wait_timeout
+        self.store_threads = store_threads
+        self._limiter: Optional[anyio.CapacityLimiter] = None
+
+    async def _store_call(self, func, *args):
+        if self._limiter is None:
+            self._limiter = anyio.CapacityLimiter(self.store_threads)  # Needs the running event loop
+        return await anyio.to_thread.run_sync(func, *args, limiter=self._limiter)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        headers: Dict[bytes, bytes] = dict(scope["headers"])
+        raw_key = headers.get(HEADER.encode())
+        if raw_key is None:
+            await self.app(scope, receive, send)
+            return
+        key = raw_key.decode("latin-1")
+        if not _KEY_RE.match(key):
+            await _send_response(send, _error(400, "Idempotency-Key must be 1-255 printable characters."), False)
+            return
+
+        # The body is read up front: it is part of the fingerprint and is replayed to the app
+        body = await read_body(receive)
+        if body is None:
+            return
+        fingerprint = hashlib.sha256(scope["path"].encode() + b"\0" + _canonical(body)).hexdigest()
+        store_key = f"{scope['path']}\0{key}"
+
+        is_new, entry = await self._store_call(self.store.begin, store_key, fingerprint)
+        if not is_new:
+            await self._replay(send, store_key, entry, fingerprint)
+            return
+
+        status = {"code": 500}
+        captured: List[bytes] = []
+        response_headers: List[Tuple[bytes, bytes]] = []
+
+        async def capture_send(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                response_headers.extend((name, value) for name, value in message.get("headers", []) if name.lower() in _REPLAYED_HEADERS)
+            elif message["type"] == "http.response.body":
+                captured.append(message.get("body", b""))
+            await send(message)
+
+        stored = None
+        try:
+            await self.app(scope, replayed_receive(body, receive), capture_send)
+            # Server errors are not stored: a retry should get a fresh attempt
+            if status["code"] < 500:
+                stored = StoredResponse(status["code"], response_headers, b"".join(captured))
+        finally:
+            # Also when the request is cancelled (client gone), so the key is not left running
+            with anyio.CancelScope(shield=True):
+                await self._store_call(self.store.complete, store_key, entry, stored)
+
+    async def _replay(self, send, store_key: str, entry: _Entry, fingerprint: str):
+        if entry.fingerprint != fingerprint:
+            await _send_response(send, _error(422, "Idempotency-Key was already used for a different request."), False)
+            return
+        if not await self._store_call(self.store.poll, store_key, entry):
+            # Attach to the running request. Polling does not hold a thread between checks and
+            # works whichever event loop (or worker process) the original request runs on.
+            deadline = time.monotonic() + self.wait_timeout
+            while not await self._store_call(self.store.poll, store_key, entry):
+                if time.monotonic() >= deadline:
+                    await _send_response(send, _error(409, "A request with this Idempotency-Key is still in progress."), False)
+                    return
+                await asyncio.sleep(self.poll_interval)
+        if entry.response is None:
+            # The key was released when the original failed, so retrying runs the request again
+            await _send_response(send, _error(409, "The original request with this Idempotency-Key failed. Retry the request."), False)
+            return
+        await _send_response(send, entry.response, True)
@@ -0,0 +1,338 @@
+"""
+Prometheus-style metrics for the backend server (text exposition format 0.0.4).
+A small dependency-free registry of counters, gauges and histograms, plus collectors that
+are evaluated at scrape time (process, disk usage, caches, queues). MetricsMiddleware
+records per-route request counts, latencies and in-flight requests; LLM call metrics come
+from the tracing spans, so every provider call is covered without extra instrumentation.
+"""
+import os
+import sys
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+try:
+    import psutil  # Optional: portable RSS/CPU/thread/fd readings
+except ImportError:
+    psutil = None
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+# A sample is (suffix, labels, value), e.g. ("_bucket", {"le": "0.5"}, 3)
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+class _Metric:
+    """Base class: a metric family with optional labels."""
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Metric '{self.name}' expects labels {self.labelnames}, got {tuple(labels)}.")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> List[Sample]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._children[key] = self._children.get(key, 0.0) + amount
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            items = list(self._children.items())
+        return [("_total", dict(zip(self.labelnames, key)), value) for key, value in items]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._children[key] = value
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._children[key] = self._children.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            items = list(self._children.items())
+        return [("", dict(zip(self.labelnames, key)), value) for key, value in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._children.get(key)
+            if state is None:
+                state = self._children[key] = {"counts": [0] * len(self.buckets), "sum": 0.0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["counts"][index] += 1
+                    break
+            state["sum"] += value
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            items = [(key, list(state["counts"]), state["sum"]) for key, state in self._children.items()]
+        samples: List[Sample] = []
+        for key, counts, total in items:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                samples.append(("_bucket", dict(labels, le=_format_value(bound)), cumulative))
+            samples.append(("_sum", labels, total))
+            samples.append(("_count", labels, cumulative))
+        return samples
+
+
+class CollectedMetric:
+    """A metric family produced by a collector at scrape time."""
+
+    def __init__(self, name: str, kind: str, documentation: str, samples: Iterable[Tuple[Dict[str, str], float]]):
+        self.name = name
+        self.kind = kind
+        self.documentation = documentation
+        suffix = "_total" if kind == "counter" else ""
+        self._samples = [(suffix, labels, value) for labels, value in samples]
+
+    def samples(self) -> List[Sample]:
+        return self._samples
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], Iterable[CollectedMetric]]] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector: Callable[[], Iterable[CollectedMetric]]):
+        """Registers a function that returns CollectedMetric families on every scrape."""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        """Returns all metrics in the Prometheus text exposition format."""
+        with self._lock:
+            families = list(self._metrics)
+            collectors = list(self._collectors)
+        for collector in collectors:
+            try:
+                families.extend(collector())
+            except Exception as e:
+                print(f"Warning: Metrics collector {collector!r} failed: {e}")
+
+        lines: List[str] = []
+        for family in families:
+            samples = family.samples()
+            lines.append(f"# HELP {family.name} {_escape(family.documentation)}")
+            lines.append(f"# TYPE {family.name} {family.kind}")
+            for suffix, labels, value in samples:
+                lines.append(f"{family.name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+#  HTTP metrics
+HTTP_REQUESTS = registry.counter("http_requests", "HTTP requests handled, by route and status.", ("method", "route", "status"))
+HTTP_DURATION = registry.histogram("http_request_duration_seconds", "HTTP request latency, by route.", ("method", "route"))
+HTTP_IN_FLIGHT = registry.gauge("http_requests_in_flight", "HTTP requests currently being handled.")
+HTTP_IN_FLIGHT.set(0)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware that counts requests and observes their latency per route template
+    (e.g. /download/{filename}). The latency covers the whole response body, so streamed
+    responses are measured until their last chunk.
+    """
+
+    def __init__(self, app, skip_paths: Sequence[str] = ("/metrics",)):
+        self.app = app
+        self.skip_paths = set(skip_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("path") in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            route = scope.get("route")
+            # Unmatched paths share one label, so scanners cannot blow up the label set
+            route_label = getattr(route, "path", None) or "unmatched"
+            method = scope.get("method", "")
+            HTTP_DURATION.observe(time.perf_counter() - started, method=method, route=route_label)
+            HTTP_REQUESTS.inc(method=method, route=route_label, status=str(status["code"]))
+
+
+#  LLM metrics (fed by tracing spans)
+LLM_REQUESTS = registry.counter("llm_requests", "LLM calls, by provider, model, mode and outcome.", ("provider", "model", "mode", "status"))
+LLM_DURATION = registry.histogram("llm_request_duration_seconds", "LLM call latency, by provider and model.", ("provider", "model", "mode"))
+LLM_FIRST_CHUNK = registry.histogram("llm_first_chunk_seconds", "Time to the first streamed chunk, by provider and model.", ("provider", "model"))
+LLM_TOKENS = registry.counter("llm_tokens", "Tokens reported by the provider, by direction.", ("provider", "model", "direction"))
+LLM_RESPONSE_CHARS = registry.counter("llm_response_chars", "Characters of LLM output received.", ("provider", "model"))
+
+
+def llm_span_listener(event: str, span_obj):
+    """Tracing listener that turns llm.generate / llm.stream spans into LLM metrics."""
+    if event != "end" or span_obj.name not in ("llm.generate", "llm.stream"):
+        return
+    attributes = span_obj.attributes
+    provider = str(attributes.get("llm.provider", "unknown"))
+    model = str(attributes.get("llm.model", "unknown"))
+    mode = "stream" if span_obj.name == "llm.stream" else "generate"
+    LLM_REQUESTS.inc(provider=provider, model=model, mode=mode, status=span_obj.status)
+    LLM_DURATION.observe((span_obj.duration_ms or 0) / 1000.0, provider=provider, model=model, mode=mode)
+    if attributes.get("llm.first_chunk_ms") is not None:
+        LLM_FIRST_CHUNK.observe(attributes["llm.first_chunk_ms"] / 1000.0, provider=provider, model=model)
+    for direction in ("input", "output"):
+        tokens = attributes.get(f"llm.{direction}_tokens")
+        if isinstance(tokens, (int, float)):
+            LLM_TOKENS.inc(tokens, provider=provider, model=model, direction=direction)
+    if attributes.get("llm.response_chars"):
+        LLM_RESPONSE_CHARS.inc(attributes["llm.response_chars"], provider=provider, model=model)
+
+
+#  Scrape-time collectors
+_caches: Dict[str, Callable[[], Tuple[float, float]]] = {}
+_queues: Dict[str, Callable[[], float]] = {}
+
+
+def register_cache(name: str, stats: Callable[[], Tuple[float, float]]):
+    """Exposes a cache through `stats() -> (hits, misses)`."""
+    _caches[name] = stats
+
+
+def register_queue(name: str, depth: Callable[[], float]):
+    """Exposes the current depth (queued plus running jobs) of a work queue."""
+    _queues[name] = depth
+
+
+def _cache_collector() -> List[CollectedMetric]:
+    hits, misses, ratios = [], [], []
+    for name, stats in list(_caches.items()):
+        hit_count, miss_count = stats()
+        hits.append(({"cache": name}, hit_count))
+        misses.append(({"cache": name}, miss_count))
+        total = hit_count + miss_count
+        ratios.append(({"cache": name}, hit_count / total if total else 0.0))
+    return [
+        CollectedMetric("cache_hits", "counter", "Cache hits, by cache.", hits),
+        CollectedMetric("cache_misses", "counter", "Cache misses, by cache.", misses),
+        CollectedMetric("cache_hit_ratio", "gauge", "Hits / (hits + misses) since start, by cache.", ratios),
+    ]
+
+
+def _queue_collector() -> List[CollectedMetric]:
+    return [CollectedMetric("job_queue_depth", "gauge", "Jobs queued or running, by queue.",
+                            [({"queue": name}, depth()) for name, depth in list(_queues.items())])]
+
+
+_START_TIME = time.time()
+
+
+def _process_collector() -> List[CollectedMetric]:
+    """Standard process_* metrics (RSS, CPU seconds, threads, open fds, start time)."""
+    families = [CollectedMetric("process_start_time_seconds", "gauge", "Start time of the process since the Unix epoch.", [({}, _START_TIME)])]
+    if psutil is not None:
+        process = psutil.Process()
+        with process.oneshot():
+            cpu = process.cpu_times()
+            families.append(CollectedMetric("process_resident_memory_bytes", "gauge", "Resident memory size in bytes.", [({}, process.memory_info().rss)]))
+            families.append(CollectedMetric("process_cpu_seconds", "counter", "Total user and system CPU time in seconds.", [({}, cpu.user + cpu.system)]))
+            families.append(CollectedMetric("process_threads", "gauge", "Number of OS threads.", [({}, process.num_threads())]))
+            if hasattr(process, "num_fds"):
+                families.append(CollectedMetric("process_open_fds", "gauge", "Number of open file descriptors.", [({}, process.num_fds())]))
+            elif hasattr(process, "num_handles"):
+                families.append(CollectedMetric("process_open_handles", "gauge", "Number of open Windows handles.", [({}, process.num_handles())]))
+        return families
+
+    # Fallback without psutil: CPU from os.times(), RSS from /proc on Linux
+    times = os.times()
+    families.append(CollectedMetric("process_cpu_seconds", "counter", "Total user and system CPU time in seconds.", [({}, times.user + times.system)]))
+    families.append(CollectedMetric("process_threads", "gauge", "Number of Python threads.", [({}, threading.active_count())]))
+    if sys.platform.startswith("linux"):
+        try:
+            with open("/proc/self/statm") as f:
+                rss_pages = int(f.read().split()[1])
+            families.append(CollectedMetric("process_resident_memory_bytes", "gauge", "Resident memory size in bytes.", [({}, rss_pages * os.sysconf("SC_PAGE_SIZE"))]))
+        except (OSError, ValueError, IndexError):
+            pass
+    return families
+
+
+registry.add_collector(_process_collector)
+registry.add_collector(_cache_collector)
+registry.add_collector(_queue_collector)
@@ -33,11 +33,16 @@ def main():
         elif sys.argv[1].lower() == '/embedding':
             # This is called by Windows when WPS tries to instantiate the COM object
             run_com_server()
+        elif sys.argv[1].lower() == '/supervise':
+            # Keeps the AI backend running and warm, independent of WPS (e.g. started at sign-in)
+            from backend_supervisor import run_supervisor
+            sys.exit(run_supervisor(log_message))
     else:
         print("WPS Office AI Assistant Add-in (64-bit)")
         print("Usage:")
         print("  python run_64bit.py /regserver   - Register the 64-bit add-in")
         print("  python run_64bit.py /unregserver - Unregister the 64-bit add-in")
+        print("  python run_64bit.py /supervise   - Start the AI backend and keep it running")
         print(f"Running as: 64-bit {'PyInstaller bundle' if getattr(sys, 'frozen', False) else 'Python script'}")
         input("\nPress Enter to exit...")
 
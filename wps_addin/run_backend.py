@@ -0,0 +1,66 @@
+"""
+Entry point of the backend server: `python -m wps_addin.run_backend` (or `python -m
+wps_addin.backend_server`, which hands over to this module) and the bundled AI_Backend_Server.
+The server module initializes the AI agents, stores and tracing when it is imported, so this
+launcher does not import it: uvicorn imports "wps_addin.backend_server:app" once, in the process
+that serves requests (not in the reloader or the multi-worker manager). Analysis worker processes
+(started with "spawn") re-import the main module; this one does nothing unless it is run as the
+main script.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+
+from wps_addin.sampling_profiler import FORMATS as PROFILE_FORMATS, profile_to_file
+
+APP = "wps_addin.backend_server:app"
+
+
+def main():
+    """
+    This is the main entry point for the bundled executable.
+    It configures and runs the Uvicorn server.
+    """
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="AI Office Automation backend server.")
+    parser.add_argument("--profile", type=float, metavar="SECONDS", help="Profile the server for SECONDS after startup and write the result to --profile-output.")
+    parser.add_argument("--profile-output", default=os.path.join("logs", "profile.folded"), help="Profile output file (default: logs/profile.folded).")
+    parser.add_argument("--profile-format", choices=PROFILE_FORMATS, default="collapsed", help="collapsed stacks or speedscope JSON.")
+    parser.add_argument("--profile-interval-ms", type=float, default=10.0, help="Sampling interval in milliseconds.")
+    parser.add_argument("--no-reload", action="store_true", help="Do not watch the source tree and restart on changes (used by the backend supervisor).")
+    parser.add_argument("--workers", type=int, default=max(1, int(os.getenv("BACKEND_WORKERS", "1"))), help="Server worker processes sharing port 8000 (default: BACKEND_WORKERS or 1).")
+    args, _ = parser.parse_known_args()
+
+    # Check if running in a bundled environment
+    is_bundled = getattr(sys, 'frozen', False)
+
+    if args.workers > 1 and not args.profile:
+        # Each worker imports the app and serves requests on its own core. Artifacts,
+        # idempotency records and the sweeper lease are shared through SQLite, so a download
+        # link or a retry works whichever worker it reaches.
+        os.environ["BACKEND_WORKERS"] = str(args.workers)  # Seen by the workers' settings
+        print(f"Starting backend server with {args.workers} worker processes...")
+        uvicorn.run(APP, host="127.0.0.1", port=8000, workers=args.workers, log_level="info")
+    elif args.profile:
+        # The profiler samples this process, so the server must not run in a reloader child
+        print(f"Starting backend server with a {args.profile:g}s sampling profile -> {args.profile_output}")
+        profile_to_file(args.profile, args.profile_output, args.profile_format, args.profile_interval_ms / 1000.0)
+        uvicorn.run(APP, host="127.0.0.1", port=8000, reload=False, log_level="info")
+    elif is_bundled or args.no_reload:
+        print("Starting backend server from bundled executable..." if is_bundled else "Starting backend server...")
+        # In a bundle, 'reload' must be False. Under the supervisor a reloader process would sit
+        # between it and the server, and a source edit would restart the backend behind its back.
+        uvicorn.run(APP, host="127.0.0.1", port=8000, reload=False, log_level="info")
+    else:
+        # Development mode
+        print("Starting backend server for development with auto-reload...")
+        uvicorn.run(APP, host="127.0.0.1", port=8000, reload=True, log_level="info")
+
+
+if __name__ == "__main__":
+    # In the PyInstaller build, analysis worker processes start this executable again; this hands
+    # them over to multiprocessing before the server initializes
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,198 @@
+"""
+Low-overhead sampling profiler for the live backend process.
+A background thread reads the stack of every thread (sys._current_frames) at a fixed interval
+and counts identical stacks. Nothing is installed in the profiled threads, so it can run in
+production (including the PyInstaller build) without restarting the server. Results are exported
+as collapsed stacks (flamegraph.pl, inferno, speedscope import) or as speedscope JSON with one
+profile per thread, so the threadpool workers running sync endpoints can be told apart.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+FORMATS = ("collapsed", "speedscope")
+
+# Leaf functions of threads that are blocked waiting for work (skipped unless include_idle)
+_IDLE_FUNCTIONS = {
+    ("threading.py", "wait"), ("threading.py", "_wait_for_tstate_lock"),
+    ("selectors.py", "select"), ("queue.py", "get"), ("socket.py", "accept"),
+    ("thread.py", "_worker"),
+}
+
+# (file, function, first line of the function)
+Frame = Tuple[str, str, int]
+
+
+def _frame_key(frame) -> Frame:
+    code = frame.f_code
+    return code.co_filename, code.co_name, code.co_firstlineno
+
+
+def _short_path(filename: str) -> str:
+    """Shortens a source path to the part after site-packages or the project root."""
+    normalized = filename.replace("\\", "/")
+    for marker in ("/site-packages/", "/app/", "/wps_addin/"):
+        index = normalized.rfind(marker)
+        if index != -1:
+            prefix = "" if marker == "/site-packages/" else marker.strip("/") + "/"
+            return prefix + normalized[index + len(marker):]
+    return os.path.basename(normalized)
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of all threads of the process.
+
+    Args:
+        interval (float): Seconds between samples (default 10 ms, about 100 Hz).
+        include_idle (bool): Keep samples of threads that are blocked waiting (locks, select, queues).
+        max_depth (int): Frames kept per stack, counted from the outermost frame.
+    """
+
+    def __init__(self, interval: float = 0.01, include_idle: bool = False, max_depth: int = 128):
+        self.interval = max(0.001, interval)
+        self.include_idle = include_idle
+        self.max_depth = max_depth
+        self.samples: Counter = Counter()  # (thread label, stack) -> count
+        self.sample_count = 0
+        self.started_at: Optional[float] = None
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    #  Sampling
+    def start(self):
+        if self._thread is not None:
+            raise RuntimeError("The profiler is already running.")
+        self._stop.clear()
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.duration = time.time() - self.started_at
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _run(self):
+        own_ident = threading.get_ident()
+        next_sample = time.perf_counter()
+        while not self._stop.is_set():
+            self._sample(own_ident)
+            next_sample += self.interval
+            delay = next_sample - time.perf_counter()
+            if delay < 0:
+                # Falling behind (e.g. the GIL was held): skip the missed samples
+                next_sample = time.perf_counter()
+                delay = 0
+            self._stop.wait(delay)
+
+    def _sample(self, own_ident: int):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            stack: List[Frame] = []
+            while frame is not None:
+                stack.append(_frame_key(frame))
+                frame = frame.f_back
+            if not stack:
+                continue
+            if not self.include_idle and (os.path.basename(stack[0][0]), stack[0][1]) in _IDLE_FUNCTIONS:
+                continue
+            stack.reverse()  # Outermost frame first
+            # The ident tells apart workers that share a name (e.g. "AnyIO worker thread")
+            label = f"{names.get(ident, 'thread')} ({ident})"
+            self.samples[(label, tuple(stack[:self.max_depth]))] += 1
+        self.sample_count += 1
+
+    #  Export
+    @staticmethod
+    def _frame_name(frame: Frame) -> str:
+        filename, function, line = frame
+        return f"{function} ({_short_path(filename)}:{line})"
+
+    def to_collapsed(self) -> str:
+        """One line per distinct stack: 'thread;outer;...;leaf count'."""
+        lines = []
+        for (label, stack), count in sorted(self.samples.items(), key=lambda item: -item[1]):
+            names = [label] + [self._frame_name(frame) for frame in stack]
+            lines.append(";".join(name.replace(";", ":") for name in names) + f" {count}")
+        return "\n".join(lines) + ("\n" if lines else "")
+
+    def to_speedscope(self, name: str = "backend") -> Dict:
+        """Speedscope file format with one sampled profile per thread (weights in seconds)."""
+        frames: List[Dict] = []
+        frame_index: Dict[Frame, int] = {}
+        threads: Dict[str, Tuple[List[List[int]], List[float]]] = {}
+        for (label, stack), count in self.samples.items():
+            indices = []
+            for frame in stack:
+                if frame not in frame_index:
+                    frame_index[frame] = len(frames)
+                    frames.append({"name": frame[1], "file": _short_path(frame[0]), "line": frame[2]})
+                indices.append(frame_index[frame])
+            samples, weights = threads.setdefault(label, ([], []))
+            samples.append(indices)
+            weights.append(count * self.interval)
+
+        profiles = []
+        for label, (samples, weights) in sorted(threads.items(), key=lambda item: -sum(item[1][1])):
+            profiles.append({
+                "type": "sampled",
+                "name": label,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights,
+            })
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": f"{name} {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.started_at or time.time()))}",
+            "exporter": "wps_addin.sampling_profiler",
+            "activeProfileIndex": 0,
+            "shared": {"frames": frames},
+            "profiles": profiles,
+        }
+
+    def export(self, fmt: str = "collapsed") -> str:
+        if fmt == "collapsed":
+            return self.to_collapsed()
+        if fmt == "speedscope":
+            return json.dumps(self.to_speedscope())
+        raise ValueError(f"Unknown profile format '{fmt}'. Choose from {FORMATS}.")
+
+
+def profile_to_file(seconds: float, path: str, fmt: str = "collapsed", interval: float = 0.01, include_idle: bool = False) -> threading.Thread:
+    """
+    Profiles the process for `seconds` in the background and writes the result to `path`.
+    Returns the (daemon) thread doing the work.
+    """
+    def run():
+        profiler = SamplingProfiler(interval=interval, include_idle=include_idle)
+        with profiler:
+            time.sleep(seconds)
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(profiler.export(fmt))
+        print(f"Profiler: wrote {profiler.sample_count} samples ({profiler.duration:.1f}s) to {path}")
+
+    thread = threading.Thread(target=run, name="profile-to-file", daemon=True)
+    thread.start()
+    return thread
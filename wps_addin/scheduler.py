@@ -0,0 +1,211 @@
+"""
+Admission control and priority scheduling for the backend.
+Requests are sorted into workload classes (interactive prompts, document builds, heavy
+analyses and reports). Each class has its own concurrency pool and a bounded wait queue, so one
+large analysis cannot take the slots that short requests need. A shared limit on the total
+number of running requests is handed out in priority order, so interactive requests go first
+when the server is busy. A request that cannot be queued gets 503 with a Retry-After estimate.
+"""
+import asyncio
+import itertools
+import json
+import math
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+from wps_addin.compression import read_body, replayed_receive
+
+
+class WorkloadClass:
+    """
+    A pool of request slots.
+
+    Args:
+        name (str): Class name, used in metrics and logs.
+        concurrency (int): Requests of this class that may run at once.
+        max_queue (int): Requests that may wait for a slot; more are rejected.
+        priority (int): Lower runs first when the total limit is reached.
+    """
+
+    def __init__(self, name: str, concurrency: int, max_queue: int, priority: int):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.max_queue = max(0, max_queue)
+        self.priority = priority
+        self.running = 0
+        self.queued = 0
+        self.rejected = 0
+        self.admitted = 0
+        self.mean_service_s = 1.0  # Moving average of run time, for Retry-After
+
+    def retry_after(self) -> int:
+        """Rough seconds until a queue place frees up."""
+        return max(1, math.ceil(self.mean_service_s * (self.queued + 1) / self.concurrency))
+
+
+class Overloaded(Exception):
+    """Raised when a request can neither run nor wait."""
+
+    def __init__(self, workload: WorkloadClass, reason: str):
+        super().__init__(f"{workload.name}: {reason}")
+        self.workload = workload
+        self.reason = reason
+        self.retry_after = workload.retry_after()
+
+
+class _Waiter:
+    __slots__ = ("workload", "future", "loop", "granted")
+
+    def __init__(self, workload: WorkloadClass, future: asyncio.Future, loop: asyncio.AbstractEventLoop):
+        self.workload = workload
+        self.future = future
+        self.loop = loop
+        self.granted = False
+
+
+class AdmissionController:
+    """
+    Hands out request slots per workload class.
+
+    Args:
+        classes (List[WorkloadClass]): The workload classes.
+        max_total (Optional[int]): Requests of all classes that may run at once. The default is the
+            largest pool plus one slot per other class: each class can still run a request while
+            the largest pool is full, and beyond that freed slots go to the highest priority.
+        max_wait (float): Seconds a request may wait for a slot before it is rejected.
+    """
+
+    def __init__(self, classes: List[WorkloadClass], max_total: Optional[int] = None, max_wait: float = 60.0):
+        self.classes: Dict[str, WorkloadClass] = {workload.name: workload for workload in classes}
+        self.max_total = max_total or max(workload.concurrency for workload in classes) + len(classes) - 1
+        self.max_wait = max_wait
+        self.running_total = 0
+        self._waiters: List[tuple] = []  # (priority, sequence, waiter), kept sorted
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+    def _can_run(self, workload: WorkloadClass) -> bool:
+        return workload.running < workload.concurrency and self.running_total < self.max_total
+
+    def _grant(self, workload: WorkloadClass):
+        workload.running += 1
+        workload.admitted += 1
+        self.running_total += 1
+
+    def _dispatch(self):
+        """Grants freed slots to waiters, highest priority first. Call with the lock held."""
+        remaining = []
+        for entry in self._waiters:
+            waiter = entry[2]
+            if waiter.future.done():
+                waiter.workload.queued -= 1  # Timed out or cancelled while waiting
+                continue
+            if self._can_run(waiter.workload):
+                waiter.workload.queued -= 1
+                waiter.granted = True
+                self._grant(waiter.workload)
+                # Waiters may sit on another thread's event loop
+                waiter.loop.call_soon_threadsafe(_resolve, waiter.future)
+            else:
+                remaining.append(entry)
+        self._waiters = remaining
+
+    async def acquire(self, name: str):
+        """Waits for a slot in the class. Raises Overloaded if the queue is full or the wait is too long."""
+        workload = self.classes[name]
+        with self._lock:
+            if self._can_run(workload) and not any(entry[2].workload is workload for entry in self._waiters):
+                self._grant(workload)
+                return
+            if workload.queued >= workload.max_queue:
+                workload.rejected += 1
+                raise Overloaded(workload, "queue full")
+            loop = asyncio.get_running_loop()
+            waiter = _Waiter(workload, loop.create_future(), loop)
+            workload.queued += 1
+            self._waiters.append((workload.priority, next(self._sequence), waiter))
+            self._waiters.sort(key=lambda entry: entry[:2])
+
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.max_wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            with self._lock:
+                if not waiter.future.done():
+                    waiter.future.cancel()
+                granted = waiter.granted
+                if isinstance(e, asyncio.TimeoutError):
+                    workload.rejected += 1
+                self._dispatch()  # Drops the abandoned waiter from the queue
+            if granted:
+                # The slot was granted just as the wait ended; give it back
+                self.release(name, 0.0)
+            if isinstance(e, asyncio.TimeoutError):
+                raise Overloaded(workload, f"no slot within {self.max_wait:g}s")
+            raise
+
+    def release(self, name: str, service_seconds: float):
+        workload = self.classes[name]
+        with self._lock:
+            workload.running -= 1
+            self.running_total -= 1
+            if service_seconds:
+                workload.mean_service_s = 0.8 * workload.mean_service_s + 0.2 * service_seconds
+            self._dispatch()
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {name: {"running": workload.running, "queued": workload.queued, "rejected": workload.rejected,
+                           "admitted": workload.admitted, "concurrency": workload.concurrency}
+                    for name, workload in self.classes.items()}
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(True)
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware that runs each classified request inside a slot of its workload class.
+    `classify(scope)` returns the class name, or None for requests that bypass admission
+    (health checks, metrics, downloads). For requests on `body_paths`, whose class may depend
+    on the body, `classify_body(scope, body, name)` then returns the final class; the body is
+    read first and passed on unchanged.
+    """
+
+    def __init__(self, app, controller: AdmissionController, classify: Callable[[dict], Optional[str]],
+                 classify_body: Optional[Callable[[dict, bytes, str], str]] = None, body_paths: Sequence[str] = ()):
+        self.app = app
+        self.controller = controller
+        self.classify = classify
+        self.classify_body = classify_body
+        self.body_paths = set(body_paths)
+
+    async def __call__(self, scope, receive, send):
+        name = self.classify(scope) if scope["type"] == "http" else None
+        if name is None:
+            await self.app(scope, receive, send)
+            return
+        if self.classify_body is not None and scope["path"] in self.body_paths:
+            body = await read_body(receive)
+            if body is None:
+                return
+            name = self.classify_body(scope, body, name)
+            receive = replayed_receive(body, receive)
+        try:
+            await self.controller.acquire(name)
+        except Overloaded as e:
+            body = json.dumps({"detail": f"Server busy ({e.reason}). Retry in {e.retry_after}s."}).encode("utf-8")
+            await send({"type": "http.response.start", "status": 503, "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(e.retry_after).encode()),
+            ]})
+            await send({"type": "http.response.body", "body": body})
+            return
+        started = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(name, time.monotonic() - started)
@@ -0,0 +1,98 @@
+"""
+State shared between backend worker processes.
+With several uvicorn workers, each process has its own memory, so anything that must be seen by
+all of them (idempotency records, which worker runs the cleanup jobs) lives in a local SQLite
+database in WAL mode. Readers never block, and writers wait for each other (busy timeout)
+instead of failing.
+"""
+import os
+import socket
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+# Seconds a writer waits for another process's write transaction
+BUSY_TIMEOUT = 30.0
+
+_LEASE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS leases (
+    name       TEXT PRIMARY KEY,
+    owner      TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """
+    Opens a SQLite database for use by several threads and processes.
+    Transactions are managed explicitly (BEGIN IMMEDIATE ... COMMIT) by the callers.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    db = sqlite3.connect(path, timeout=BUSY_TIMEOUT, check_same_thread=False, isolation_level=None)
+    db.row_factory = sqlite3.Row
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    return db
+
+
+def process_id() -> str:
+    """Identifies this worker process in lease and record owners."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class Lease:
+    """
+    A named, expiring lease for electing one worker to run a job (e.g. the artifact sweeper).
+    The holder renews it by calling acquire() again before `ttl_seconds` pass; if the holder
+    dies, another worker takes over once the lease expires.
+
+    Args:
+        path (str): The shared state database.
+        name (str): Lease name.
+        ttl_seconds (float): Validity of the lease after each acquire().
+    """
+
+    def __init__(self, path: str, name: str, ttl_seconds: float):
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.owner = process_id()
+        self._lock = threading.Lock()
+        self._db = connect(path)
+        self._db.executescript(_LEASE_SCHEMA)
+
+    def acquire(self) -> bool:
+        """Takes or renews the lease. Returns True if this process holds it."""
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute("SELECT owner, expires_at FROM leases WHERE name = ?", (self.name,)).fetchone()
+                held = row is None or row["owner"] == self.owner or row["expires_at"] <= now
+                if held:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO leases (name, owner, expires_at) VALUES (?, ?, ?)",
+                        (self.name, self.owner, now + self.ttl_seconds),
+                    )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return held
+
+    def holder(self) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute("SELECT owner, expires_at FROM leases WHERE name = ?", (self.name,)).fetchone()
+        return row["owner"] if row is not None and row["expires_at"] > time.time() else None
+
+    def release(self):
+        """Gives the lease up (on shutdown) so another worker can take it at once."""
+        with self._lock:
+            self._db.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (self.name, self.owner))
+
+    def close(self):
+        self.release()
+        with self._lock:
+            self._db.close()
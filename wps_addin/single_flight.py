@@ -0,0 +1,84 @@
+"""
+Request coalescing ("single flight") for the backend.
+When identical requests arrive while one of them is still being computed (several people
+summarizing the same shared file, a double-clicked ribbon button), only the first one runs.
+The others wait for it and receive the same result, or the same exception.
+"""
+import threading
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+from wps_addin.artifact_store import request_hash
+
+
+class _Call:
+    """An in-flight computation and the outcome shared with its waiters."""
+
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Runs at most one computation per key at a time; concurrent callers with the same key share it.
+    Nothing is cached: once the computation finishes, the next call with the key runs again.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0  # Calls that ran the computation
+        self.shared = 0   # Calls that received another call's result
+
+    def do(self, key: Hashable, func: Callable, *args, **kwargs) -> Any:
+        """
+        Returns func(*args, **kwargs), or the result of an identical call already in flight.
+
+        Args:
+            key (Hashable): Identifies identical requests, e.g. flight_key(endpoint, payload).
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.shared += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self) -> Tuple[int, int]:
+        """Returns (shared, leaders), i.e. (hits, misses) for the metrics cache collector."""
+        return self.shared, self.leaders
+
+    @property
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+
+def flight_key(endpoint: str, payload: Dict[str, Any]) -> str:
+    """Key for an endpoint call; payloads that only differ in whitespace or key order match."""
+    return request_hash(endpoint, payload)
@@ -0,0 +1,260 @@
+"""
+Persistent WebSocket channel between the add-in and the backend.
+One connection carries any number of requests at once (multiplexed by a client-chosen id).
+While a request runs, the server pushes its progress (the stages traced as spans: parsing,
+statistics, plots, LLM call, Word report) and the streamed LLM tokens, then the result.
+
+Requests run through the normal HTTP app, so admission control, idempotency and tracing apply
+as for a POST. The request id doubles as the Idempotency-Key: a client that loses the channel
+can also fetch the result with a plain POST carrying that key.
+
+Events are numbered per session and the recent ones are kept, so a client that reconnects with
+{"type": "hello", "session": ..., "last_seq": n} receives what it missed; requests keep
+running while the client is away.
+
+Browsers do not apply CORS to WebSockets, so any page the user opens could otherwise connect to
+the local backend and run requests with the user's LLM key. A handshake whose Origin is not in
+`allowed_origins` is refused; clients that send no Origin (the add-in, scripts) are not browsers.
+
+Client frames:
+    {"type": "hello", "session": "<id or empty>", "last_seq": 0}
+    {"type": "request", "id": "<request id>", "endpoint": "/analyze", "payload": {...}}
+Server frames:
+    {"type": "welcome", "session": "<id>", "resumed": true|false}
+    {"seq": n, "type": "accepted" | "progress" | "token" | "result", "id": "<request id>", ...}
+"""
+import asyncio
+import json
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Sequence, Tuple
+
+from app.agents.tracing import Span
+
+_ID_RE = re.compile(r'^[A-Za-z0-9._:-]{1,128}$')
+
+
+class ChannelSession:
+    """Events of one add-in client, kept across reconnects."""
+
+    def __init__(self, session_id: str, buffer_size: int):
+        self.id = session_id
+        self.events: Deque[Dict[str, Any]] = deque(maxlen=buffer_size)
+        self.seq = 0
+        self.jobs: Dict[str, asyncio.Task] = {}
+        self.connected = False
+        self.last_seen = time.monotonic()
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def attach(self, loop: asyncio.AbstractEventLoop, wakeup: asyncio.Event):
+        with self._lock:
+            self._loop, self._wakeup = loop, wakeup
+            self.connected = True
+
+    def detach(self):
+        with self._lock:
+            self._loop = self._wakeup = None
+            self.connected = False
+            self.last_seen = time.monotonic()
+
+    def publish(self, event: Dict[str, Any]):
+        """Numbers and buffers an event and wakes the sender. Safe to call from any thread."""
+        with self._lock:
+            self.seq += 1
+            self.events.append(dict(event, seq=self.seq))
+            loop, wakeup = self._loop, self._wakeup
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(wakeup.set)
+            except RuntimeError:
+                pass  # The connection's loop is gone; the events wait for a reconnect
+
+    def since(self, last_seq: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [event for event in self.events if event["seq"] > last_seq]
+
+
+class WebSocketChannel:
+    """
+    Serves the /ws endpoint and routes progress of the requests it started back to their client.
+
+    Args:
+        app: The ASGI app that runs the requests (the backend itself).
+        paths (Sequence[str]): POST endpoints that may be called over the channel.
+        buffer_size (int): Events kept per session for resuming.
+        session_ttl (float): Seconds a disconnected session (and its events) is kept.
+        allowed_origins (Sequence[str]): Web origins allowed to connect (e.g. the CORS allow-list
+            and the backend's own origin).
+    """
+
+    def __init__(self, app, paths: Sequence[str], buffer_size: int = 2000, session_ttl: float = 600.0,
+                 allowed_origins: Sequence[str] = ()):
+        self.app = app
+        self.paths = set(paths)
+        self.allowed_origins = {origin.rstrip("/").lower() for origin in allowed_origins}
+        self.buffer_size = buffer_size
+        self.session_ttl = session_ttl
+        self._sessions: Dict[str, ChannelSession] = {}
+        # Request id (as seen by tracing) -> (session, client request id)
+        self._requests: Dict[str, Tuple[ChannelSession, str]] = {}
+        self._lock = threading.Lock()
+
+    #  Tracing hooks (called on the threads running the requests)
+    def span_listener(self, event: str, span_obj: Span):
+        target = self._requests.get(span_obj.request_id) if span_obj.request_id else None
+        if target is None or span_obj.kind == "server":
+            return
+        session, request_id = target
+        progress = {"type": "progress", "id": request_id, "stage": span_obj.name, "state": event}
+        if event == "end":
+            progress["ms"] = round(span_obj.duration_ms or 0.0, 1)
+            progress["status"] = span_obj.status
+        session.publish(progress)
+
+    def chunk_listener(self, span_obj: Span, text: str):
+        target = self._requests.get(span_obj.request_id) if span_obj.request_id else None
+        if target is not None:
+            session, request_id = target
+            session.publish({"type": "token", "id": request_id, "text": text})
+
+    #  Sessions
+    def _session(self, session_id: str) -> Tuple[ChannelSession, bool]:
+        with self._lock:
+            now = time.monotonic()
+            for key, session in list(self._sessions.items()):
+                if not session.connected and not session.jobs and now - session.last_seen > self.session_ttl:
+                    del self._sessions[key]
+            session = self._sessions.get(session_id) if _ID_RE.match(session_id or "") else None
+            if session is not None:
+                return session, True
+            session = ChannelSession(uuid.uuid4().hex, self.buffer_size)
+            self._sessions[session.id] = session
+            return session, False
+
+    @property
+    def active_requests(self) -> int:
+        return len(self._requests)
+
+    #  Connection
+    async def serve(self, websocket):
+        """Runs one client connection until it closes."""
+        origin = websocket.headers.get("origin")
+        if origin is not None and origin.rstrip("/").lower() not in self.allowed_origins:
+            await websocket.close(code=1008)  # Before accept(): the handshake gets 403
+            return
+        await websocket.accept()
+        try:
+            hello = await websocket.receive_json()
+        except Exception:
+            await websocket.close(code=1002)
+            return
+        if not isinstance(hello, dict) or hello.get("type") != "hello":
+            await websocket.close(code=1002)
+            return
+        session, resumed = self._session(str(hello.get("session") or ""))
+        try:
+            last_seq = int(hello.get("last_seq") or 0) if resumed else 0
+        except (TypeError, ValueError):
+            last_seq = 0  # Resend everything still buffered
+
+        wakeup = asyncio.Event()
+        session.attach(asyncio.get_running_loop(), wakeup)
+        await websocket.send_json({"type": "welcome", "session": session.id, "resumed": resumed})
+        sender = asyncio.create_task(self._send_events(websocket, session, wakeup, last_seq))
+        try:
+            while True:
+                message = await websocket.receive_json()
+                if isinstance(message, dict) and message.get("type") == "request":
+                    self._start(session, message)
+        except Exception:
+            pass  # Disconnected (or a malformed frame); running requests carry on
+        finally:
+            session.detach()
+            sender.cancel()
+
+    async def _send_events(self, websocket, session: ChannelSession, wakeup: asyncio.Event, last_seq: int):
+        try:
+            while True:
+                for event in session.since(last_seq):
+                    await websocket.send_json(event)
+                    last_seq = event["seq"]
+                await wakeup.wait()
+                wakeup.clear()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            pass  # The socket closed; serve() notices on its next receive
+
+    def _start(self, session: ChannelSession, message: Dict[str, Any]):
+        request_id = str(message.get("id") or "")
+        endpoint = message.get("endpoint")
+        if not _ID_RE.match(request_id):
+            session.publish({"type": "result", "id": request_id, "status": 400, "body": {"detail": "Invalid request id."}})
+            return
+        if request_id in session.jobs:
+            return  # Resent after a reconnect while still running
+        if endpoint not in self.paths:
+            session.publish({"type": "result", "id": request_id, "status": 404, "body": {"detail": f"Unknown endpoint {endpoint!r}."}})
+            return
+        session.publish({"type": "accepted", "id": request_id})
+        task = asyncio.get_running_loop().create_task(self._run(session, request_id, endpoint, message.get("payload") or {}))
+        session.jobs[request_id] = task
+        task.add_done_callback(lambda _task: session.jobs.pop(request_id, None))
+
+    async def _run(self, session: ChannelSession, request_id: str, endpoint: str, payload: Dict[str, Any]):
+        """Runs the request through the HTTP app and publishes its response."""
+        trace_id = f"ws-{uuid.uuid4().hex}"
+        body = json.dumps(payload).encode("utf-8")
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+            "scheme": "http", "path": endpoint, "raw_path": endpoint.encode(), "root_path": "", "query_string": b"",
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"idempotency-key", request_id.encode()),
+                (b"x-request-id", trace_id.encode()),
+            ],
+            "client": ("websocket", 0), "server": ("127.0.0.1", 8000),
+        }
+        received = {"done": False}
+        status = {"code": 500, "retry_after": None}
+        chunks: List[bytes] = []
+
+        async def receive():
+            if not received["done"]:
+                received["done"] = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            await asyncio.Event().wait()  # No disconnect: the request runs to completion
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                status["retry_after"] = dict(message.get("headers", [])).get(b"retry-after")
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        with self._lock:
+            self._requests[trace_id] = (session, request_id)
+        try:
+            await self.app(scope, receive, send)
+        except Exception as e:
+            status["code"] = 500
+            chunks = [json.dumps({"detail": f"{type(e).__name__}: {e}"}).encode("utf-8")]
+        finally:
+            with self._lock:
+                self._requests.pop(trace_id, None)
+
+        raw = b"".join(chunks)
+        try:
+            response_body = json.loads(raw) if raw else None
+        except ValueError:
+            response_body = raw.decode("utf-8", "replace")
+        result = {"type": "result", "id": request_id, "status": status["code"], "body": response_body}
+        if status["retry_after"]:
+            result["retry_after"] = int(status["retry_after"])
+        session.publish(result)
@@ -4,13 +4,15 @@ import datetime
 import traceback
 import os
 import sys
-import threading
+import json
 import requests
 import win32com.client
 import win32api
 import logging
 import pythoncom
 from tkinter import simpledialog, Tk
+from addin_executor import BUSY, DUPLICATE, AddinExecutor, RequestCancelled, call_cancellable
+from compression import post_json
 
 # file-based logging setup
 # (Keep the logging setup from your original code)
@@ -39,6 +41,9 @@ except Exception as e:
 # Configuration - BACKEND IP address
 BACKEND_URL = "http://127.0.0.1:8000"
 
+# Shared by all ribbon actions: bounded, deduplicated and cancellable
+request_executor = AddinExecutor()
+
 # Consistent naming
 WPS_ADDIN_ENTRY_NAME = "WPSAIAddin.Connect"
 
@@ -83,6 +88,7 @@ class WPSAddin:
         'GetTabLabel', 'GetGroupLabel', 'GetRunPromptLabel', 'GetAnalyzeDocLabel',
         'GetSummarizeDocLabel', 'GetCreateMemoLabel', 'GetCreateMinutesLabel',
         'GetCreateCoverLetter', 'OnCreateMemo', 'OnCreateMinutes', 'OnCreateCoverLetter',
+        'GetCancelRequestsLabel', 'OnCancelRequests',
         'GetCustomUI' # This is the method that WPS Office expects to load the XML
 
     ]
@@ -115,7 +121,10 @@ class WPSAddin:
                     "connection_error": "\n\nERROR: Could not connect to the backend server. Please ensure the AI Backend is running.\n\n",
                     "unexpected_error": "\n\nAn unexpected error occurred: {e}\n\n",
                     "result_header": "\n\n--- AI Assistant Result ---\n", "result_footer": "\n--- End of Result ---\n\n",
-                    "no_active_doc": "No active document found."
+                    "no_active_doc": "No active document found.",
+                    "cancel_requests": "Cancel AI Request", "request_cancelled": "\n\nAI Assistant: Request cancelled.\n\n",
+                    "request_duplicate": "\n\nAI Assistant: The same request is already running.\n\n",
+                    "addin_busy": "\n\nAI Assistant: Too many requests are waiting. Try again when one has finished.\n\n"
                 }
             }
             log_message("--- Add-in __init__ completed successfully. ---")
@@ -189,6 +198,7 @@ class WPSAddin:
     def GetCreateMemoLabel(self, c): return self._get_localized_string("create_memo")
     def GetCreateMinutesLabel(self, c): return self._get_localized_string("create_minutes")
     def GetCreateCoverLetterLabel(self, c): return self._get_localized_string("create_cover_letter")
+    def GetCancelRequestsLabel(self, c): return self._get_localized_string("cancel_requests")
 
     def OnLoadImage(self, imageName):
         image_path = resource_path(f"{imageName}.png")
@@ -201,17 +211,35 @@ class WPSAddin:
             log_message(f"ERROR: Failed to load image '{imageName}': {e}")
             return None
 
-    def _call_backend_task(self, endpoint: str, payload: dict):
+    def _submit_backend_task(self, endpoint: str, payload: dict):
+        """Queues a backend call on the shared executor (identical calls in flight run once)."""
+        key = (endpoint, json.dumps(payload, sort_keys=True))
+        status, _ = request_executor.submit(key, self._call_backend_task, endpoint, payload)
+        if status == DUPLICATE:
+            log_message(f"Ignoring duplicate request to {endpoint}")
+            insert_text_at_cursor(self._get_localized_string("request_duplicate"))
+        elif status == BUSY:
+            log_message(f"Refusing request to {endpoint}: {request_executor.in_flight} requests in flight")
+            insert_text_at_cursor(self._get_localized_string("addin_busy"))
+
+    def OnCancelRequests(self, c):
+        count = request_executor.cancel_all()
+        log_message(f"Cancel requested for {count} backend request(s)")
+
+    def _call_backend_task(self, endpoint: str, payload: dict, cancel=None):
         log_message(f"Calling backend endpoint: {endpoint}")
         try:
             insert_text_at_cursor(self._get_localized_string("contacting_server"))
-            response = requests.post(f"{BACKEND_URL}{endpoint}", json=payload, timeout=300)
+            response = call_cancellable(cancel, post_json, requests, f"{BACKEND_URL}{endpoint}", payload, timeout=300)
             response.raise_for_status()
             result = response.json().get("result", "")
             header = self._get_localized_string("result_header")
             footer = self._get_localized_string("result_footer")
             insert_text_at_cursor(f"{header}{result}{footer}")
             log_message(f"Successfully received response from {endpoint}.")
+        except RequestCancelled:
+            log_message(f"Request to {endpoint} cancelled")
+            insert_text_at_cursor(self._get_localized_string("request_cancelled"))
         except requests.exceptions.ConnectionError:
             log_message(f"Connection error to {endpoint}")
             insert_text_at_cursor(self._get_localized_string("connection_error"))
@@ -226,24 +254,21 @@ class WPSAddin:
         root.destroy()
         if not prompt: 
             return insert_text_at_cursor(self._get_localized_string("action_cancelled"))
-        threading.Thread(target=self._call_backend_task, 
-                            args=("/process", {"prompt": prompt})).start()
+        self._submit_backend_task("/process", {"prompt": prompt})
 
     def OnAnalyzeDocument(self, c):
         wps_app = get_wps_application()
         if not wps_app or wps_app.Documents.Count == 0: 
             return insert_text_at_cursor(self._get_localized_string("no_active_doc"))
         content = wps_app.ActiveDocument.Content.Text
-        threading.Thread(target=self._call_backend_task, 
-                            args=("/analyze", {"content": content, "prompt": "Analyze the document content."})).start()
+        self._submit_backend_task("/analyze", {"content": content, "prompt": "Analyze the document content."})
 
     def OnSummarizeDocument(self, c):
         wps_app = get_wps_application()
         if not wps_app or wps_app.Documents.Count == 0: 
             return insert_text_at_cursor(self._get_localized_string("no_active_doc"))
         content = wps_app.ActiveDocument.Content.Text
-        threading.Thread(target=self._call_backend_task, 
-                            args=("/summarize", {"content": content, "prompt": "Summarize the document content."})).start()
+        self._submit_backend_task("/summarize", {"content": content, "prompt": "Summarize the document content."})
 
     def OnCreateMemo(self, c):
         root = Tk(); root.withdraw()
@@ -256,7 +281,7 @@ class WPSAddin:
                                             self._get_localized_string("memo_audience"))
         root.destroy()
         payload = {"doc_type": "memo", "topic": topic, "audience": audience or "Internal Team"}
-        threading.Thread(target=self._call_backend_task, args=("/create_memo", payload)).start()
+        self._submit_backend_task("/create_memo", payload)
 
     def OnCreateMinutes(self, c):
         root = Tk(); root.withdraw()
@@ -275,7 +300,7 @@ class WPSAddin:
             "members_present": [name.strip() for name in (attendees or "").split(',') if name.strip()],
             "data_sources": [data.strip() for data in (info or "").split(',') if data.strip()]
         }
-        threading.Thread(target=self._call_backend_task, args=("/create_minutes", payload)).start()
+        self._submit_backend_task("/create_minutes", payload)
 
     def OnCreateCoverLetter(self, c):
         root = Tk(); root.withdraw()
@@ -288,7 +313,7 @@ class WPSAddin:
                                             self._get_localized_string("cover_letter_audience"))
         root.destroy()
         payload = {"doc_type": "cover_letter", "topic": topic, "audience": audience or "Hiring Manager"}
-        threading.Thread(target=self._call_backend_task, args=("/create_cover_letter", payload)).start()
+        self._submit_backend_task("/create_cover_letter", payload)
         
         
     def register_wps_addin_entry(clsid, progid, description):
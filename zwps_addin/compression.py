@@ -0,0 +1,194 @@
+"""
+Compressed request bodies.
+Document text is posted as JSON, which compresses well (typically 4-8x). Clients compress
+bodies above REQUEST_COMPRESSION_MIN_BYTES and mark them with Content-Encoding (zstd when the
+optional `zstandard` package is installed, gzip otherwise); RequestDecompressionMiddleware
+restores them on the backend before anything else sees the body. Responses are compressed by
+Starlette's GZipMiddleware.
+
+The client helpers only need the standard library, so the 32-bit add-in and the Linux proxy
+can use this module as well.
+"""
+import gzip
+import json
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import zstandard  # Optional; faster and smaller than gzip
+    _DECODE_ERRORS = (zlib.error, EOFError, zstandard.ZstdError)
+except ImportError:
+    zstandard = None
+    _DECODE_ERRORS = (zlib.error, EOFError)
+
+# Bodies smaller than this are sent as they are
+REQUEST_COMPRESSION_MIN_BYTES = 16 * 1024
+# Largest decompressed body the backend accepts (guards against compression bombs)
+MAX_DECOMPRESSED_BYTES = 256 * 1024 * 1024
+
+SUPPORTED_ENCODINGS = ("zstd", "gzip") if zstandard is not None else ("gzip",)
+
+# Encodings a backend answered with 415 (e.g. zstd when the backend lacks zstandard)
+_rejected_encodings = set()
+
+
+#  Client side
+def compress_body(body: bytes, encoding: Optional[str] = None,
+                  min_size: int = REQUEST_COMPRESSION_MIN_BYTES) -> Tuple[bytes, Optional[str]]:
+    """
+    Compresses a request body if it is large enough.
+
+    Args:
+        body (bytes): The encoded request body.
+        encoding (Optional[str]): "zstd" or "gzip"; default: the best one available.
+
+    Returns:
+        (body, Content-Encoding value or None if the body is sent uncompressed)
+    """
+    if len(body) < min_size:
+        return body, None
+    encoding = encoding or SUPPORTED_ENCODINGS[0]
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=3).compress(body), "zstd"
+    return gzip.compress(body, compresslevel=5), "gzip"
+
+
+def _encoded_attempts(payload, headers: Optional[Dict[str, str]]):
+    """Yields (body, headers, encoding) to try in turn: compressed first, finally uncompressed."""
+    body = json.dumps(payload).encode("utf-8")
+    for encoding in (*SUPPORTED_ENCODINGS, None):
+        if encoding in _rejected_encodings:
+            continue
+        data, used = compress_body(body, encoding) if encoding else (body, None)
+        request_headers = dict(headers or {}, **{"Content-Type": "application/json"})
+        if used:
+            request_headers["Content-Encoding"] = used
+        yield data, request_headers, used
+
+
+def _encoding_rejected(response, used: Optional[str]) -> bool:
+    """True if the backend did not accept the body's encoding (which is then not tried again)."""
+    if used is None:
+        return False
+    if response.status_code in (400, 422) and ("json_invalid" in response.text or "error parsing the body" in response.text):
+        _rejected_encodings.update(SUPPORTED_ENCODINGS)  # The backend predates compressed requests
+        return True
+    if response.status_code == 415:
+        _rejected_encodings.add(used)
+        return True
+    return False
+
+
+def post_json(http, url: str, payload, headers: Optional[Dict[str, str]] = None, timeout: float = 300):
+    """
+    Posts `payload` as JSON, compressed when it is large.
+
+    Args:
+        http: The `requests` module or a requests.Session.
+
+    Returns:
+        The response. If the backend does not accept an encoding (415, or an older backend that
+        fails to parse the compressed bytes as JSON), the next one is used, and finally an
+        uncompressed body; the rejected encoding is not tried again.
+    """
+    for data, request_headers, used in _encoded_attempts(payload, headers):
+        response = http.post(url, data=data, headers=request_headers, timeout=timeout)
+        if not _encoding_rejected(response, used):
+            return response
+
+
+async def post_json_async(client, url: str, payload, headers: Optional[Dict[str, str]] = None, timeout: float = 300):
+    """post_json for an httpx.AsyncClient."""
+    for data, request_headers, used in _encoded_attempts(payload, headers):
+        response = await client.post(url, content=data, headers=request_headers, timeout=timeout)
+        if not _encoding_rejected(response, used):
+            return response
+
+
+#  Server side
+class BodyTooLarge(ValueError):
+    """The decompressed body would exceed the limit."""
+
+
+def decompress_body(body: bytes, encoding: str, limit: int = MAX_DECOMPRESSED_BYTES) -> bytes:
+    """Decompresses a request body. Raises ValueError if it is corrupt or larger than `limit`."""
+    try:
+        if encoding == "gzip":
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            data = decompressor.decompress(body, limit + 1)
+            if not decompressor.eof and not decompressor.unconsumed_tail:
+                raise ValueError("truncated gzip body")
+        elif encoding == "zstd" and zstandard is not None:
+            reader = zstandard.ZstdDecompressor().stream_reader(body)
+            data = reader.read(limit + 1)
+        else:
+            raise LookupError(encoding)
+    except _DECODE_ERRORS as e:
+        raise ValueError(f"invalid {encoding} body: {e}")
+    if len(data) > limit:
+        raise BodyTooLarge(f"decompressed body exceeds {limit} bytes")
+    return data
+
+
+class RequestDecompressionMiddleware:
+    """
+    ASGI middleware that decompresses request bodies sent with Content-Encoding gzip or zstd.
+    The request reaches the app with the plain body, a matching Content-Length and no
+    Content-Encoding header. Unsupported encodings get 415 (listing the accepted ones in
+    Accept-Encoding), corrupt or oversized bodies 400 or 413.
+    """
+
+    def __init__(self, app, max_size: int = MAX_DECOMPRESSED_BYTES):
+        self.app = app
+        self.max_size = max_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers: Dict[bytes, bytes] = dict(scope["headers"])
+        encoding = headers.get(b"content-encoding", b"").decode("latin-1").strip().lower()
+        if encoding in ("", "identity"):
+            await self.app(scope, receive, send)
+            return
+        if encoding not in SUPPORTED_ENCODINGS:
+            await _send_error(send, 415, f"Unsupported Content-Encoding {encoding!r}.",
+                              [(b"accept-encoding", ", ".join(SUPPORTED_ENCODINGS).encode())])
+            return
+
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        try:
+            body = decompress_body(b"".join(chunks), encoding, self.max_size)
+        except ValueError as e:
+            await _send_error(send, 413 if isinstance(e, BodyTooLarge) else 400, f"Could not decompress the request body: {e}")
+            return
+
+        scope = dict(scope)
+        scope["headers"] = [(name, value) for name, value in scope["headers"] if name not in (b"content-encoding", b"content-length")]
+        scope["headers"].append((b"content-length", str(len(body)).encode()))
+        body_sent = {"done": False}
+
+        async def decompressed_receive():
+            if body_sent["done"]:
+                return await receive()  # Waits for the client to disconnect
+            body_sent["done"] = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        await self.app(scope, decompressed_receive, send)
+
+
+async def _send_error(send, status: int, detail: str, extra_headers: Optional[List[Tuple[bytes, bytes]]] = None):
+    body = json.dumps({"detail": detail}).encode("utf-8")
+    await send({"type": "http.response.start", "status": status, "headers": [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(body)).encode()),
+        *(extra_headers or []),
+    ]})
+    await send({"type": "http.response.body", "body": body})
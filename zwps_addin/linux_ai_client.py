@@ -1,91 +1,284 @@
 # linux_ai_client.py
+"""
+Local proxy between the WPS macros on Linux and the AI backend.
+The macros post to the routes below and get {"result": "..."} back. The proxy is asynchronous:
+every request waits for the backend without holding a thread, and all of them share one pooled
+keep-alive connection set to the backend, so many WPS users can be served at the same time.
+
+-   PROXY_MAX_CONCURRENCY requests are forwarded at once; further ones wait up to
+    PROXY_QUEUE_TIMEOUT seconds for a slot and then get 503 with Retry-After.
+-   The backend's health is checked at most every HEALTH_TTL_SECONDS. While it is known to be
+    down, requests fail at once instead of each waiting for a connection timeout.
+-   /backend/<path> passes any backend endpoint through unchanged, streaming chunked and
+    server-sent-event responses (e.g. /backend/batch_documents) as they arrive.
+"""
+import asyncio
 import datetime
-import traceback
+import os
 import sys
-import threading
-import requests
-from flask import Flask, request, jsonify
+import time
+import traceback
+
+import anyio
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from compression import post_json_async
 
 # --- Configuration ---
 # This is the address of your main AI backend server
-BACKEND_URL = "http://127.0.0.1:8000"
+BACKEND_URL = os.getenv("BACKEND_URL", "http://127.0.0.1:8000")
 
 # This is the port the local client server will listen on.
 # The WPS macro will send its requests here.
-CLIENT_PORT = 5001
+CLIENT_PORT = int(os.getenv("CLIENT_PORT", "5001"))
+
+# Requests forwarded at the same time, and how long a request waits for a slot
+PROXY_MAX_CONCURRENCY = int(os.getenv("PROXY_MAX_CONCURRENCY", "64"))
+PROXY_QUEUE_TIMEOUT = float(os.getenv("PROXY_QUEUE_TIMEOUT", "30"))
+# Keep-alive connections kept open to the backend
+BACKEND_POOL_SIZE = int(os.getenv("BACKEND_POOL_SIZE", "32"))
+# How long a health check result is trusted
+HEALTH_TTL_SECONDS = float(os.getenv("HEALTH_TTL_SECONDS", "10"))
+BACKEND_TIMEOUT = httpx.Timeout(300.0, connect=5.0)
+
+# Headers that describe one connection and are not forwarded
+HOP_BY_HOP_HEADERS = {"connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+                      "te", "trailer", "transfer-encoding", "upgrade", "host"}
+
+CONNECTION_ERROR_RESULT = "ERROR: Could not connect to the AI backend server."
 
 # --- App Initialization ---
-app = Flask(__name__)
+app = FastAPI(title="WPS AI Linux Proxy")
+backend: httpx.AsyncClient = None  # Created at startup, on the server's event loop
 
 # --- Terminal Logging for Debugging ---
 def log_message(message):
     """Writes a message with a timestamp to the terminal (stdout)."""
     print(f"[{datetime.datetime.now()}] {message}")
 
+# --- Concurrency Limit ---
+class ProxyBusy(Exception):
+    """No forwarding slot became free within PROXY_QUEUE_TIMEOUT."""
+
+class ConcurrencyLimit:
+    """Caps the requests forwarded at once; the others wait (bounded) for a slot."""
+
+    def __init__(self, limit: int, queue_timeout: float):
+        self.limit = limit
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(limit)
+
+    async def acquire(self):
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise ProxyBusy()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+
+    def release(self):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+limit = ConcurrencyLimit(PROXY_MAX_CONCURRENCY, PROXY_QUEUE_TIMEOUT)
+
+# --- Backend Health (cached) ---
+class BackendHealth:
+    """The backend's reachability, checked at most every `ttl` seconds and updated by every forwarded call."""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.up = None  # Unknown until the first check
+        self.checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def record(self, up: bool):
+        self.up, self.checked_at = up, time.monotonic()
+
+    @property
+    def fresh(self) -> bool:
+        # A "down" result is trusted briefly, so a restarted backend is noticed quickly
+        ttl = self.ttl if self.up else min(self.ttl, 2.0)
+        return self.up is not None and time.monotonic() - self.checked_at < ttl
+
+    async def check(self) -> bool:
+        if self.fresh:
+            return self.up
+        async with self._lock:  # Concurrent callers share one check
+            if not self.fresh:
+                try:
+                    response = await backend.get("/", timeout=3.0)
+                    self.record(response.status_code < 500)
+                except httpx.HTTPError:
+                    self.record(False)
+        return self.up
+
+health = BackendHealth(HEALTH_TTL_SECONDS)
+
+@app.on_event("startup")
+async def open_backend_client():
+    global backend
+    backend = httpx.AsyncClient(
+        base_url=BACKEND_URL,
+        timeout=BACKEND_TIMEOUT,
+        limits=httpx.Limits(max_connections=BACKEND_POOL_SIZE, max_keepalive_connections=BACKEND_POOL_SIZE),
+    )
+
+@app.on_event("shutdown")
+async def close_backend_client():
+    await backend.aclose()
+
+def _busy_response():
+    return JSONResponse({"result": "ERROR: The AI proxy is busy. Please try again shortly."}, status_code=503,
+                        headers={"Retry-After": str(max(1, int(PROXY_QUEUE_TIMEOUT)))})
+
 # --- Forwarding Requests to the Backend Server ---
-def forward_request_to_backend(endpoint: str, data: dict):
+async def forward_request_to_backend(endpoint: str, data: dict):
     """Forwards a request from the WPS macro to the main backend server."""
     log_message(f"Forwarding request to backend endpoint: {endpoint}")
+    if not await health.check():
+        log_message(f"Backend is down; not forwarding {endpoint}")
+        return JSONResponse({"result": CONNECTION_ERROR_RESULT})
     try:
-        response = requests.post(f"{BACKEND_URL}{endpoint}", json=data, timeout=300)
+        await limit.acquire()
+    except ProxyBusy:
+        log_message(f"Proxy busy; refusing {endpoint} ({limit.waiting} waiting)")
+        return _busy_response()
+    try:
+        # Document text is compressed on the way to the backend (useful when it is remote)
+        response = await post_json_async(backend, endpoint, data)
+        health.record(True)
         response.raise_for_status()
         result = response.json().get("result", "")
         log_message("Successfully received response from AI backend.")
-        return jsonify({"result": result})
-    except requests.exceptions.ConnectionError as e:
-        log_message(f"ConnectionError calling {endpoint}: {e}")
-        return jsonify({"result": "ERROR: Could not connect to the AI backend server."})
+        return JSONResponse({"result": result})
+    except httpx.TransportError as e:
+        if isinstance(e, httpx.ConnectError):
+            health.record(False)
+        log_message(f"{type(e).__name__} calling {endpoint}: {e}")
+        return JSONResponse({"result": CONNECTION_ERROR_RESULT})
     except Exception as e:
         log_message(f"Unexpected Exception calling {endpoint}: {e}\n{traceback.format_exc()}")
-        return jsonify({"result": f"An unexpected error occurred: {e}"})
+        return JSONResponse({"result": f"An unexpected error occurred: {e}"})
+    finally:
+        limit.release()
+
+async def _json_body(request: Request) -> dict:
+    try:
+        data = await request.json()
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
 
-# --- Flask Routes (Endpoints for WPS Macro) ---
-@app.route('/run_prompt', methods=['POST'])
-def run_prompt():
-    data = request.json
+# --- Routes (Endpoints for WPS Macro) ---
+@app.post('/run_prompt')
+async def run_prompt(request: Request):
+    data = await _json_body(request)
     prompt = data.get("prompt", "")
-    return forward_request_to_backend("/process", {"prompt": prompt})
+    return await forward_request_to_backend("/process", {"prompt": prompt})
 
-@app.route('/analyze_document', methods=['POST'])
-def analyze_document():
-    data = request.json
+@app.post('/analyze_document')
+async def analyze_document(request: Request):
+    data = await _json_body(request)
     content = data.get("content", "")
     prompt = data.get("prompt", "")
-    return forward_request_to_backend("/analyze", {"content": content, "prompt": prompt})
+    return await forward_request_to_backend("/analyze", {"content": content, "prompt": prompt})
 
-@app.route('/summarize_document', methods=['POST'])
-def summarize_document():
-    data = request.json
+@app.post('/summarize_document')
+async def summarize_document(request: Request):
+    data = await _json_body(request)
     content = data.get("content", "")
-    return forward_request_to_backend("/summarize", {"content": content})
+    # The backend's request model requires a prompt, even though summaries ignore it
+    prompt = data.get("prompt", "Summarize the document content.")
+    return await forward_request_to_backend("/summarize", {"content": content, "prompt": prompt})
 
 # Add routes for other endpoints like memo, report, etc.
-@app.route('/create_report', methods=['POST'])
-def create_report():
-    data = request.json
+@app.post('/create_report')
+async def create_report(request: Request):
+    data = await _json_body(request)
     prompt = data.get("prompt", "")
-    return forward_request_to_backend("/create_report", {"prompt": prompt})
+    return await forward_request_to_backend("/create_report", {"prompt": prompt})
+
+@app.post('/create_memo')
+async def create_memo(request: Request):
+    return await forward_request_to_backend("/create_memo", await _json_body(request))
+
+@app.post('/create_cover_letter')
+async def create_cover_letter(request: Request):
+    return await forward_request_to_backend("/create_cover_letter", await _json_body(request))
+
+@app.post('/create_minutes')
+async def create_minutes(request: Request):
+    return await forward_request_to_backend("/create_minutes", await _json_body(request))
 
-@app.route('/create_memo', methods=['POST'])
-def create_memo():
-    data = request.json
-    return forward_request_to_backend("/create_memo", data)
+@app.get('/health')
+async def health_endpoint():
+    backend_up = await health.check()
+    return {
+        "proxy": "ok",
+        "backend": "up" if backend_up else "down",
+        "checked_seconds_ago": round(time.monotonic() - health.checked_at, 1),
+        "in_flight": limit.in_flight,
+        "waiting": limit.waiting,
+        "limit": limit.limit,
+    }
 
-@app.route('/create_cover_letter', methods=['POST'])
-def create_cover_letter():
-    data = request.json
-    return forward_request_to_backend("/create_cover_letter", data)
+# --- Streaming Pass-through ---
+class UpstreamResponse(StreamingResponse):
+    """
+    Streams an upstream response back as it arrives. The proxy slot is released and the pooled
+    upstream connection closed however sending ends: completed, client gone, or failed before
+    the body was first read (where a generator's finally would never run).
+    """
 
-@app.route('/create_minutes', methods=['POST'])
-def create_minutes():
-    data = request.json
-    return forward_request_to_backend("/create_minutes", data)
+    def __init__(self, upstream: httpx.Response):
+        # Raw bytes: a compressed body stays compressed, with its Content-Encoding
+        headers = {name: value for name, value in upstream.headers.items() if name.lower() not in HOP_BY_HOP_HEADERS}
+        super().__init__(upstream.aiter_raw(), status_code=upstream.status_code, headers=headers)
+        self.upstream = upstream
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            limit.release()
+            with anyio.CancelScope(shield=True):
+                await self.upstream.aclose()
+
+@app.api_route('/backend/{path:path}', methods=["GET", "POST"])
+async def backend_passthrough(path: str, request: Request):
+    """Forwards any backend endpoint as is; the response body is streamed back as it arrives."""
+    try:
+        await limit.acquire()
+    except ProxyBusy:
+        return _busy_response()
+    headers = [(name, value) for name, value in request.headers.items() if name.lower() not in HOP_BY_HOP_HEADERS]
+    try:
+        upstream = await backend.send(
+            backend.build_request(request.method, f"/{path}", params=request.query_params, headers=headers, content=request.stream()),
+            stream=True,
+        )
+    except httpx.TransportError as e:
+        limit.release()
+        if isinstance(e, httpx.ConnectError):
+            health.record(False)
+        log_message(f"{type(e).__name__} passing through /{path}: {e}")
+        return JSONResponse({"detail": CONNECTION_ERROR_RESULT}, status_code=502)
+    health.record(True)
+    return UpstreamResponse(upstream)
 
 # --- Server Start-up ---
 if __name__ == '__main__':
     log_message(f"Starting WPS AI client server on port {CLIENT_PORT}...")
     try:
-        app.run(host='127.0.0.1', port=CLIENT_PORT)
+        uvicorn.run(app, host='127.0.0.1', port=CLIENT_PORT)
     except Exception as e:
         log_message(f"Failed to start server: {e}")
-        sys.exit(1)
\ No newline at end of file
+        sys.exit(1)